@@ -35,6 +35,15 @@ def _parse_int(value):
         return None
 
 
+def _parse_float(value, default=None):
+    if value is None or value == "":
+        return default
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
 def _parse_int_list(value):
     if value is None or value == "":
         return []
@@ -53,13 +62,95 @@ openai_api_key = _get_env("OPENAI_API_KEY", "")
 telegram_bot_token = _get_env("TELEGRAM_BOT_TOKEN", "")
 
 FOLDER_NAME = _get_env("FOLDER_NAME", "GPT")
-TARGET_CHAT_ID = _get_env("TARGET_CHAT_ID", "")
+TARGET_CHAT_ID = _get_env("TARGET_CHAT_ID", "")  # служебный чат/канал для BROADCAST_MODE=copy/forward
 SUBSCRIBERS_FILE = _get_env("SUBSCRIBERS_FILE", "subscribers.json")
 
 DEBUG_USER_IDS = _parse_int_list(_get_env("DEBUG_USER_IDS"))
 _debug_mode_env = os.getenv("DEBUG_MODE")
 DEBUG_MODE = _to_bool(_debug_mode_env, default=bool(DEBUG_USER_IDS))
 
+# Проверка доступности подписчиков (run_daily.py --verify)
+VERIFY_TTL_HOURS = _parse_float(_get_env("VERIFY_TTL_HOURS"), 24.0)
+VERIFY_CONCURRENCY = _parse_int(_get_env("VERIFY_CONCURRENCY")) or 10
+VERIFY_RATE_PER_SEC = _parse_float(_get_env("VERIFY_RATE_PER_SEC"), 25.0)
+
+# После скольких рассылок подряд с "chat not found" подписчик уходит в карантин
+CHAT_NOT_FOUND_QUARANTINE = _parse_int(_get_env("CHAT_NOT_FOUND_QUARANTINE")) or 3
+
+# Бот подписчиков: polling (по умолчанию) или webhook
+BOT_MODE = (_get_env("BOT_MODE", "polling") or "polling").strip().lower()
+BOT_CONCURRENT_UPDATES = _parse_int(_get_env("BOT_CONCURRENT_UPDATES")) or 8
+WEBHOOK_URL = _get_env("WEBHOOK_URL", "")  # публичный адрес сервиса; пусто — setWebhook не вызывается
+WEBHOOK_PATH = _get_env("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = _get_env("WEBHOOK_SECRET", "")
+WEBHOOK_LISTEN = _get_env("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = _parse_int(_get_env("PORT", _get_env("WEBHOOK_PORT"))) or 8080
+
+# Расписание сервиса scripts/service.py (UTC): "HH:MM" — ежедневно, "sun HH:MM" — еженедельно, пусто — выключено
+SCHEDULE_DAILY = _get_env("SCHEDULE_DAILY", "09:00")
+SCHEDULE_WEEKLY = _get_env("SCHEDULE_WEEKLY", "")
+SCHEDULE_SPORT = _get_env("SCHEDULE_SPORT", "")
+SERVICE_SHUTDOWN_TIMEOUT = _parse_float(_get_env("SERVICE_SHUTDOWN_TIMEOUT"), 20.0)
+
+# Реестр дайджестов (src/digests.py); без файла используются FOLDER_NAME и SCHEDULE_* выше
+DIGESTS_FILE = _get_env("DIGESTS_FILE", "digests.json")
+DIGEST_CONCURRENCY = _parse_int(_get_env("DIGEST_CONCURRENCY")) or 2
+# Граница дня для сводок ("вчера", неделя, /today): имя IANA или смещение (+3)
+DIGEST_TIMEZONE = _get_env("DIGEST_TIMEZONE", "UTC")
+# Доставка: immediate — сразу после сборки; queue — через очередь с учётом часа подписчика (src/delivery_queue.py)
+DELIVERY_MODE = (_get_env("DELIVERY_MODE", "immediate") or "immediate").strip().lower()
+DELIVERY_RATE_PER_SEC = _parse_float(_get_env("DELIVERY_RATE_PER_SEC"), 25.0)
+DELIVERY_SPREAD_MINUTES = _parse_int(_get_env("DELIVERY_SPREAD_MINUTES")) or 60
+DELIVERY_MAX_ATTEMPTS = _parse_int(_get_env("DELIVERY_MAX_ATTEMPTS")) or 3
+# send — текст каждому; copy/forward — сводка публикуется один раз в TARGET_CHAT_ID и рассылается copyMessages/forwardMessages
+BROADCAST_MODE = (_get_env("BROADCAST_MODE", "send") or "send").strip().lower()
+# Маршрутизация новостей по разделам на CPU и отдельный запрос к модели на раздел (src/sections.py);
+# включается, когда новостей не меньше SECTION_MIN_ITEMS
+SECTION_ROUTING = _to_bool(_get_env("SECTION_ROUTING"), default=False)
+SECTION_MIN_ITEMS = _parse_int(_get_env("SECTION_MIN_ITEMS")) or 40
+SECTION_CONCURRENCY = _parse_int(_get_env("SECTION_CONCURRENCY")) or 3
+# Индекс историй (src/story_index.py, нужен numpy): почти дословные повторы внутри дня и с прошлых дней убираются
+STORY_INDEX = _to_bool(_get_env("STORY_INDEX"), default=False)
+STORY_SIMILARITY = _parse_float(_get_env("STORY_SIMILARITY"), 0.85)
+STORY_INDEX_DAYS = _parse_int(_get_env("STORY_INDEX_DAYS")) or 14
+# Статистика каналов (src/channel_stats.py): при CHANNEL_ADAPTIVE каналы без процитированных новостей
+# за последние CHANNEL_STATS_WINDOW запусков читаются не чаще раза в CHANNEL_LOW_YIELD_DAYS дней
+CHANNEL_ADAPTIVE = _to_bool(_get_env("CHANNEL_ADAPTIVE"), default=False)
+CHANNEL_STATS_WINDOW = _parse_int(_get_env("CHANNEL_STATS_WINDOW")) or 14
+CHANNEL_MIN_RUNS = _parse_int(_get_env("CHANNEL_MIN_RUNS")) or 5
+CHANNEL_LOW_YIELD_DAYS = _parse_int(_get_env("CHANNEL_LOW_YIELD_DAYS")) or 3
+# Проверка ссылок сводки по собранным сообщениям: исправление почти верных, удаление выдуманных (src/citations.py)
+CITATION_CHECK = _to_bool(_get_env("CITATION_CHECK"), default=True)
+# Собранные новости хранятся в буфере на диске (src/spool.py), в памяти — только смещения
+NEWS_SPOOL = _to_bool(_get_env("NEWS_SPOOL"), default=True)
+# Рассылка --send как задание с контрольными точками и повторами (src/jobs.py)
+PIPELINE_JOBS = _to_bool(_get_env("PIPELINE_JOBS"), default=True)
+JOB_MAX_ATTEMPTS = _parse_int(_get_env("JOB_MAX_ATTEMPTS")) or 3
+JOB_RETRY_SECONDS = _parse_float(_get_env("JOB_RETRY_SECONDS"), 30.0)
+# Задания старше стольких дней удаляются вместе с контрольными точками
+JOB_RETENTION_DAYS = _parse_int(_get_env("JOB_RETENTION_DAYS")) or 14
+# Бэкенды суммаризации по приоритету: openai, local (OpenAI-совместимый сервер), extractive (без модели) — src/llm.py
+LLM_BACKENDS = _get_env("LLM_BACKENDS", "openai")
+LLM_MAP_BACKENDS = _get_env("LLM_MAP_BACKENDS", "")  # бэкенды для запросов отдельных разделов (SECTION_ROUTING)
+OPENAI_MODEL = _get_env("OPENAI_MODEL", "gpt-4.1-mini")
+OPENAI_CONCURRENCY = _parse_int(_get_env("OPENAI_CONCURRENCY")) or 4
+LOCAL_LLM_URL = _get_env("LOCAL_LLM_URL", "")  # например, http://localhost:8080/v1
+LOCAL_LLM_MODEL = _get_env("LOCAL_LLM_MODEL", "local")
+LOCAL_LLM_API_KEY = _get_env("LOCAL_LLM_API_KEY", "")
+LOCAL_LLM_CONCURRENCY = _parse_int(_get_env("LOCAL_LLM_CONCURRENCY")) or 1
+LLM_TIMEOUT_SECONDS = _parse_float(_get_env("LLM_TIMEOUT_SECONDS"), 120.0)
+LLM_SLOW_SECONDS = _parse_float(_get_env("LLM_SLOW_SECONDS"), 60.0)
+LLM_COOLDOWN_SECONDS = _parse_float(_get_env("LLM_COOLDOWN_SECONDS"), 300.0)
+# Длинные новости сокращаются до ключевых предложений перед суммаризацией (src/compress.py)
+EXTRACTIVE_COMPRESS = _to_bool(_get_env("EXTRACTIVE_COMPRESS"), default=False)
+COMPRESS_TARGET_CHARS = _parse_int(_get_env("COMPRESS_TARGET_CHARS")) or 600
+# Версия шаблонов промптов: src/prompt_templates/<имя>.<версия>.txt (src/prompts.py)
+PROMPT_VERSION = _get_env("PROMPT_VERSION", "v1")
+# /today в боте пересобирается не чаще этого интервала
+ONDEMAND_TODAY_TTL_MINUTES = _parse_int(_get_env("ONDEMAND_TODAY_TTL_MINUTES")) or 60
+# Сколько плановый запуск ждёт занятый pipeline.lock (сборку по запросу, другой запуск), прежде чем сдаться
+PIPELINE_LOCK_WAIT_MINUTES = _parse_int(_get_env("PIPELINE_LOCK_WAIT_MINUTES")) or 60
+
 
 # Optional local overrides (keep secrets out of git)
 try:
@@ -1,7 +1,6 @@
+import argparse
 import asyncio
-import json
 import sys
-from datetime import datetime
 from pathlib import Path
 
 from telegram import Bot
@@ -12,64 +11,35 @@ if str(ROOT_DIR) not in sys.path:
 
 # Локальные настройки/секреты
 import config  # должен содержать telegram_bot_token
-from src.paths import DATA_DIR, resolve_data_path
+from src.backfill import (
+    BACKFILL_OFFSET_FILE, load_backfill_offset, save_backfill_offset, store_update_senders,
+)
 
 
-DEFAULT_SUBSCRIBERS_FILE = DATA_DIR / "subscribers.json"
-SUBSCRIBERS_FILE = resolve_data_path(getattr(config, "SUBSCRIBERS_FILE", DEFAULT_SUBSCRIBERS_FILE))
-
-
-def _load_subscribers():
+async def backfill_from_updates(reset=False):
     """
-    Загружает список подписчиков в формате {"subscribers": [ {...} ]}.
-    Возвращает список словарей подписчиков.
-    """
-    if not SUBSCRIBERS_FILE.exists():
-        return []
-    try:
-        with open(SUBSCRIBERS_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            return data.get("subscribers", []) or []
-    except Exception as e:
-        print(f"[ERROR] Ошибка чтения {SUBSCRIBERS_FILE}: {e}")
-        return []
-
-
-def _save_subscribers(subscribers_list):
-    """Сохраняет список подписчиков в SUBSCRIBERS_FILE в ожидаемом формате."""
-    try:
-        with open(SUBSCRIBERS_FILE, "w", encoding="utf-8") as f:
-            json.dump({"subscribers": subscribers_list}, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"[ERROR] Ошибка записи {SUBSCRIBERS_FILE}: {e}")
-
-
-def _now_str():
-    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-
-async def backfill_from_updates():
-    """
-    Одноразовый сбор пользователей, которые писали боту личные текстовые сообщения,
+    Сбор пользователей, которые писали боту личные текстовые сообщения,
     из очереди Bot API (getUpdates), с добавлением их в subscribers.json.
 
-    Важно: Перед запуском нужно остановить основной процесс бота (polling/webhook),
-    чтобы не конфликтовать за очередь апдейтов.
+    Апдейты обрабатываются постранично: после каждой страницы новые пользователи
+    дописываются в subscribers.json, а offset сохраняется в backfill_updates.offset.json,
+    поэтому прерванный запуск продолжается с места остановки.
+
+    Важно: скрипт конкурирует за getUpdates с основным ботом (polling). Чтобы не
+    останавливать бота, запустите его с флагом --backfill (scripts/get_users.py --backfill):
+    тот же отбор будет применяться к апдейтам, которые получает бот.
     """
     bot = Bot(token=config.telegram_bot_token)
 
-    # Загружаем существующих подписчиков для дедупликации
-    existing = _load_subscribers()
-    existing_ids = {int(item.get("user_id")) for item in existing if "user_id" in item}
-
-    # Сюда будем добавлять новые записи
-    new_records = []
+    offset = None if reset else load_backfill_offset()
+    if offset is not None:
+        print(f"[LOG] Продолжаю с сохранённого offset={offset} ({BACKFILL_OFFSET_FILE})")
 
-    offset = None
     total_updates = 0
     total_candidates = 0
+    total_added = 0
 
-    print("[LOG] Начинаю одноразовый сбор отправителей приватных текстовых сообщений...")
+    print("[LOG] Начинаю сбор отправителей приватных текстовых сообщений...")
     while True:
         try:
             updates = await bot.get_updates(
@@ -85,61 +55,29 @@ async def backfill_from_updates():
         if not updates:
             break
 
-        for u in updates:
-            total_updates += 1
-            offset = u.update_id + 1
-
-            msg = getattr(u, "message", None)
-            if not msg:
-                continue
-            if not getattr(msg, "text", None):
-                # Учитываем только текстовые сообщения
-                continue
-            chat = getattr(msg, "chat", None)
-            if not chat or getattr(chat, "type", None) != "private":
-                # Только личные диалоги
-                continue
-
-            user = getattr(msg, "from_user", None)
-            if not user:
-                continue
-
-            total_candidates += 1
-            try:
-                uid = int(user.id)
-            except Exception:
-                continue
-
-            if uid in existing_ids:
-                continue
-
-            record = {
-                "user_id": uid,
-                "username": user.username or "-",
-                "first_name": user.first_name or "-",
-                "last_name": user.last_name or "-",
-                "added_at": _now_str(),
-            }
-            new_records.append(record)
-            existing_ids.add(uid)
-
-    if new_records:
-        # Сортируем итоговый список по user_id для консистентности
-        merged = existing + new_records
-        merged_sorted = sorted(merged, key=lambda x: int(x.get("user_id", 0)))
-        _save_subscribers(merged_sorted)
+        candidates, added = store_update_senders(updates)
+        offset = updates[-1].update_id + 1
+        save_backfill_offset(offset)
+
+        total_updates += len(updates)
+        total_candidates += candidates
+        total_added += added
+        print(f"[LOG] Страница: апдейтов {len(updates)}, кандидатов {candidates}, добавлено {added}, offset={offset}")
 
     print(
         f"[LOG] Обработано апдейтов: {total_updates}. Кандидатов найдено: {total_candidates}. "
-        f"Новых добавлено: {len(new_records)}. Итоговый размер списка: {len(existing_ids)}."
+        f"Новых добавлено: {total_added}."
     )
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сбор подписчиков из очереди getUpdates")
+    parser.add_argument('--reset', action='store_true', help='Игнорировать сохранённый offset')
+    args = parser.parse_args()
     # Напоминание в консоль
     print(
-        "[INFO] Перед запуском убедитесь, что основной бот остановлен (polling/webhook),\n"
-        "       чтобы избежать конкуренции за getUpdates.\n"
-        "       Запуск: python scripts/backfill_users_once.py\n"
+        "[INFO] Скрипт читает getUpdates и конкурирует с основным ботом в режиме polling.\n"
+        "       Без остановки бота используйте: python scripts/get_users.py --backfill\n"
+        "       Запуск: python scripts/backfill_users_once.py [--reset]\n"
     )
-    asyncio.run(backfill_from_updates())
+    asyncio.run(backfill_from_updates(reset=args.reset))
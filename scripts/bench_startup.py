@@ -0,0 +1,87 @@
+"""
+Замер времени старта CLI-команд по данным `python -X importtime`.
+
+Для каждой команды запускается отдельный интерпретатор с -X importtime; суммарное
+время импортов считается по колонке self, дополнительно выводятся самые тяжёлые
+модули верхнего уровня (по cumulative) и общее время выполнения команды.
+
+Пример:
+    python scripts/bench_startup.py
+    python scripts/bench_startup.py --repeat 5 --top 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+
+# Команды, которые не ходят в сеть: разбор аргументов и импорты точек входа
+DEFAULT_COMMANDS = [
+    ["scripts/run_daily.py", "--help"],
+    ["scripts/get_users.py", "--help"],
+    ["scripts/service.py", "--help"],
+    ["-c", "import src.pipeline"],
+    ["-c", "import src.news_bot_part"],
+]
+
+
+def parse_importtime(stderr):
+    """Возвращает (сумма self в мкс, [(cumulative, модуль)] для модулей верхнего уровня)."""
+    total_self = 0
+    top_level = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            total_self += int(self_us)
+        except ValueError:
+            continue
+        # Модули верхнего уровня выводятся без отступа
+        if not name.startswith("  ", 1):
+            top_level.append((int(cumulative_us), name.strip()))
+    return total_self, top_level
+
+
+def bench(command, repeat):
+    import_times = []
+    wall_times = []
+    top_level = []
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", *command],
+            cwd=ROOT_DIR, env=env, capture_output=True, text=True,
+        )
+        wall_times.append(time.perf_counter() - started)
+        total_self, top_level = parse_importtime(proc.stderr)
+        import_times.append(total_self)
+        if proc.returncode != 0:
+            tail = proc.stderr.strip().splitlines()[-1:] or [""]
+            print(f"[WARN] {' '.join(command)}: код выхода {proc.returncode} ({tail[0]})")
+    return statistics.median(import_times), statistics.median(wall_times), top_level
+
+
+def main():
+    p = argparse.ArgumentParser(description="Замер времени старта команд (-X importtime)")
+    p.add_argument('--repeat', type=int, default=3, help='Повторов на команду (берётся медиана)')
+    p.add_argument('--top', type=int, default=5, help='Сколько самых тяжёлых импортов показать')
+    p.add_argument('command', nargs=argparse.REMAINDER, help='Своя команда вместо набора по умолчанию')
+    args = p.parse_args()
+
+    commands = [args.command] if args.command else DEFAULT_COMMANDS
+    for command in commands:
+        import_us, wall_s, top_level = bench(command, max(1, args.repeat))
+        print(f"{' '.join(command)}")
+        print(f"  импорты: {import_us / 1000:.1f} мс, всего: {wall_s * 1000:.1f} мс")
+        for cumulative_us, name in sorted(top_level, reverse=True)[:args.top]:
+            print(f"    {cumulative_us / 1000:8.1f} мс  {name}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""
+Отчёт по каналам из channel_stats.json: объём, доля текста/медиа, время чтения, сколько
+новостей канала попало в сводки и статус (ok / noisy / dead / new) — для чистки channels.json.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from src.channel_stats import channel_report, load_channel_stats
+from src.get_channels import load_channels_from_json
+from src.paths import resolve_data_path
+
+COLUMNS = ("username", "status", "runs", "messages", "text_ratio", "media_ratio", "latency", "items", "cited",
+           "yield", "errors", "skipped")
+
+
+def main():
+    p = argparse.ArgumentParser(description="Статистика и выход каналов по последним запускам")
+    p.add_argument('--channels-file', help='Только каналы из этого json (по умолчанию — все, по которым есть статистика)')
+    p.add_argument('--status', action='append', choices=['ok', 'noisy', 'dead', 'new'], help='Показать только этот статус')
+    p.add_argument('--json', action='store_true', help='Вывести JSON вместо таблицы')
+    args = p.parse_args()
+
+    stats = load_channel_stats()
+    usernames = None
+    if args.channels_file:
+        channels = load_channels_from_json(path=resolve_data_path(args.channels_file))
+        usernames = [info["username"].lower() for info in channels if info.get("username")]
+    rows = channel_report(stats, usernames)
+    if args.status:
+        rows = [row for row in rows if row["status"] in args.status]
+    # Худшие каналы — наверху: их в первую очередь стоит убрать из папки
+    rows.sort(key=lambda row: (row["status"] == "new", row["yield"], -row["messages"]))
+
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+        return
+    widths = {col: max(len(col), *(len(str(row[col])) for row in rows)) if rows else len(col) for col in COLUMNS}
+    print("  ".join(col.ljust(widths[col]) for col in COLUMNS))
+    for row in rows:
+        print("  ".join(str(row[col]).ljust(widths[col]) for col in COLUMNS))
+    if not rows:
+        print("[LOG] Статистики пока нет — она появляется после ежедневных запусков run_daily.py --send")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""
+Разовая обработка очереди доставки (DELIVERY_MODE=queue) — для запуска из cron,
+если не используется scripts/service.py. Отправляет все наступившие доставки и завершается.
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from src.delivery_queue import deliver_due
+from src.pipeline import create_bot
+
+
+async def drain(limit):
+    bot = create_bot()
+    async with bot:
+        total = {}
+        while True:
+            counts = await deliver_due(bot, limit=limit)
+            if not counts:
+                break
+            for key, value in counts.items():
+                total[key] = total.get(key, 0) + value
+    print(f"[LOG] Доставлено из очереди: {total}")
+
+
+def main():
+    p = argparse.ArgumentParser(description="Отправить наступившие доставки из очереди")
+    p.add_argument('--batch', type=int, default=500, help='Сколько доставок забирать за раз')
+    args = p.parse_args()
+    asyncio.run(drain(args.batch))
+
+
+if __name__ == '__main__':
+    main()
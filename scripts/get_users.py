@@ -1,13 +1,19 @@
+# telegram импортируется лениво (аннотации не вычисляются): повторный запуск при уже
+# работающем боте завершается по bot.lock, не загружая python-telegram-bot.
+from __future__ import annotations
+
+import argparse
+import asyncio
 import json
 import logging
 import sys
 from datetime import datetime
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-from telegram import Update
-from telegram.ext import (
-    ApplicationBuilder, CommandHandler, MessageHandler, filters, ContextTypes, ConversationHandler
-)
+if TYPE_CHECKING:
+    from telegram import Update
+    from telegram.ext import ContextTypes
 
 ROOT_DIR = Path(__file__).resolve().parents[1]
 if str(ROOT_DIR) not in sys.path:
@@ -15,7 +21,17 @@ if str(ROOT_DIR) not in sys.path:
 
 
 import config
+from src.archive import get_summary, latest_summary
+from src.backfill import store_update_senders
+from src.digests import load_digests
+from src.locks import BOT_LOCK_FILE, LockBusy, file_lock
+from src.ondemand import KIND_TODAY, KIND_WEEK, KIND_YESTERDAY, OnDemandBuilder, find_summary
 from src.paths import DATA_DIR, resolve_data_path
+from src.subscribers import (
+    STATUS_BLOCKED, STATUS_DEACTIVATED, STATUS_QUARANTINED, load_subscriber_state, reactivate_subscriber,
+    set_delivery_preference,
+)
+from src.timezones import parse_timezone
 
 DEFAULT_SUBSCRIBERS_FILE = DATA_DIR / "subscribers.json"
 SUBSCRIBERS_FILE = resolve_data_path(getattr(config, 'SUBSCRIBERS_FILE', DEFAULT_SUBSCRIBERS_FILE))
@@ -110,9 +126,16 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     log_user_message(user, "/start")
     was_added = save_subscriber(user)
-    await update.message.reply_text(
-        "Привет! Ты добавлен в рассылку новостей." if was_added else "Ты уже в списке рассылки."
-    )
+    # Статус в subscriber_state.json переживает /stop, поэтому снимаем его и при повторной подписке
+    reactivated = reactivate_subscriber(user.id)
+    if reactivated:
+        logger.info(f"Подписчик {user.id} снова активен")
+    if was_added:
+        await update.message.reply_text("Привет! Ты добавлен в рассылку новостей.")
+    elif reactivated:
+        await update.message.reply_text("Рассылка возобновлена.")
+    else:
+        await update.message.reply_text("Ты уже в списке рассылки.")
 
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -125,7 +148,13 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/stop — отписаться\n"
         "/recommend_channel — предложить канал для рассылки\n"
         "/channels — список каналов для агрегации\n"
-        "/status — узнать статус подписки"
+        "/status — узнать статус подписки\n"
+        "/last — последняя сводка\n"
+        "/digest YYYY-MM-DD — сводка за указанный день\n"
+        "/today — сводка за сегодня (пока день не закончился)\n"
+        "/yesterday — сводка за вчера\n"
+        "/week — сводка за неделю\n"
+        "/time HH:MM [пояс] — удобное время получения рассылки (например, /time 08:30 Europe/Moscow или /time 9 +3)"
     )
 
 
@@ -133,8 +162,13 @@ async def echo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     log_user_message(user, update.message.text.strip())
     was_added = save_subscriber(user)
+    reactivated = reactivate_subscriber(user.id)
+    if reactivated:
+        logger.info(f"Подписчик {user.id} снова активен")
     if was_added:
         await update.message.reply_text("Спасибо за сообщение! Ты подписан на рассылку.")
+    elif reactivated:
+        await update.message.reply_text("Рассылка возобновлена.")
     else:
         await update.message.reply_text("Ты уже подписан.")
 
@@ -171,6 +205,8 @@ async def recommend_channel_receive(update: Update, context: ContextTypes.DEFAUL
     with open(RECOMMENDATIONS_FILE, "a", encoding="utf-8") as f:
         f.write(rec_info)
     await update.message.reply_text("Спасибо! Ваша рекомендация отправлена администратору.")
+    from telegram.ext import ConversationHandler
+
     return ConversationHandler.END
 
 
@@ -178,6 +214,8 @@ async def recommend_channel_cancel(update: Update, context: ContextTypes.DEFAULT
     user = update.effective_user
     log_user_message(user, "/cancel")
     await update.message.reply_text("Рекомендация отменена.")
+    from telegram.ext import ConversationHandler
+
     return ConversationHandler.END
 
 
@@ -200,17 +238,151 @@ async def channels_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 # --- /status: статус подписки ---
+# Почему подписчик исключён из рассылки (статус в subscriber_state.json, см. src.subscribers)
+_PAUSED_STATUS_TEXT = {
+    STATUS_BLOCKED: "бот был заблокирован",
+    STATUS_DEACTIVATED: "аккаунт был удалён",
+    STATUS_QUARANTINED: "сообщения несколько раз не доходили",
+}
+
+
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     log_user_message(user, "/status")
     subscribers = load_subscribers()
     is_subscribed = any('user_id' in sub and sub['user_id'] == user.id for sub in subscribers)
-    if is_subscribed:
+    status = (load_subscriber_state().get(str(user.id)) or {}).get("status")
+    if is_subscribed and status in _PAUSED_STATUS_TEXT:
+        await update.message.reply_text(
+            f"Ты в списке рассылки, но она приостановлена: {_PAUSED_STATUS_TEXT[status]}. Напиши /start, чтобы возобновить."
+        )
+    elif is_subscribed:
         await update.message.reply_text("Ты подписан на рассылку ✅")
     else:
         await update.message.reply_text("Ты не подписан на рассылку.")
 
 
+# --- /last и /digest YYYY-MM-DD: готовые сводки из архива (без повторной генерации) ---
+def _digest_name_arg(args):
+    """Имя дайджеста из аргументов команды или первый дайджест реестра."""
+    registry = load_digests()
+    if args and args[0] in registry:
+        return args[0]
+    return next(iter(registry), None)
+
+
+async def _reply_summary(update: Update, record):
+    from src.news_bot_part import split_message
+
+    chunks = split_message(record["text"])
+    header = f"Сводка за {record['date']}" + (" (неделя)" if record.get("period") == "week" else "")
+    for idx, chunk in enumerate(chunks):
+        await update.message.reply_text(f"{header}\n\n{chunk}" if idx == 0 else chunk)
+
+
+async def last_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    log_user_message(user, update.message.text.strip())
+    name = _digest_name_arg(context.args)
+    record = latest_summary(name) if name else None
+    if record is None:
+        await update.message.reply_text("Сводок пока нет.")
+        return
+    await _reply_summary(update, record)
+
+
+async def digest_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    log_user_message(user, update.message.text.strip())
+    if not context.args:
+        await update.message.reply_text("Укажи дату: /digest YYYY-MM-DD")
+        return
+    try:
+        day = datetime.strptime(context.args[0], "%Y-%m-%d").date()
+    except ValueError:
+        await update.message.reply_text("Неверный формат даты. Используй /digest YYYY-MM-DD")
+        return
+    name = _digest_name_arg(context.args[1:])
+    record = get_summary(name, "day", day) if name else None
+    if not (record and record.get("text")):
+        await update.message.reply_text(f"Сводки за {day.isoformat()} нет.")
+        return
+    await _reply_summary(update, record)
+
+
+# --- /today, /yesterday, /week: сводка из архива или одна фоновая сборка на окно ---
+async def _on_demand(update: Update, context: ContextTypes.DEFAULT_TYPE, kind):
+    user = update.effective_user
+    log_user_message(user, update.message.text.strip())
+    name = _digest_name_arg(context.args)
+    if name is None:
+        await update.message.reply_text("Сводок пока нет.")
+        return
+    record, fresh = find_summary(kind, name)
+    if record is not None:
+        await _reply_summary(update, record)
+    if fresh:
+        return
+    builder = context.application.bot_data.get("ondemand")
+    if builder is None:
+        if record is None:
+            await update.message.reply_text("Сводки за этот период пока нет.")
+        return
+    if builder.request(context.bot, kind, load_digests()[name], update.effective_chat.id):
+        await update.message.reply_text("Собираю свежую сводку — пришлю, когда будет готова.")
+    elif record is None:
+        await update.message.reply_text("Новостей за этот период пока нет.")
+
+
+async def today_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await _on_demand(update, context, KIND_TODAY)
+
+
+async def yesterday_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await _on_demand(update, context, KIND_YESTERDAY)
+
+
+async def week_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await _on_demand(update, context, KIND_WEEK)
+
+
+# --- /time: предпочтительное время доставки (используется при DELIVERY_MODE=queue) ---
+async def time_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    log_user_message(user, update.message.text.strip())
+    args = context.args or []
+    if not args:
+        await update.message.reply_text(
+            "Укажи время: /time 08:30 Europe/Moscow (или /time 9 +3). /time off — как у всех."
+        )
+        return
+    if args[0].lower() == "off":
+        set_delivery_preference(user.id, None)
+        await update.message.reply_text("Время доставки сброшено.")
+        return
+    hours, _, minutes = args[0].partition(":")
+    tz = args[1] if len(args) > 1 else None
+    try:
+        hours, minutes = int(hours), int(minutes or 0)
+        if not (0 <= hours < 24 and 0 <= minutes < 60):
+            raise ValueError(args[0])
+        if tz:
+            parse_timezone(tz)
+    except ValueError:
+        await update.message.reply_text("Не понял время или пояс. Пример: /time 08:30 Europe/Moscow")
+        return
+    delivery_time = f"{hours:02d}:{minutes:02d}"
+    set_delivery_preference(user.id, delivery_time, tz)
+    await update.message.reply_text(f"Буду присылать сводку около {delivery_time} ({tz or config.DIGEST_TIMEZONE}).")
+
+
+# --- Режим --backfill: добавляет отправителей всех личных текстовых сообщений ---
+async def backfill_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    _, added = store_update_senders([update])
+    if added:
+        logger.info(f"[BACKFILL] Добавлен подписчик из апдейта {update.update_id}")
+
+
 async def unknown_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     text = update.message.text.strip() if update.message and update.message.text else "/unknown"
@@ -218,16 +390,24 @@ async def unknown_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("Неизвестная команда. Напиши /help, чтобы увидеть список команд.")
 
 
-def main():
-    token = (config.telegram_bot_token or "").strip()
-    if not token or ":" not in token:
-        logger.error(
-            "Не задан TELEGRAM_BOT_TOKEN. "
-            "Установите переменную окружения TELEGRAM_BOT_TOKEN или добавьте токен в config.py."
-        )
-        sys.exit(1)
+def build_arg_parser():
+    p = argparse.ArgumentParser(description="Бот подписчиков")
+    p.add_argument('--backfill', action='store_true',
+                   help='Добавлять в подписчики отправителей всех личных текстовых сообщений '
+                        '(замена scripts/backfill_users_once.py без остановки бота)')
+    p.add_argument('--webhook', action='store_true',
+                   help='Принимать апдейты через webhook (HTTP-сервер) вместо long polling')
+    return p
+
 
-    app = ApplicationBuilder().token(token).build()
+def register_handlers(app, backfill=False):
+    from telegram import Update
+    from telegram.ext import CommandHandler, ConversationHandler, MessageHandler, TypeHandler, filters
+
+    if backfill:
+        # Группа -1 обрабатывается раньше основных хендлеров и не мешает им
+        app.add_handler(TypeHandler(Update, backfill_update), group=-1)
+        logger.info("Режим backfill включен")
 
     # Основные команды
     app.add_handler(CommandHandler("start", start))
@@ -235,6 +415,12 @@ def main():
     app.add_handler(CommandHandler("stop", stop_command))
     app.add_handler(CommandHandler("channels", channels_command))
     app.add_handler(CommandHandler("status", status_command))
+    app.add_handler(CommandHandler("last", last_command))
+    app.add_handler(CommandHandler("digest", digest_command))
+    app.add_handler(CommandHandler("today", today_command))
+    app.add_handler(CommandHandler("yesterday", yesterday_command))
+    app.add_handler(CommandHandler("week", week_command))
+    app.add_handler(CommandHandler("time", time_command))
     app.add_handler(MessageHandler(filters.COMMAND, unknown_command))
     app.add_handler(MessageHandler(filters.TEXT & (~filters.COMMAND), echo))
 
@@ -250,6 +436,55 @@ def main():
     )
     app.add_handler(conv_handler)
 
+
+def build_application(token, backfill=False, webhook=False, get_client=None):
+    """get_client — async-функция с Telethon-клиентом для сборки сводок по запросу (см. src.ondemand)."""
+    from telegram.ext import ApplicationBuilder
+
+    builder = ApplicationBuilder().token(token).concurrent_updates(config.BOT_CONCURRENT_UPDATES)
+    if webhook:
+        # Апдейты приходят через собственный HTTP-сервер (src/webhook.py), Updater не нужен
+        builder = builder.updater(None)
+    app = builder.build()
+    app.bot_data["ondemand"] = OnDemandBuilder(get_client)
+    register_handlers(app, backfill=backfill)
+    return app
+
+
+def main():
+    args = build_arg_parser().parse_args()
+    try:
+        with file_lock(BOT_LOCK_FILE):
+            run_bot(args)
+    except LockBusy:
+        logger.info("Бот уже запущен — выходим")
+
+
+def run_bot(args):
+    token = (config.telegram_bot_token or "").strip()
+    if not token or ":" not in token:
+        logger.error(
+            "Не задан TELEGRAM_BOT_TOKEN. "
+            "Установите переменную окружения TELEGRAM_BOT_TOKEN или добавьте токен в config.py."
+        )
+        sys.exit(1)
+
+    webhook = args.webhook or config.BOT_MODE == "webhook"
+    app = build_application(token, backfill=args.backfill, webhook=webhook)
+
+    if webhook:
+        from src.webhook import run_webhook
+
+        asyncio.run(run_webhook(
+            app,
+            listen=config.WEBHOOK_LISTEN,
+            port=config.WEBHOOK_PORT,
+            path=config.WEBHOOK_PATH,
+            secret_token=config.WEBHOOK_SECRET,
+            webhook_url=config.WEBHOOK_URL,
+        ))
+        return
+
     logger.info("Бот запущен, ожидает сообщений...")
     app.run_polling()
 
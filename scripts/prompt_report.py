@@ -0,0 +1,48 @@
+"""
+Отчёт по шаблонам промптов (src/prompt_templates): размер и число токенов каждого файла
+и неизменных частей системного промпта — хватает ли их для кэша префикса у провайдера.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+import config
+from src.prompts import CACHE_MIN_TOKENS, MODES, PROMPT_TYPES, count_tokens, stable_prompt, template_report
+
+
+def main():
+    p = argparse.ArgumentParser(description="Размер шаблонов промптов в токенах")
+    p.add_argument('--version', help='Версия шаблонов (по умолчанию PROMPT_VERSION)')
+    p.add_argument('--json', action='store_true', help='Вывести JSON вместо таблицы')
+    args = p.parse_args()
+    if args.version:
+        config.PROMPT_VERSION = args.version
+
+    rows = template_report()
+    prefixes = []
+    for prompt_type in PROMPT_TYPES:
+        for mode in (None,) + MODES:
+            tokens = count_tokens(stable_prompt(prompt_type, mode, "…" if mode == "section" else None))
+            prefixes.append({
+                "prefix": "/".join(filter(None, (prompt_type, mode))), "tokens": tokens,
+                "cacheable": tokens >= CACHE_MIN_TOKENS,
+            })
+
+    if args.json:
+        print(json.dumps({"templates": rows, "prefixes": prefixes}, ensure_ascii=False, indent=2))
+        return
+    print(f"Шаблоны {config.PROMPT_VERSION}:")
+    for row in rows:
+        print(f"  {row['name']:<10} {row['chars']:>6} симв.  {row['tokens']:>5} ток.")
+    print(f"Неизменные части системного промпта (кэш префикса — от {CACHE_MIN_TOKENS} токенов):")
+    for row in prefixes:
+        print(f"  {row['prefix']:<16} {row['tokens']:>5} ток.  {'да' if row['cacheable'] else 'нет'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Отправляет записанные апдейты Telegram на локальный webhook бота (scripts/get_users.py --webhook).
+
+Файл может содержать один апдейт (JSON-объект), список апдейтов или JSON Lines.
+Пример:
+    python scripts/replay_updates.py updates.json --url http://127.0.0.1:8080/telegram
+"""
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+import httpx
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+import config
+from src.webhook import SECRET_HEADER
+
+
+def _load_updates(path: Path):
+    raw = path.read_text(encoding='utf-8').strip()
+    if not raw:
+        return []
+    try:
+        data = json.loads(raw)
+    except json.JSONDecodeError:
+        return [json.loads(line) for line in raw.splitlines() if line.strip()]
+    return data if isinstance(data, list) else [data]
+
+
+async def replay(path: Path, url: str, secret: str, concurrency: int):
+    updates = _load_updates(path)
+    headers = {SECRET_HEADER: secret} if secret else {}
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    async with httpx.AsyncClient(timeout=10) as client:
+        async def post(update):
+            async with semaphore:
+                resp = await client.post(url, json=update, headers=headers)
+                print(f"[LOG] update_id={update.get('update_id')} -> {resp.status_code} {resp.text}")
+        await asyncio.gather(*(post(u) for u in updates))
+    print(f"[LOG] Отправлено апдейтов: {len(updates)}")
+
+
+def main():
+    default_url = f"http://127.0.0.1:{config.WEBHOOK_PORT}{config.WEBHOOK_PATH}"
+    p = argparse.ArgumentParser(description="Воспроизведение записанных апдейтов на локальный webhook")
+    p.add_argument('file', help='JSON/JSONL файл с апдейтами')
+    p.add_argument('--url', default=default_url, help=f'Адрес webhook (по умолчанию {default_url})')
+    p.add_argument('--secret', default=config.WEBHOOK_SECRET, help='Secret token (по умолчанию WEBHOOK_SECRET)')
+    p.add_argument('--concurrency', type=int, default=4, help='Параллельных запросов')
+    args = p.parse_args()
+    asyncio.run(replay(Path(args.file), args.url, args.secret, args.concurrency))
+
+
+if __name__ == '__main__':
+    main()
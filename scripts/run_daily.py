@@ -1,236 +1,14 @@
 import argparse
 import asyncio
-import base64
-import json
-import os
 import sys
-from datetime import datetime
 from pathlib import Path
 
-from telethon import TelegramClient
-from telegram import Bot
-
 ROOT_DIR = Path(__file__).resolve().parents[1]
 if str(ROOT_DIR) not in sys.path:
     sys.path.insert(0, str(ROOT_DIR))
 
-import config
-from src.get_channels import get_channels_fullinfo_from_folder, load_channels_from_json
-from src.news_bot_part import get_news, summarize_news, send_news
-from src.paths import DATA_DIR, resolve_data_path
-
-
-DEFAULT_SUBSCRIBERS_FILE = DATA_DIR / "subscribers.json"
-SUBSCRIBERS_FILE = resolve_data_path(getattr(config, 'SUBSCRIBERS_FILE', DEFAULT_SUBSCRIBERS_FILE))
-
-SUMMARIES_LOG_FILE = DATA_DIR / "sent_summaries.log"
-
-
-def _backup_file(path: Path):
-    if path.exists():
-        ts = datetime.now().strftime('%Y%m%d-%H%M%S')
-        bak = path.with_suffix(path.suffix + f".{ts}.bak")
-        try:
-            with open(path, 'rb') as src, open(bak, 'wb') as dst:
-                dst.write(src.read())
-            print(f"[LOG] Создан бэкап {bak}")
-        except Exception as e:
-            print(f"[WARN] Не удалось создать бэкап {path}: {e}")
-
-
-def _load_json(path: Path, default):
-    if not path.exists():
-        return default
-    try:
-        with open(path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"[WARN] Ошибка чтения {path}: {e}")
-        return default
-
-
-def _save_json(path: Path, data):
-    _backup_file(path)
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
-
-def save_summary_to_log(summary: str):
-    """
-    Сохраняет текст саммари в файл с датой и временем отправки.
-    Вызывается после саммаризации и перед рассылкой пользователям.
-    """
-    try:
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_entry = f"\n{'='*80}\nДата отправки: {timestamp}\n{'='*80}\n{summary}\n"
-        with open(SUMMARIES_LOG_FILE, 'a', encoding='utf-8') as f:
-            f.write(log_entry)
-        print(f"[LOG] Саммари сохранена в {SUMMARIES_LOG_FILE}")
-    except Exception as e:
-        print(f"[WARN] Не удалось сохранить саммари в файл: {e}")
-
-
-def _ensure_telethon_session_file():
-    session_path = DATA_DIR / "anon_news.session"
-    if session_path.exists():
-        return session_path
-
-    session_b64 = os.getenv("TELEGRAM_SESSION_B64") or os.getenv("TELEGRAM_SESSION")
-    if not session_b64:
-        return session_path
-
-    try:
-        session_data = base64.b64decode(session_b64)
-        session_path.write_bytes(session_data)
-        print(f"[LOG] Файл Telethon-сессии восстановлен: {session_path}")
-    except Exception as e:
-        print(f"[WARN] Не удалось восстановить Telethon-сессию из env: {e}")
-    return session_path
-
-
-async def verify_subscribers_delivery(bot: Bot):
-    """
-    Лёгкая проверка доступности: отправляет chat action (typing) каждому подписчику.
-    Это менее навязчиво, чем тестовое сообщение. Недоступные вызов падает с исключением.
-    Возвращает список доступных user_id (по результатам попыток).
-    В режиме отладки проверяет только тестовых пользователей.
-    """
-    data = _load_json(SUBSCRIBERS_FILE, {"subscribers": []})
-    subs = [s.get('user_id') for s in data.get('subscribers', []) if 'user_id' in s]
-
-    # Фильтрация подписчиков в режиме отладки
-    if getattr(config, 'DEBUG_MODE', False):
-        debug_ids = getattr(config, 'DEBUG_USER_IDS', [])
-        if isinstance(debug_ids, int):
-            debug_ids = [debug_ids]
-        subs = [uid for uid in subs if uid in debug_ids]
-        print(f"[DEBUG] Режим отладки включен. Проверка доступности только для тестовых пользователей: {subs}")
-
-    ok = []
-    for uid in subs:
-        try:
-            # у python-telegram-bot v21 Bot.send_chat_action переименована в send_chat_action
-            await bot.send_chat_action(chat_id=uid, action="typing")
-            ok.append(uid)
-            await asyncio.sleep(0.05)
-        except Exception as e:
-            print(f"[WARN] Недоступен для рассылки user_id={uid}: {e}")
-            await asyncio.sleep(0.05)
-    print(f"[LOG] Проверка доступности: {len(ok)}/{len(subs)} пользователей ок")
-    return ok
-
-
-def _parse_target_date(date_str: str):
-    try:
-        return datetime.strptime(date_str, "%Y-%m-%d").date()
-    except ValueError as e:
-        raise ValueError("Неверный формат даты. Используй YYYY-MM-DD.") from e
-
-
-def _resolve_channels_path(args):
-    if args.channels_file:
-        return resolve_data_path(args.channels_file)
-    if args.sport:
-        return resolve_data_path("channels_sport.json")
-    return None
-
-
-def _resolve_folder_name(args):
-    if args.sport:
-        return "Sport"
-    if args.folder:
-        return args.folder
-    return config.FOLDER_NAME
-
-
-def _resolve_prompt_type(args):
-    if args.sport:
-        return "sport"
-    return args.prompt
-
-
-async def run_pipeline(args):
-    # 1) Создание клиентов
-    bot_token = (config.telegram_bot_token or "").strip()
-    if not bot_token:
-        raise RuntimeError(
-            "Не задан TELEGRAM_BOT_TOKEN. Укажи токен бота в .env или переменной окружения."
-        )
-    bot = Bot(token=bot_token)
-
-    # 2) Обновление каналов
-    channels = None
-    if args.channels or args.news or args.send:
-        session_path = _ensure_telethon_session_file()
-        if not session_path.exists():
-            raise FileNotFoundError(
-                f"Не найдена user-сессия Telethon: {session_path}. "
-                "Положи файл anon_news.session в корень проекта"
-            )
-        if not config.api_id or not str(config.api_hash).strip():
-            raise RuntimeError(
-                "Не заданы API_ID/API_HASH. Укажи их в .env или переменных окружения."
-            )
-
-        async with TelegramClient(str(session_path), config.api_id, config.api_hash) as client:
-            me = await client.get_me()
-            if not me:
-                raise RuntimeError("Telethon сессия не авторизована как пользователь.")
-            if getattr(me, "bot", False):
-                raise RuntimeError(
-                    "Telethon сессия принадлежит боту. Нужна user session "
-                    "(вход по телефону) в файле anon_news.session."
-                )
-            channels_path = _resolve_channels_path(args)
-            folder_name = _resolve_folder_name(args)
-            if args.channels:
-                await get_channels_fullinfo_from_folder(client, folder_name, output_path=channels_path)
-            channels = load_channels_from_json(path=channels_path)
-            if args.news or args.send:
-                # Определяем период: неделя или день
-                target_date = _parse_target_date(args.date) if args.date else None
-                period = 'week' if args.weekly else 'day'
-                if target_date:
-                    if args.weekly:
-                        period_name = f"неделю до {target_date.isoformat()}"
-                    else:
-                        period_name = target_date.isoformat()
-                else:
-                    period_name = "неделю" if args.weekly else "вчера"
-
-                print(f"[LOG] Каналы для агрегации: {[ch.get('username','?') for ch in channels]}")
-                news = await get_news(client, channels, period=period, target_date=target_date)
-                print(f"[LOG] Найдено новостей за {period_name}: {len(news)}")
-                if args.news and not args.send:
-                    # Только сбор новостей
-                    return
-                if not news:
-                    print(f"[LOG] Нет новостей за {period_name} — рассылка пропущена")
-                    return
-                prompt_type = _resolve_prompt_type(args)
-                summary = summarize_news(news, period=period, target_date=target_date, prompt_type=prompt_type)
-
-                if args.summary_only:
-                    out = args.summary_only if isinstance(args.summary_only, str) else 'summary.txt'
-                    with open(out, 'w', encoding='utf-8') as f:
-                        f.write(summary)
-                    print(f"[LOG] Итоговая сводка сохранена в {out}")
-                    return
-
-                # Сохраняем саммари в лог перед рассылкой
-                save_summary_to_log(summary)
-
-                # 3) Предварительная проверка доступности (опционально)
-                if args.verify:
-                    await verify_subscribers_delivery(bot)
-
-                if args.dry_run:
-                    print("[DRY-RUN] Рассылка не выполнялась. Предпросмотр (начало):\n")
-                    print(summary[:800])
-                    return
-
-                # 4) Рассылка (send_news уже фильтрует недоступных и обновляет файл)
-                await send_news(summary)
+from src.locks import LockBusy
+from src.pipeline import pipeline_turn, run_pipeline
 
 
 def build_arg_parser():
@@ -240,16 +18,30 @@ def build_arg_parser():
     p.add_argument('--news', action='store_true', help='Только собрать новости (без отправки)')
     p.add_argument('--send', action='store_true', help='Собрать новости, суммаризировать и отправить')
     p.add_argument('--weekly', action='store_true', help='Собрать саммаризацию за неделю (по умолчанию за день)')
-    p.add_argument('--date', help='Собрать за указанную дату (UTC), формат YYYY-MM-DD')
+    p.add_argument('--date', help='Собрать за указанную дату (в поясе DIGEST_TIMEZONE), формат YYYY-MM-DD')
     p.add_argument('--dry-run', action='store_true', help='Не отправлять, только показать превью')
     p.add_argument('--summary-only', nargs='?', const=True, help='Сохранить сводку в файл (по умолчанию summary.txt) и завершить')
     p.add_argument('--folder', help='Название папки (filters) в Telegram для каналов')
     p.add_argument('--channels-file', help='Путь к json с каналами (по умолчанию channels.json)')
-    p.add_argument('--prompt', choices=['general', 'sport'], default='general', help='Шаблон промпта для саммаризации')
-    p.add_argument('--sport', action='store_true', help='Шорткат: папка Sport + спорт-промпт')
+    p.add_argument('--prompt', choices=['general', 'sport'], help='Шаблон промпта для саммаризации (по умолчанию из дайджеста)')
+    p.add_argument('--sport', action='store_true', help='Шорткат для --digest sport')
+    p.add_argument('--digest', action='append', metavar='NAME',
+                   help='Дайджест из digests.json (можно несколько; all — все). По умолчанию первый в реестре')
+    p.add_argument('--intraday', action='store_true',
+                   help='Внутридневное обновление: только сообщения с прошлого обновления, без повторов за день')
+    p.add_argument('--weekly-raw', action='store_true',
+                   help='Недельная сводка по сырым сообщениям за 7 дней, а не из ежедневных сводок')
+    p.add_argument('--no-cache', action='store_true', help='Не брать готовую сводку за период из кэша')
+    p.add_argument('--rerun', action='store_true', help='Начать задание заново, даже если оно уже выполнено')
     return p
 
 
+async def _run_locked(args):
+    # Сборка по запросу из бота (get_users.py) держит pipeline.lock недолго — ждём её, а не пропускаем рассылку
+    async with pipeline_turn():
+        await run_pipeline(args)
+
+
 def main():
     parser = build_arg_parser()
     args = parser.parse_args()
@@ -259,7 +51,11 @@ def main():
         args.channels = True
         args.send = True
 
-    asyncio.run(run_pipeline(args))
+    try:
+        asyncio.run(_run_locked(args))
+    except LockBusy as e:
+        print(f"[WARN] Конвейер занят дольше PIPELINE_LOCK_WAIT_MINUTES ({e}) — запуск пропущен")
+        sys.exit(1)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,186 @@
+"""
+Долгоживущий сервис: бот подписчиков + встроенный планировщик рассылок.
+
+Заменяет пару cron-задач (get_users.py каждую минуту и run_daily.py --send по расписанию):
+бот, Telethon-сессия и HTTP-пулы Bot API/OpenAI остаются «тёплыми» между запусками.
+Расписание берётся из реестра дайджестов (digests.json, поле schedule; без файла —
+SCHEDULE_DAILY / SCHEDULE_WEEKLY / SCHEDULE_SPORT, UTC). Дайджесты, наступившие
+одновременно, собираются одним запуском конвейера. При DELIVERY_MODE=queue здесь же
+работает воркер очереди доставки (src/delivery_queue.py).
+
+Повторный запуск сразу завершается, если бот уже работает (bot.lock), поэтому
+его можно держать в cron как сторожа. Запуски конвейера защищены pipeline.lock,
+общим с scripts/run_daily.py.
+"""
+import argparse
+import asyncio
+import logging
+import shlex
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+import config
+from src.locks import BOT_LOCK_FILE, LockBusy, file_lock
+
+logger = logging.getLogger(__name__)
+
+
+def build_jobs():
+    """Задача на каждую пару (дайджест, период) с расписанием."""
+    from src.digests import load_digests
+    from src.scheduler import ScheduledJob
+
+    jobs = []
+    for digest in load_digests().values():
+        for period, schedule in digest.schedule.items():
+            argv = ["--digest", digest.name, "--send"]
+            if period == "week":
+                argv.append("--weekly")
+            elif period == "intraday":
+                argv.append("--intraday")
+            jobs.append(ScheduledJob(f"{digest.name}:{period}", schedule, argv))
+    return jobs
+
+
+def group_jobs(jobs):
+    """Объединяет одновременно наступившие задачи с одинаковыми флагами в один argv."""
+    groups = {}
+    for job in jobs:
+        digests, flags = [], []
+        args = iter(job.argv)
+        for arg in args:
+            if arg == "--digest":
+                digests.append(next(args))
+            else:
+                flags.append(arg)
+        groups.setdefault(tuple(flags), []).extend(digests)
+    merged = []
+    for flags, digests in groups.items():
+        argv = list(flags)
+        for name in digests:
+            argv += ["--digest", name]
+        merged.append(argv)
+    return merged
+
+
+class TelethonConnection:
+    """Держит одно подключение Telethon на всё время жизни сервиса, переподключаясь при обрыве."""
+
+    def __init__(self):
+        self.client = None
+
+    async def get(self):
+        from src.pipeline import open_telethon_client
+
+        if self.client is not None and self.client.is_connected():
+            return self.client
+        if self.client is not None:
+            await self.client.disconnect()
+        self.client = await open_telethon_client()
+        return self.client
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.disconnect()
+            self.client = None
+
+
+async def run_service(args):
+    from scripts.get_users import build_application
+    from scripts.run_daily import build_arg_parser as build_pipeline_arg_parser
+    from src.pipeline import pipeline_turn, run_pipeline
+    from src.scheduler import run_scheduler
+    from src.webhook import install_stop_signals, start_webhook_server, stop_webhook_server
+
+    token = (config.telegram_bot_token or "").strip()
+    if not token or ":" not in token:
+        raise RuntimeError("Не задан TELEGRAM_BOT_TOKEN.")
+
+    webhook = args.webhook or config.BOT_MODE == "webhook"
+    telethon = TelethonConnection()
+    app = build_application(token, backfill=args.backfill, webhook=webhook, get_client=telethon.get)
+    pipeline_parser = build_pipeline_arg_parser()
+
+    async def run_jobs(jobs):
+        try:
+            # Ждём, пока закончится сборка по запросу или запуск другого процесса, — рассылка не пропускается
+            async with pipeline_turn():
+                client = await telethon.get()
+                for argv in group_jobs(jobs):
+                    print(f"[LOG] Запуск конвейера: {shlex.join(argv)}")
+                    await run_pipeline(pipeline_parser.parse_args(argv), client=client, bot=app.bot)
+        except LockBusy:
+            names = ", ".join(job.name for job in jobs)
+            print(f"[WARN] Конвейер занят дольше PIPELINE_LOCK_WAIT_MINUTES — {names} пропущено")
+
+    stop_event = asyncio.Event()
+    install_stop_signals(stop_event)
+
+    async with app:
+        await app.start()
+        if webhook:
+            runner = await start_webhook_server(
+                app,
+                listen=config.WEBHOOK_LISTEN,
+                port=config.WEBHOOK_PORT,
+                path=config.WEBHOOK_PATH,
+                secret_token=config.WEBHOOK_SECRET,
+                webhook_url=config.WEBHOOK_URL,
+            )
+        else:
+            await app.updater.start_polling()
+            logger.info("Бот запущен, ожидает сообщений...")
+
+        scheduler_task = asyncio.create_task(run_scheduler(build_jobs(), run_jobs, stop_event))
+        delivery_task = None
+        if config.DELIVERY_MODE == "queue":
+            from src.delivery_queue import run_delivery_worker
+
+            delivery_task = asyncio.create_task(run_delivery_worker(app.bot, stop_event))
+        try:
+            await stop_event.wait()
+        finally:
+            # Даём текущему запуску конвейера завершиться, но не дольше таймаута
+            try:
+                await asyncio.wait_for(scheduler_task, timeout=config.SERVICE_SHUTDOWN_TIMEOUT)
+            except asyncio.TimeoutError:
+                print("[WARN] Запуск конвейера прерван по таймауту остановки")
+            except Exception as e:
+                print(f"[ERROR] Планировщик завершился с ошибкой: {e}")
+            if delivery_task is not None:
+                try:
+                    await asyncio.wait_for(delivery_task, timeout=config.SERVICE_SHUTDOWN_TIMEOUT)
+                except asyncio.TimeoutError:
+                    print("[WARN] Очередь доставки прервана по таймауту остановки")
+                except Exception as e:
+                    print(f"[ERROR] Очередь доставки завершилась с ошибкой: {e}")
+            if webhook:
+                await stop_webhook_server(runner, app)
+            else:
+                await app.updater.stop()
+            await app.stop()
+            await telethon.close()
+
+
+def build_arg_parser():
+    p = argparse.ArgumentParser(description="Бот подписчиков + планировщик рассылок в одном процессе")
+    p.add_argument('--webhook', action='store_true', help='Принимать апдейты через webhook вместо polling')
+    p.add_argument('--backfill', action='store_true', help='Добавлять отправителей личных сообщений в подписчики')
+    return p
+
+
+def main():
+    args = build_arg_parser().parse_args()
+    try:
+        with file_lock(BOT_LOCK_FILE):
+            asyncio.run(run_service(args))
+    except LockBusy:
+        print("[LOG] Бот уже запущен (service.py или get_users.py) — выходим")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,211 +1,300 @@
 """
-Разовый скрипт для обновления данных подписчиков в subscribers.json.
+Скрипт для обновления данных подписчиков в subscribers.json.
 Заполняет недостающие поля (username, first_name, last_name, added_at) для всех пользователей.
+
+Запросы к Bot API идут конкурентно, а пользователей, не найденных через Bot API,
+Telethon разрешает пачками через GetUsersRequest. У Bot API и MTProto отдельные
+ограничители частоты. Прогресс сохраняется в чекпоинт после каждой пачки, поэтому
+прерванный запуск продолжается с места остановки (--reset начинает заново).
+В конце в subscribers.json записываются только изменившиеся записи.
 """
+import argparse
 import asyncio
 import json
+import os
 import sys
 from datetime import datetime
 from pathlib import Path
 
 from telegram import Bot
-from telegram.error import TelegramError, Forbidden, BadRequest
+from telegram.error import TelegramError, Forbidden, BadRequest, RetryAfter
 from telethon import TelegramClient
+from telethon.errors import FloodWaitError
+from telethon.tl.functions.users import GetUsersRequest
 
 ROOT_DIR = Path(__file__).resolve().parents[1]
 if str(ROOT_DIR) not in sys.path:
     sys.path.insert(0, str(ROOT_DIR))
 
 import config
-from src.paths import DATA_DIR, resolve_data_path
+from src.delivery import retry_after_seconds
+from src.paths import DATA_DIR
+from src.ratelimit import AsyncRateLimiter
+from src.subscribers import SUBSCRIBERS_FILE, load_subscriber_records, update_subscriber_records
 
-DEFAULT_SUBSCRIBERS_FILE = DATA_DIR / "subscribers.json"
-SUBSCRIBERS_FILE = resolve_data_path(getattr(config, "SUBSCRIBERS_FILE", DEFAULT_SUBSCRIBERS_FILE))
+CHECKPOINT_FILE = DATA_DIR / "update_subscribers.checkpoint.json"
+PROFILE_FIELDS = ("username", "first_name", "last_name")
 
 
-def _load_subscribers():
-    """Загружает список подписчиков из файла."""
-    if not SUBSCRIBERS_FILE.exists():
-        print(f"[ERROR] Файл {SUBSCRIBERS_FILE} не найден")
-        return []
+def _load_checkpoint():
+    if not CHECKPOINT_FILE.exists():
+        return {"done": [], "patches": {}}
     try:
-        with open(SUBSCRIBERS_FILE, 'r', encoding='utf-8') as f:
+        with open(CHECKPOINT_FILE, 'r', encoding='utf-8') as f:
             data = json.load(f)
-            return data.get('subscribers', [])
+        return {"done": data.get("done", []), "patches": data.get("patches", {})}
     except Exception as e:
-        print(f"[ERROR] Ошибка чтения {SUBSCRIBERS_FILE}: {e}")
-        return []
+        print(f"[WARN] Ошибка чтения чекпоинта {CHECKPOINT_FILE}: {e}")
+        return {"done": [], "patches": {}}
+
 
+def _save_checkpoint(checkpoint):
+    tmp_path = CHECKPOINT_FILE.with_name(CHECKPOINT_FILE.name + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, ensure_ascii=False)
+    os.replace(tmp_path, CHECKPOINT_FILE)
 
-def _save_subscribers(subscribers):
-    """Сохраняет список подписчиков в файл."""
+
+def _backup_subscribers():
+    """Создает бэкап subscribers.json перед записью."""
+    if not SUBSCRIBERS_FILE.exists():
+        return
     try:
-        # Создаем бэкап
-        if SUBSCRIBERS_FILE.exists():
-            timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
-            backup_file = SUBSCRIBERS_FILE.with_suffix(SUBSCRIBERS_FILE.suffix + f".{timestamp}.bak")
-            with open(SUBSCRIBERS_FILE, 'rb') as src, open(backup_file, 'wb') as dst:
-                dst.write(src.read())
-            print(f"[LOG] Создан бэкап: {backup_file}")
-
-        with open(SUBSCRIBERS_FILE, 'w', encoding='utf-8') as f:
-            json.dump({"subscribers": subscribers}, f, ensure_ascii=False, indent=2)
-        print(f"[LOG] Данные сохранены в {SUBSCRIBERS_FILE}")
+        timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        backup_file = SUBSCRIBERS_FILE.with_suffix(SUBSCRIBERS_FILE.suffix + f".{timestamp}.bak")
+        with open(SUBSCRIBERS_FILE, 'rb') as src, open(backup_file, 'wb') as dst:
+            dst.write(src.read())
+        print(f"[LOG] Создан бэкап: {backup_file}")
     except Exception as e:
-        print(f"[ERROR] Ошибка записи {SUBSCRIBERS_FILE}: {e}")
+        print(f"[WARN] Не удалось создать бэкап {SUBSCRIBERS_FILE}: {e}")
+
 
+def _needs_update(sub):
+    has_all_fields = all(key in sub and sub[key] for key in PROFILE_FIELDS)
+    if not (has_all_fields and sub.get('username') != '-' and sub.get('first_name') != '-'):
+        return True
+    return not sub.get('added_at')
 
-async def get_user_info_via_bot(bot: Bot, user_id: int):
+
+def _build_patch(sub, user_info):
+    """
+    Поля, которые нужно изменить у записи sub. Существующие данные сохраняются,
+    если они есть и лучше новых; при отсутствии данных заполняется "-".
+    """
+    patch = {}
+    for key in PROFILE_FIELDS:
+        current = sub.get(key)
+        if user_info:
+            if not current or current == '-':
+                value = user_info.get(key) or '-'
+                if value != current:
+                    patch[key] = value
+        elif key not in sub:
+            patch[key] = '-'
+    if not sub.get('added_at'):
+        patch['added_at'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return patch
+
+
+async def get_user_info_via_bot(bot: Bot, user_id: int, limiter: AsyncRateLimiter):
     """
     Пытается получить информацию о пользователе через Bot API.
     Возвращает словарь с данными или None если не удалось.
     """
-    try:
-        chat = await bot.get_chat(chat_id=user_id)
-        return {
-            "user_id": user_id,
-            "username": chat.username or "-",
-            "first_name": chat.first_name or "-",
-            "last_name": chat.last_name or "-",
-        }
-    except Forbidden:
-        print(f"[WARN] Пользователь {user_id} заблокировал бота - используем только ID")
-        return None
-    except BadRequest as e:
-        error_msg = str(e).lower()
-        if "chat not found" in error_msg:
-            print(f"[WARN] Чат с пользователем {user_id} не найден через Bot API")
-        else:
-            print(f"[WARN] Ошибка Bot API для {user_id}: {e}")
-        return None
-    except TelegramError as e:
-        print(f"[WARN] Ошибка Telegram API для {user_id}: {e}")
-        return None
-    except Exception as e:
-        print(f"[WARN] Неожиданная ошибка для {user_id}: {e}")
-        return None
-
-
-async def get_user_info_via_telethon(client: TelegramClient, user_id: int):
+    for _ in range(2):
+        async with limiter:
+            try:
+                chat = await bot.get_chat(chat_id=user_id)
+                return {
+                    "user_id": user_id,
+                    "username": chat.username or "-",
+                    "first_name": chat.first_name or "-",
+                    "last_name": chat.last_name or "-",
+                }
+            except RetryAfter as e:
+                limiter.penalize(retry_after_seconds(e))
+                continue
+            except Forbidden:
+                print(f"[WARN] Пользователь {user_id} заблокировал бота - пробуем через Telethon")
+                return None
+            except BadRequest as e:
+                error_msg = str(e).lower()
+                if "chat not found" in error_msg:
+                    print(f"[WARN] Чат с пользователем {user_id} не найден через Bot API")
+                else:
+                    print(f"[WARN] Ошибка Bot API для {user_id}: {e}")
+                return None
+            except TelegramError as e:
+                print(f"[WARN] Ошибка Telegram API для {user_id}: {e}")
+                return None
+            except Exception as e:
+                print(f"[WARN] Неожиданная ошибка для {user_id}: {e}")
+                return None
+    return None
+
+
+async def get_users_info_via_telethon(client: TelegramClient, user_ids, limiter: AsyncRateLimiter):
     """
-    Пытается получить информацию о пользователе через Telethon.
-    Возвращает словарь с данными или None если не удалось.
+    Получает информацию о пользователях через Telethon одним GetUsersRequest на пачку.
+    InputUser берётся только из кэша сущностей сессии (без сетевых запросов — client.get_input_entity
+    для неизвестного id сам пошёл бы в сеть мимо limiter); неизвестные сессии пользователи пропускаются.
+    Возвращает словарь {user_id: данные}.
     """
-    try:
-        entity = await client.get_entity(user_id)
-        return {
-            "user_id": user_id,
+    input_users = []
+    for user_id in user_ids:
+        try:
+            input_users.append(client.session.get_input_entity(user_id))
+        except (ValueError, TypeError):
+            # Пользователь не встречался этой сессии — без access_hash его не разрешить
+            continue
+    if not input_users:
+        return {}
+
+    for _ in range(2):
+        async with limiter:
+            try:
+                users = await client(GetUsersRequest(id=input_users))
+                break
+            except FloodWaitError as e:
+                print(f"[WARN] FloodWait Telethon: ждём {e.seconds} c")
+                limiter.penalize(e.seconds)
+            except Exception as e:
+                print(f"[WARN] Не удалось получить данные через Telethon для пачки из {len(input_users)}: {e}")
+                return {}
+    else:
+        return {}
+
+    result = {}
+    for entity in users:
+        if getattr(entity, "id", None) is None or type(entity).__name__ == "UserEmpty":
+            continue
+        result[entity.id] = {
+            "user_id": entity.id,
             "username": getattr(entity, 'username', None) or "-",
             "first_name": getattr(entity, 'first_name', None) or "-",
             "last_name": getattr(entity, 'last_name', None) or "-",
         }
-    except Exception as e:
-        print(f"[WARN] Не удалось получить данные через Telethon для {user_id}: {e}")
-        return None
+    return result
 
 
-async def update_subscribers_data():
+async def _process_batch(batch, bot, client, bot_limiter, mtproto_limiter, concurrency):
+    """Обрабатывает пачку подписчиков: Bot API конкурентно, затем Telethon одной пачкой."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def via_bot(sub):
+        async with semaphore:
+            return sub['user_id'], await get_user_info_via_bot(bot, sub['user_id'], bot_limiter)
+
+    infos = dict(await asyncio.gather(*(via_bot(sub) for sub in batch)))
+
+    missing = [uid for uid, info in infos.items() if info is None]
+    if missing and client is not None:
+        infos.update(await get_users_info_via_telethon(client, missing, mtproto_limiter))
+
+    patches = {}
+    for sub in batch:
+        patch = _build_patch(sub, infos.get(sub['user_id']))
+        if patch:
+            patches[str(sub['user_id'])] = patch
+    found = sum(1 for info in infos.values() if info)
+    return patches, found
+
+
+async def update_subscribers_data(concurrency=10, batch_size=100, bot_rate=25.0, mtproto_rate=1.0, reset=False):
     """Основная функция обновления данных подписчиков."""
-    subscribers = _load_subscribers()
+    subscribers = load_subscriber_records()
     if not subscribers:
         print("[ERROR] Список подписчиков пуст")
         return
 
     print(f"[LOG] Найдено подписчиков: {len(subscribers)}")
 
+    if reset and CHECKPOINT_FILE.exists():
+        CHECKPOINT_FILE.unlink()
+    checkpoint = _load_checkpoint()
+    done = set(checkpoint["done"])
+    if done:
+        print(f"[LOG] Продолжаем с чекпоинта: уже обработано {len(done)}")
+
+    skipped_count = sum(1 for sub in subscribers if not sub.get('user_id'))
+    pending = [
+        sub for sub in subscribers
+        if sub.get('user_id') and sub['user_id'] not in done and _needs_update(sub)
+    ]
+    print(f"[LOG] Требуют обновления: {len(pending)}")
+
     bot = Bot(token=config.telegram_bot_token)
-    updated_count = 0
-    skipped_count = 0
+    bot_limiter = AsyncRateLimiter(bot_rate)
+    mtproto_limiter = AsyncRateLimiter(mtproto_rate)
 
     # Создаем Telethon клиент один раз для всех запросов
-    telethon_available = False
-    session_path = DATA_DIR / "anon_news.session"
+    client = None
+    if pending:
+        session_path = DATA_DIR / "anon_news.session"
+        try:
+            client = TelegramClient(str(session_path), config.api_id, config.api_hash)
+            await client.start()
+            print("[LOG] Telethon клиент подключен")
+        except Exception as e:
+            client = None
+            print(f"[WARN] Не удалось подключиться к Telethon: {e}")
+            print("[LOG] Будем использовать только Bot API")
+
+    found_count = 0
     try:
-        client = TelegramClient(str(session_path), config.api_id, config.api_hash)
-        await client.start()
-        telethon_available = True
-        print("[LOG] Telethon клиент подключен")
-    except Exception as e:
-        print(f"[WARN] Не удалось подключиться к Telethon: {e}")
-        print("[LOG] Будем использовать только Bot API")
-
-    try:
-        # Обновляем данные для каждого подписчика
-        for idx, sub in enumerate(subscribers, 1):
-            user_id = sub.get('user_id')
-            if not user_id:
-                print(f"[WARN] Пропущен подписчик #{idx}: отсутствует user_id")
-                skipped_count += 1
-                continue
-
-            print(f"[LOG] [{idx}/{len(subscribers)}] Обработка user_id={user_id}...")
-
-            # Проверяем, нужно ли обновлять данные
-            has_all_fields = all(key in sub and sub[key] for key in ['username', 'first_name', 'last_name'])
-            if has_all_fields and sub.get('username') != '-' and sub.get('first_name') != '-':
-                print(f"  ✓ Данные уже полные, пропускаем")
-                continue
-
-            # Пытаемся получить данные через Bot API
-            user_info = await get_user_info_via_bot(bot, user_id)
-
-            # Если не получилось через Bot API, пробуем через Telethon
-            if not user_info and telethon_available:
-                try:
-                    user_info = await get_user_info_via_telethon(client, user_id)
-                except Exception as e:
-                    print(f"  [WARN] Ошибка Telethon для {user_id}: {e}")
-
-            # Обновляем данные
-            if user_info:
-                # Сохраняем существующие данные, если они есть и лучше новых
-                if 'username' not in sub or sub.get('username') == '-' or not sub.get('username'):
-                    sub['username'] = user_info.get('username', '-')
-                if 'first_name' not in sub or sub.get('first_name') == '-' or not sub.get('first_name'):
-                    sub['first_name'] = user_info.get('first_name', '-')
-                if 'last_name' not in sub or sub.get('last_name') == '-' or not sub.get('last_name'):
-                    sub['last_name'] = user_info.get('last_name', '-')
-
-                # Добавляем дату, если её нет
-                if 'added_at' not in sub or not sub.get('added_at'):
-                    sub['added_at'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-                updated_count += 1
-                print(f"  ✓ Обновлено: @{sub['username']} ({sub['first_name']} {sub['last_name']})")
-            else:
-                # Если не удалось получить данные, заполняем минимально
-                if 'username' not in sub:
-                    sub['username'] = "-"
-                if 'first_name' not in sub:
-                    sub['first_name'] = "-"
-                if 'last_name' not in sub:
-                    sub['last_name'] = "-"
-                if 'added_at' not in sub or not sub.get('added_at'):
-                    sub['added_at'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-                print(f"  ⚠ Не удалось получить данные, заполнены значения по умолчанию")
-                updated_count += 1
-
-            # Небольшая пауза между запросами
-            await asyncio.sleep(0.2)
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            patches, found = await _process_batch(
+                batch, bot, client, bot_limiter, mtproto_limiter, max(1, concurrency)
+            )
+            found_count += found
+            checkpoint["patches"].update(patches)
+            checkpoint["done"].extend(sub['user_id'] for sub in batch)
+            _save_checkpoint(checkpoint)
+            print(f"[LOG] [{min(start + batch_size, len(pending))}/{len(pending)}] обработано, найдено профилей: {found}")
     finally:
         # Закрываем Telethon клиент
-        if telethon_available:
+        if client is not None:
             await client.disconnect()
             print("[LOG] Telethon клиент отключен")
 
-    # Сохраняем обновленные данные
-    _save_subscribers(subscribers)
+    # Сохраняем только изменившиеся записи
+    patches = checkpoint["patches"]
+    if patches:
+        _backup_subscribers()
+    changed = update_subscriber_records(patches)
+    if changed:
+        print(f"[LOG] Данные сохранены в {SUBSCRIBERS_FILE}")
+    if CHECKPOINT_FILE.exists():
+        CHECKPOINT_FILE.unlink()
 
-    print(f"\n[LOG] Обновление завершено:")
-    print(f"  - Обновлено записей: {updated_count}")
+    print("\n[LOG] Обновление завершено:")
+    print(f"  - Обновлено записей: {changed}")
+    print(f"  - Найдено профилей в этом запуске: {found_count}")
     print(f"  - Пропущено: {skipped_count}")
     print(f"  - Всего подписчиков: {len(subscribers)}")
 
 
+def build_arg_parser():
+    p = argparse.ArgumentParser(description="Заполнение профилей подписчиков в subscribers.json")
+    p.add_argument('--concurrency', type=int, default=10, help='Параллельных запросов к Bot API')
+    p.add_argument('--batch-size', type=int, default=100, help='Пользователей в пачке (и в одном GetUsersRequest)')
+    p.add_argument('--bot-rate', type=float, default=25.0, help='Запросов к Bot API в секунду')
+    p.add_argument('--mtproto-rate', type=float, default=1.0, help='Запросов к MTProto (Telethon) в секунду')
+    p.add_argument('--reset', action='store_true', help='Игнорировать чекпоинт и начать заново')
+    return p
+
+
 if __name__ == "__main__":
+    args = build_arg_parser().parse_args()
     print("=" * 60)
     print("Скрипт обновления данных подписчиков")
     print("=" * 60)
     print()
-    asyncio.run(update_subscribers_data())
+    asyncio.run(update_subscribers_data(
+        concurrency=args.concurrency,
+        batch_size=args.batch_size,
+        bot_rate=args.bot_rate,
+        mtproto_rate=args.mtproto_rate,
+        reset=args.reset,
+    ))
@@ -0,0 +1,186 @@
+"""
+Архив готовых сводок (DATA_DIR/summaries) — замена sent_summaries.log.
+
+Каждая сводка хранится отдельным JSON-файлом <дайджест>/<период>_<дата>.json с текстом и
+метаданными (модель, токены, время создания и рассылки). Дата — начало окна сводки: для
+ежедневной это день новостей, для недельной — первый день недели. Путь вычисляется из
+(дайджест, период, дата), поэтому выборка за дату не требует поиска; index.json хранит
+список сводок по датам и последнюю сводку каждого дайджеста (для /last).
+Окно без новостей отмечается записью с "no_news" и пустым текстом (mark_no_news): в индекс
+она не попадает, а недельная сводка не собирает такой день заново.
+"""
+import json
+import os
+
+from src.paths import DATA_DIR
+from src.subscribers import to_iso, utc_now
+
+
+ARCHIVE_DIR = DATA_DIR / "summaries"
+ARCHIVE_INDEX_FILE = ARCHIVE_DIR / "index.json"
+
+
+def _date_str(day):
+    return day if isinstance(day, str) else day.isoformat()
+
+
+def archive_key(digest, period, day):
+    return f"{digest}/{period}/{_date_str(day)}"
+
+
+def _entry_path(digest, period, day):
+    return ARCHIVE_DIR / digest / f"{period}_{_date_str(day)}.json"
+
+
+def _write_json_atomic(path, data):
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"[WARN] Ошибка чтения {path}: {e}")
+        return None
+
+
+def _index_entry(record):
+    return {key: record.get(key) for key in ("digest", "period", "date", "created_at", "sent_at")}
+
+
+def rebuild_index():
+    """Собирает index.json заново по файлам архива (если индекс потерян или повреждён)."""
+    index = {"entries": {}, "latest": {}}
+    for path in sorted(ARCHIVE_DIR.glob("*/*.json")):
+        record = _read_json(path)
+        if record and record.get("digest") and record.get("period") and record.get("date") \
+                and not record.get("no_news"):
+            _add_to_index(index, record)
+    _save_index(index)
+    return index
+
+
+def load_index():
+    index = _read_json(ARCHIVE_INDEX_FILE) if ARCHIVE_INDEX_FILE.exists() else None
+    if not isinstance(index, dict) or "entries" not in index:
+        return rebuild_index() if ARCHIVE_DIR.exists() else {"entries": {}, "latest": {}}
+    index.setdefault("latest", {})
+    return index
+
+
+def _save_index(index):
+    try:
+        ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+        _write_json_atomic(ARCHIVE_INDEX_FILE, index)
+    except Exception as e:
+        print(f"[WARN] Не удалось сохранить индекс архива {ARCHIVE_INDEX_FILE}: {e}")
+
+
+def _add_to_index(index, record):
+    index["entries"][archive_key(record["digest"], record["period"], record["date"])] = _index_entry(record)
+    latest_key = f"{record['digest']}/{record['period']}"
+    if record["date"] >= index["latest"].get(latest_key, ""):
+        index["latest"][latest_key] = record["date"]
+
+
+def get_summary(digest, period, day):
+    """Запись архива {"text", "model", "prompt_tokens", ...} или None."""
+    return _read_json(_entry_path(digest, period, day))
+
+
+def store_summary(digest, period, day, summary, citations=None):
+    """
+    Сохраняет сводку в архив и обновляет индекс. summary — SummaryResult из
+    src.news_bot_part или просто текст; citations — CitationReport из src.citations
+    (сколько раз процитировано каждое сообщение и итог проверки ссылок).
+    Возвращает запись архива.
+    """
+    record = {
+        "digest": digest,
+        "period": period,
+        "date": _date_str(day),
+        "text": getattr(summary, "text", summary),
+        "model": getattr(summary, "model", None),
+        "prompt_tokens": getattr(summary, "prompt_tokens", None),
+        "completion_tokens": getattr(summary, "completion_tokens", None),
+        "created_at": to_iso(utc_now()),
+        "sent_at": None,
+    }
+    if citations is not None:
+        record["citations"] = citations.counts
+        record["links"] = {"kept": citations.kept, "repaired": citations.repaired, "dropped": citations.dropped}
+    path = _entry_path(digest, period, day)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _write_json_atomic(path, record)
+    except Exception as e:
+        print(f"[WARN] Не удалось сохранить сводку в архив {path}: {e}")
+        return record
+    index = load_index()
+    _add_to_index(index, record)
+    _save_index(index)
+    print(f"[LOG] Сводка сохранена в архив: {path}")
+    return record
+
+
+def mark_no_news(digest, period, day):
+    """
+    Отмечает окно, за которое новостей не нашлось: запись с пустым текстом, без индекса.
+    Сводку за это окно она не заменяет — если сводка уже есть, ничего не делает.
+    """
+    path = _entry_path(digest, period, day)
+    if get_summary(digest, period, day) is not None:
+        return
+    record = {
+        "digest": digest,
+        "period": period,
+        "date": _date_str(day),
+        "text": "",
+        "no_news": True,
+        "created_at": to_iso(utc_now()),
+    }
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _write_json_atomic(path, record)
+    except Exception as e:
+        print(f"[WARN] Не удалось отметить окно без новостей {path}: {e}")
+
+
+def mark_sent(digest, period, day):
+    """Отмечает время рассылки сводки."""
+    record = get_summary(digest, period, day)
+    if record is None:
+        return
+    record["sent_at"] = to_iso(utc_now())
+    try:
+        _write_json_atomic(_entry_path(digest, period, day), record)
+    except Exception as e:
+        print(f"[WARN] Не удалось обновить запись архива: {e}")
+        return
+    index = load_index()
+    _add_to_index(index, record)
+    _save_index(index)
+
+
+def set_staging(digest, period, day, chat_id, message_ids):
+    """Запоминает сообщения сводки в служебном чате (рассылка копиями без повторной публикации)."""
+    record = get_summary(digest, period, day)
+    if record is None:
+        return
+    record["staging"] = {"chat_id": chat_id, "message_ids": list(message_ids)}
+    try:
+        _write_json_atomic(_entry_path(digest, period, day), record)
+    except Exception as e:
+        print(f"[WARN] Не удалось обновить запись архива: {e}")
+
+
+def latest_summary(digest, period="day"):
+    """Последняя (по дате окна) сводка дайджеста или None."""
+    day = load_index()["latest"].get(f"{digest}/{period}")
+    return get_summary(digest, period, day) if day else None
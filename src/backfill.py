@@ -0,0 +1,80 @@
+"""
+Сбор подписчиков из потока апдейтов Bot API.
+
+Используется двумя способами:
+- scripts/backfill_users_once.py — постранично читает getUpdates, после каждой страницы
+  дописывает новых пользователей в subscribers.json и сохраняет offset (можно прервать и продолжить);
+- scripts/get_users.py --backfill — тот же отбор применяется к апдейтам живого бота,
+  без остановки и без конкуренции за getUpdates.
+"""
+import json
+import os
+from datetime import datetime
+
+from src.paths import DATA_DIR
+from src.subscribers import add_subscriber_records
+
+
+BACKFILL_OFFSET_FILE = DATA_DIR / "backfill_updates.offset.json"
+
+
+def _now_str():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def subscriber_record_from_update(update):
+    """
+    Возвращает запись подписчика для личного текстового сообщения или None,
+    если апдейт под критерий не подходит.
+    """
+    msg = getattr(update, "message", None)
+    if not msg:
+        return None
+    if not getattr(msg, "text", None):
+        # Учитываем только текстовые сообщения
+        return None
+    chat = getattr(msg, "chat", None)
+    if not chat or getattr(chat, "type", None) != "private":
+        # Только личные диалоги
+        return None
+    user = getattr(msg, "from_user", None)
+    if not user:
+        return None
+    try:
+        uid = int(user.id)
+    except Exception:
+        return None
+    return {
+        "user_id": uid,
+        "username": user.username or "-",
+        "first_name": user.first_name or "-",
+        "last_name": user.last_name or "-",
+        "added_at": _now_str(),
+    }
+
+
+def store_update_senders(updates):
+    """
+    Дописывает отправителей из пачки апдейтов в subscribers.json одной записью.
+    Возвращает (кандидатов, добавлено).
+    """
+    records = [r for r in (subscriber_record_from_update(u) for u in updates) if r]
+    return len(records), add_subscriber_records(records)
+
+
+def load_backfill_offset():
+    if not BACKFILL_OFFSET_FILE.exists():
+        return None
+    try:
+        with open(BACKFILL_OFFSET_FILE, "r", encoding="utf-8") as f:
+            return json.load(f).get("offset")
+    except Exception as e:
+        print(f"[WARN] Ошибка чтения {BACKFILL_OFFSET_FILE}: {e}")
+        return None
+
+
+def save_backfill_offset(offset):
+    tmp_path = BACKFILL_OFFSET_FILE.with_name(BACKFILL_OFFSET_FILE.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"offset": offset, "saved_at": _now_str()}, f)
+    os.replace(tmp_path, BACKFILL_OFFSET_FILE)
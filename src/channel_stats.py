@@ -0,0 +1,178 @@
+"""
+Статистика каналов (channel_stats.json в DATA_DIR) и адаптивный сбор (CHANNEL_ADAPTIVE).
+
+На каждом ежедневном/недельном сборе для канала записывается запуск:
+  messages — сообщений в окне, text/media — из них с текстом и с медиа,
+  items    — сколько попало в новости (с текстом), latency — время чтения канала (с),
+  cited    — сколько его сообщений процитировано ссылками в итоговых сводках,
+  error    — чтение завершилось ошибкой.
+Хранятся последние MAX_RUNS запусков; по каналу также last_id — последнее прочитанное
+сообщение в окне.
+
+По этим данным (CHANNEL_ADAPTIVE=true) каналы с высокой долей процитированного читаются
+первыми, а «мёртвые» (успешные чтения без новостей) и «шумные» (новости есть, но ни одна
+не попала в сводку за последние запуски) — не чаще раза в CHANNEL_LOW_YIELD_DAYS дней.
+Запуски с ошибкой чтения (FloodWait, сеть) в статус не засчитываются. Пропуск не теряет
+сообщения: при следующем чтении канал читается с первого пропущенного дня (skipped_since)
+и только новее last_id (см. catch_up_plan).
+Отчёт для чистки channels.json — scripts/channel_report.py.
+"""
+import json
+import os
+from collections import Counter
+from datetime import date, timedelta
+
+import config
+from src.intraday import SOURCE_LINK_RE
+from src.paths import DATA_DIR
+from src.subscribers import parse_iso, to_iso, utc_now
+
+
+CHANNEL_STATS_FILE = DATA_DIR / "channel_stats.json"
+MAX_RUNS = 30
+STATUS_NEW = "new"
+STATUS_OK = "ok"
+STATUS_NOISY = "noisy"
+STATUS_DEAD = "dead"
+
+
+def load_channel_stats():
+    if not CHANNEL_STATS_FILE.exists():
+        return {}
+    try:
+        with open(CHANNEL_STATS_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except Exception as e:
+        print(f"[WARN] Ошибка чтения {CHANNEL_STATS_FILE}: {e}")
+        return {}
+
+
+def save_channel_stats(stats):
+    try:
+        tmp_path = CHANNEL_STATS_FILE.with_name(CHANNEL_STATS_FILE.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(stats, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, CHANNEL_STATS_FILE)
+    except Exception as e:
+        print(f"[WARN] Не удалось сохранить {CHANNEL_STATS_FILE}: {e}")
+
+
+def _recent(entry):
+    return entry.get("runs", [])[-config.CHANNEL_STATS_WINDOW:]
+
+
+def channel_status(entry):
+    """new — мало данных, dead — новостей нет, noisy — новости есть, но не цитируются, ok."""
+    runs = [run for run in _recent(entry or {}) if not run.get("error")]
+    if len(runs) < config.CHANNEL_MIN_RUNS:
+        return STATUS_NEW
+    if not sum(run.get("items", 0) for run in runs):
+        return STATUS_DEAD
+    if not sum(run.get("cited", 0) for run in runs):
+        return STATUS_NOISY
+    return STATUS_OK
+
+
+def channel_yield(entry):
+    """Доля процитированных новостей канала за последние запуски."""
+    runs = _recent(entry or {})
+    items = sum(run.get("items", 0) for run in runs)
+    return sum(run.get("cited", 0) for run in runs) / items if items else 0.0
+
+
+def plan_fetch(channels, stats, now=None):
+    """
+    Порядок и состав чтения: возвращает (каналы к чтению, пропущенные каналы).
+    Новые каналы и каналы с высоким выходом идут первыми; dead/noisy читаются,
+    только если с прошлого чтения прошло CHANNEL_LOW_YIELD_DAYS дней.
+    """
+    now = now or utc_now()
+    low_yield_after = timedelta(days=config.CHANNEL_LOW_YIELD_DAYS)
+    selected, skipped = [], []
+    for info in channels:
+        entry = stats.get(info["username"].lower())
+        status = channel_status(entry)
+        if status in (STATUS_DEAD, STATUS_NOISY):
+            last = parse_iso(entry.get("last_fetched"))
+            if last is not None and now - last < low_yield_after:
+                skipped.append(info)
+                continue
+        selected.append(info)
+
+    def priority(info):
+        entry = stats.get(info["username"].lower())
+        return channel_status(entry) != STATUS_NEW, -channel_yield(entry)
+
+    selected.sort(key=priority)
+    return selected, skipped
+
+
+def catch_up_plan(channels, stats):
+    """{username: (первый пропущенный день, last_id)} для читаемых сейчас каналов, которые пропускались."""
+    plan = {}
+    for info in channels:
+        key = info["username"].lower()
+        entry = stats.get(key) or {}
+        since = entry.get("skipped_since")
+        if since:
+            plan[key] = (date.fromisoformat(since), entry.get("last_id"))
+    return plan
+
+
+def record_fetch(stats, fetched, window, skipped=()):
+    """Записывает запуск для прочитанных каналов (fetched — {username: счётчики}) и отмечает пропущенные."""
+    now = to_iso(utc_now())
+    for username, counters in fetched.items():
+        entry = stats.setdefault(username, {})
+        run = dict(counters, at=now, window=window, cited=0)
+        last_id = run.pop("last_id", None)
+        entry["runs"] = (entry.get("runs", []) + [run])[-MAX_RUNS:]
+        if counters.get("error"):
+            # Пропущенные дни остаются недочитанными — догоним при следующем успешном чтении
+            continue
+        entry["last_fetched"] = now
+        if last_id:
+            entry["last_id"] = max(entry.get("last_id") or 0, last_id)
+        entry.pop("skipped_since", None)
+    for info in skipped:
+        entry = stats.setdefault(info["username"].lower(), {})
+        entry["skipped"] = entry.get("skipped", 0) + 1
+        entry.setdefault("skipped_since", window)
+
+
+def record_citations(stats, summary_text, window):
+    """Добавляет к последнему запуску каналов число их сообщений, процитированных в сводке."""
+    cited = Counter()
+    for username, _ in set(SOURCE_LINK_RE.findall(summary_text or "")):
+        cited[username.lower()] += 1
+    for username, count in cited.items():
+        runs = stats.get(username, {}).get("runs")
+        if runs and runs[-1].get("window") == window:
+            runs[-1]["cited"] = runs[-1].get("cited", 0) + count
+    return cited
+
+
+def channel_report(stats, usernames=None):
+    """Строки отчёта по каналам: средние за последние запуски, выход и статус."""
+    rows = []
+    for username in usernames if usernames is not None else sorted(stats):
+        entry = stats.get(username, {})
+        runs = _recent(entry)
+        count = len(runs) or 1
+        messages = sum(run.get("messages", 0) for run in runs)
+        rows.append({
+            "username": username,
+            "runs": len(runs),
+            "messages": round(messages / count, 1),
+            "text_ratio": round(sum(run.get("text", 0) for run in runs) / messages, 2) if messages else 0.0,
+            "media_ratio": round(sum(run.get("media", 0) for run in runs) / messages, 2) if messages else 0.0,
+            "latency": round(sum(run.get("latency", 0.0) for run in runs) / count, 2),
+            "items": sum(run.get("items", 0) for run in runs),
+            "cited": sum(run.get("cited", 0) for run in runs),
+            "yield": round(channel_yield(entry), 3),
+            "errors": sum(1 for run in runs if run.get("error")),
+            "skipped": entry.get("skipped", 0),
+            "status": channel_status(entry),
+        })
+    return rows
@@ -0,0 +1,172 @@
+"""
+Проверка ссылок в готовой сводке (CITATION_CHECK) — без дополнительных запросов к API.
+
+Промпт требует после каждого пункта ссылки (https://t.me/username/123), но модель может
+исказить username, ошибиться в id или выдумать ссылку. Индекс собранных сообщений
+{(username, id): новость} проверяет каждую ссылку за O(1):
+  - ссылка на собранное сообщение остаётся (username приводится к написанию канала);
+  - почти верная исправляется: username с опечаткой (расстояние правки до
+    MAX_USERNAME_DISTANCE) при существующем id, или верный канал с соседним id
+    (до MAX_ID_DISTANCE), если текст пункта совпадает с текстом этого сообщения;
+  - остальные удаляются, пустые скобки после них тоже.
+Для аналитики считается, сколько раз процитировано каждое сообщение; эти числа
+попадают в архив и в статистику каналов (src.channel_stats).
+"""
+import re
+from collections import Counter, namedtuple
+
+import config
+from src.intraday import SOURCE_LINK_RE
+
+
+MAX_USERNAME_DISTANCE = 2
+MAX_ID_DISTANCE = 3
+MIN_TEXT_OVERLAP = 2
+STEM_LENGTH = 6
+
+LINK_RE = re.compile(r"(?:https?://)?t\.me/([A-Za-z0-9_]+)/(\d+)")
+_WORD_RE = re.compile(r"[a-zа-яё0-9]+")
+
+CitationReport = namedtuple("CitationReport", ["kept", "repaired", "dropped", "counts"])
+
+
+def _stems(text):
+    return {w[:STEM_LENGTH] for w in _WORD_RE.findall(text.lower()) if len(w) > 3}
+
+
+def _edit_distance(a, b, limit):
+    """Расстояние Левенштейна, но не больше limit + 1 (дальше считать незачем)."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class CitationIndex:
+    """
+    Индекс собранных сообщений: (username в нижнем регистре, id) → номер новости в items.
+    Тексты не копируются: для исправления соседнего id нужная новость читается из items
+    (в том числе из SpoolView, см. src.spool).
+    """
+
+    def __init__(self, items=(), links_text=""):
+        self.items = items
+        self.messages = {}
+        self.usernames = {}
+        self.ids_by_channel = {}
+        for position, item in enumerate(items):
+            match = SOURCE_LINK_RE.search(item.rpartition("Источник:")[2])
+            if match:
+                self._add(match.group(1), int(match.group(2)), position)
+        # Источники, известные только по ссылкам (например, ежедневные сводки для недельной)
+        for username, message_id in SOURCE_LINK_RE.findall(links_text):
+            if (username.lower(), int(message_id)) not in self.messages:
+                self._add(username, int(message_id), None)
+
+    def _text(self, ref):
+        position = self.messages[ref]
+        return "" if position is None else self.items[position].rpartition("Источник:")[0]
+
+    def _add(self, username, message_id, position):
+        key = username.lower()
+        self.messages[(key, message_id)] = position
+        self.usernames.setdefault(key, username)
+        self.ids_by_channel.setdefault(key, []).append(message_id)
+
+    def __contains__(self, ref):
+        return ref in self.messages
+
+    def __len__(self):
+        return len(self.messages)
+
+    def link(self, key, message_id):
+        return f"https://t.me/{self.usernames[key]}/{message_id}"
+
+    def _similar_username(self, key, message_id):
+        candidates = [
+            other for other in self.usernames
+            if (other, message_id) in self.messages
+            and _edit_distance(key, other, MAX_USERNAME_DISTANCE) <= MAX_USERNAME_DISTANCE
+        ]
+        return candidates[0] if len(candidates) == 1 else None
+
+    def _nearby_id(self, key, message_id, context):
+        nearby = [i for i in self.ids_by_channel.get(key, ()) if abs(i - message_id) <= MAX_ID_DISTANCE]
+        if not nearby:
+            return None
+        stems = _stems(context)
+        scored = [(len(stems & _stems(self._text((key, i)))), i) for i in nearby]
+        overlap, best = max(scored)
+        return best if overlap >= MIN_TEXT_OVERLAP else None
+
+    def resolve(self, username, message_id, context=""):
+        """Ссылка на собранное сообщение: (key, id, исправлена ли) или None."""
+        key = username.lower()
+        if (key, message_id) in self.messages:
+            return key, message_id, username != self.usernames[key]
+        similar = self._similar_username(key, message_id)
+        if similar is not None:
+            return similar, message_id, True
+        if key in self.ids_by_channel:
+            nearby = self._nearby_id(key, message_id, context)
+            if nearby is not None:
+                return key, nearby, True
+        return None
+
+
+def check_citations(text, index):
+    """Проверяет ссылки сводки по индексу. Возвращает (текст, CitationReport)."""
+    kept = repaired = dropped = 0
+    counts = Counter()
+    lines = []
+    for line in text.splitlines():
+        context = LINK_RE.sub("", line)
+        seen = set()
+
+        def replace(match):
+            nonlocal kept, repaired, dropped
+            resolved = index.resolve(match.group(1), int(match.group(2)), context)
+            if resolved is None:
+                dropped += 1
+                return ""
+            key, message_id, fixed = resolved
+            if (key, message_id) in seen:
+                # Исправление могло свести две ссылки пункта к одной
+                return ""
+            seen.add((key, message_id))
+            repaired += fixed
+            kept += not fixed
+            counts[f"{index.usernames[key]}/{message_id}"] += 1
+            return index.link(key, message_id)
+
+        new_line = LINK_RE.sub(replace, line)
+        if new_line != line:
+            # Разделители на месте удалённых ссылок: «(, a)», «(a, , b)», «(a,)», «(,)»
+            new_line = re.sub(r"([,;])(?:\s*[,;])+", r"\1", new_line)
+            new_line = re.sub(r"\(\s*[,;]\s*", "(", new_line)
+            new_line = re.sub(r"\s*[,;]\s*\)", ")", new_line)
+            new_line = re.sub(r"\(\s*\)", "", new_line)
+            new_line = re.sub(r"\(\s+", "(", re.sub(r"\s+\)", ")", new_line))
+            new_line = re.sub(r"[ \t]{2,}", " ", new_line).rstrip()
+        lines.append(new_line)
+    return "\n".join(lines), CitationReport(kept, repaired, dropped, dict(counts))
+
+
+def verify_summary(result, items=(), links_text="", tag=""):
+    """
+    Проверка ссылок SummaryResult по собранным новостям items (или ссылкам из links_text).
+    Возвращает (SummaryResult с исправленным текстом, CitationReport или None, если CITATION_CHECK выключен).
+    """
+    if not config.CITATION_CHECK:
+        return result, None
+    text, report = check_citations(result.text, CitationIndex(items, links_text))
+    if report.repaired or report.dropped:
+        print(f"[LOG] {tag}Ссылки: верных {report.kept}, исправлено {report.repaired}, удалено {report.dropped}")
+    return result._replace(text=text), report
@@ -0,0 +1,145 @@
+"""
+Извлекающее сжатие новостей перед суммаризацией (EXTRACTIVE_COMPRESS).
+
+Большинство каналов пишут длинные посты, а для дайджеста важны первые предложения и
+факты. Каждая новость длиннее COMPRESS_TARGET_CHARS сокращается до этой длины на CPU,
+без модели: текст делится на предложения (src.sentences — русский и английский, с учётом
+сокращений, инициалов и дробных чисел), у каждого предложения считается
+  центральность — сходство с «центром» своей новости (TextRank в один шаг: вместо
+                  итераций по графу — сумма сходств со всеми предложениями новости);
+  позиция       — лид-предложения важнее (LEAD_WEIGHT / (1 + номер));
+  факты         — числа, имена, латиница и аббревиатуры (INFO_WEIGHT за каждый, до трёх).
+Первое содержательное предложение остаётся всегда, остальные добираются по убыванию
+веса до целевой длины и выводятся в исходном порядке. Призывы подписаться («Подпишитесь на
+канал», «подписывайтесь»), хэштеги и голые ссылки отбрасываются; обычные глаголы остаются —
+«Реал подпишет контракт с Мбаппе до 2029 года.» не реклама. Строка «Источник: ...» сохраняется как есть — на неё
+опираются ссылки сводки и их проверка (src.citations).
+
+Эмбеддинги предложений — те же локальные, что у индекса историй (src.story_index.embed),
+и считаются одной матрицей на пачку из COMPRESS_BATCH новостей. numpy нужен только здесь;
+модуль импортируется лениво, когда сжатие включено.
+"""
+import re
+
+import numpy as np
+
+import config
+from src.sentences import split_sentences
+from src.spool import SpoolView
+from src.story_index import embed
+
+
+COMPRESS_BATCH = 2000
+LEAD_WEIGHT = 0.6
+INFO_WEIGHT = 0.15
+MAX_INFO = 3
+
+_NUMBER_RE = re.compile(r"\d")
+# Имя — слово с заглавной не в начале предложения; латиница и аббревиатуры (GPT-5, ЦБ, NVIDIA)
+_NAME_RE = re.compile(r"(?<=[\s(«\"])(?:[A-ZА-ЯЁ][a-zа-яё]+|[A-ZА-ЯЁ]{2,}[\w-]*)|\b[A-Za-z][\w-]*[A-Za-z0-9]\b")
+_NOISE_RE = re.compile(
+    r"^\W*подпиш(?:ись|итесь)\b|подписывайтесь|подписаться\s+на\s+(?:наш\s+)?канал|\berid\b|^реклама\b"
+    r"|^\W*#\w+(?:\W+#\w+)*\W*$|^\W*(?:https?://\S+\W*)+$",
+    re.IGNORECASE,
+)
+
+
+def _split_item(item):
+    """(текст, хвост «\\nИсточник: ...» или пустая строка)."""
+    body, marker, source = item.rpartition("\nИсточник:")
+    if not marker:
+        return item, ""
+    return body, marker + source
+
+
+def _truncate(text, target):
+    """Не длиннее target символов, по границе слова."""
+    if len(text) <= target:
+        return text
+    return text[:target].rsplit(" ", 1)[0].rstrip(",;:—-") + "…"
+
+
+def _info(sentence):
+    return len(_NUMBER_RE.findall(sentence)) + len(_NAME_RE.findall(sentence))
+
+
+def _compress_batch(bodies, target):
+    """Сжимает тексты пачки: предложения всех текстов — одна матрица эмбеддингов."""
+    sentences, owners, positions = [], [], []
+    for owner, body in enumerate(bodies):
+        for position, sentence in enumerate(s for s in split_sentences(body) if not _NOISE_RE.search(s)):
+            sentences.append(sentence)
+            owners.append(owner)
+            positions.append(position)
+    if not sentences:
+        return [_truncate(body, target) for body in bodies]
+
+    vectors = embed(sentences)
+    owners = np.asarray(owners)
+    # Центр новости — сумма векторов её предложений; сходство с ним = сумма сходств со всеми
+    centers = np.zeros((len(bodies), vectors.shape[1]), dtype=np.float32)
+    np.add.at(centers, owners, vectors)
+    centrality = np.einsum("ij,ij->i", vectors, centers[owners])
+    counts = np.bincount(owners, minlength=len(bodies))
+    centrality = centrality / np.maximum(counts[owners], 1)
+    info = np.minimum([_info(s) for s in sentences], MAX_INFO)
+    scores = centrality + LEAD_WEIGHT / (1.0 + np.asarray(positions)) + INFO_WEIGHT * info
+
+    compressed = []
+    start = 0
+    for owner, count in enumerate(counts):
+        indexes = range(start, start + count)
+        start += count
+        if not count:
+            compressed.append(_truncate(bodies[owner], target))
+            continue
+        lead = indexes[0]
+        chosen, length = {lead}, len(sentences[lead])
+        for i in sorted(indexes[1:], key=lambda i: -scores[i]):
+            if length + 1 + len(sentences[i]) <= target:
+                chosen.add(i)
+                length += 1 + len(sentences[i])
+        compressed.append(_truncate(" ".join(sentences[i] for i in sorted(chosen)), target))
+    return compressed
+
+
+def compress_items(items, target=None):
+    """
+    Новости, сокращённые до target символов текста (по умолчанию COMPRESS_TARGET_CHARS).
+    Короткие не меняются. Для SpoolView (src.spool) результат пачками дописывается в тот же
+    буфер, и в памяти остаётся не больше COMPRESS_BATCH новостей.
+    """
+    target = target or config.COMPRESS_TARGET_CHARS
+    spool = items.spool if isinstance(items, SpoolView) else None
+    result, views = [], []
+    before = after = count = 0
+    batch = []
+
+    def flush():
+        nonlocal after
+        long_items = [(i, body) for i, (body, source) in enumerate(batch) if len(body) > target]
+        texts = dict(zip((i for i, _ in long_items), _compress_batch([body for _, body in long_items], target)))
+        after += sum(len(texts.get(i, body)) for i, (body, _) in enumerate(batch))
+        if spool is not None and not texts:
+            # Пачка без длинных новостей — берём её из буфера как есть, без копии
+            views.append(items[count - len(batch):count])
+        else:
+            chunk = [texts.get(i, body) + source for i, (body, source) in enumerate(batch)]
+            if spool is not None:
+                views.append(spool.extend(chunk))
+            else:
+                result.extend(chunk)
+        batch.clear()
+
+    for item in items:
+        body, source = _split_item(item)
+        before += len(body)
+        count += 1
+        batch.append((body, source))
+        if len(batch) >= COMPRESS_BATCH:
+            flush()
+    if batch:
+        flush()
+    if before:
+        print(f"[LOG] Сжатие новостей: {count} шт., {before} → {after} символов ({after / before:.0%})")
+    return spool.concat(views) if spool is not None else result
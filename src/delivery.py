@@ -0,0 +1,142 @@
+"""
+Доставка сообщений подписчикам и типизированные результаты доставки.
+
+Каждая попытка доставки заканчивается одним из исходов OUTCOME_*; рассылка отдаёт их
+потоком (async generator), а хранилище подписчиков обновляет статусы по мере поступления.
+
+telegram импортируется лениво: константы исходов нужны и лёгким командам.
+"""
+import asyncio
+from collections import namedtuple
+
+
+OUTCOME_OK = "ok"
+OUTCOME_BLOCKED = "blocked"
+OUTCOME_CHAT_NOT_FOUND = "chat_not_found"
+OUTCOME_DEACTIVATED = "deactivated"
+OUTCOME_TRANSIENT = "transient"
+
+DeliveryOutcome = namedtuple("DeliveryOutcome", ["user_id", "outcome", "message_ids", "error"])
+
+
+def retry_after_seconds(exc):
+    value = getattr(exc, "retry_after", 1)
+    if hasattr(value, "total_seconds"):
+        return value.total_seconds()
+    return float(value)
+
+
+def classify_delivery_error(exc):
+    """Сопоставляет исключение Bot API одному из исходов OUTCOME_*."""
+    from telegram.error import BadRequest, Forbidden
+
+    error_msg = str(exc).lower()
+    if isinstance(exc, Forbidden):
+        if "deactivated" in error_msg:
+            return OUTCOME_DEACTIVATED
+        if "blocked" in error_msg:
+            return OUTCOME_BLOCKED
+        return OUTCOME_TRANSIENT
+    if isinstance(exc, BadRequest) and "chat not found" in error_msg:
+        return OUTCOME_CHAT_NOT_FOUND
+    return OUTCOME_TRANSIENT
+
+
+async def _call_with_retry(factory, retries=1):
+    """Выполняет запрос, при RetryAfter ждёт указанное время и повторяет."""
+    from telegram.error import RetryAfter
+
+    for attempt in range(retries + 1):
+        try:
+            return await factory()
+        except RetryAfter as e:
+            if attempt >= retries:
+                raise
+            await asyncio.sleep(retry_after_seconds(e))
+
+
+def part_texts(chunks):
+    """Тексты частей в том виде, в каком они уходят пользователю ("Часть i/n" при нескольких)."""
+    total = len(chunks)
+    if total == 1:
+        return list(chunks)
+    return [f"Часть {idx+1}/{total}\n\n{chunk}" for idx, chunk in enumerate(chunks)]
+
+
+def staging_chat_id(value):
+    """TARGET_CHAT_ID: числовой id ("-100...") или @username; пусто — None."""
+    value = str(value or "").strip()
+    if not value:
+        return None
+    return int(value) if value.lstrip("-").isdigit() else value
+
+
+async def stage_chunks(bot, chat_id, chunks):
+    """
+    Публикует части сводки один раз в служебный чат/канал (для рассылки копиями).
+    Возвращает message_id частей или None, если опубликовать не удалось.
+    """
+    message_ids = []
+    try:
+        for text in part_texts(chunks):
+            result = await _call_with_retry(lambda: bot.send_message(chat_id=chat_id, text=text))
+            message_ids.append(result.message_id)
+    except Exception as e:
+        print(f"[WARN] Не удалось опубликовать сводку в служебный чат {chat_id}: {e}")
+        return None
+    return message_ids
+
+
+async def broadcast_copies(bot, recipients, from_chat_id, message_ids, chunks=None, on_sent=None,
+                           forward=False, pause=0.05, limiter=None):
+    """
+    Рассылка уже опубликованных в from_chat_id сообщений: один вызов copyMessages
+    (или forwardMessages при forward=True) на пользователя со всеми частями сразу —
+    текст не загружается заново для каждого получателя. Отдаёт DeliveryOutcome на пользователя.
+    """
+    texts = part_texts(chunks) if chunks else [None] * len(message_ids)
+    for user_id in recipients:
+        try:
+            if limiter is not None:
+                await limiter.acquire()
+            method = bot.forward_messages if forward else bot.copy_messages
+            result = await _call_with_retry(
+                lambda: method(chat_id=user_id, from_chat_id=from_chat_id, message_ids=message_ids)
+            )
+        except Exception as e:
+            yield DeliveryOutcome(user_id, classify_delivery_error(e), [], str(e))
+            continue
+        sent_ids = [item.message_id for item in result]
+        if on_sent is not None:
+            for message_id, text in zip(sent_ids, texts):
+                on_sent(user_id, message_id, text or "")
+        yield DeliveryOutcome(user_id, OUTCOME_OK, sent_ids, None)
+        if limiter is None:
+            await asyncio.sleep(pause)
+
+
+async def broadcast(bot, recipients, chunks, on_sent=None, pause=0.1, limiter=None):
+    """
+    Отправляет части сообщения каждому получателю и отдаёт DeliveryOutcome на пользователя.
+    on_sent(user_id, message_id, text) вызывается после каждой успешно отправленной части.
+    limiter (src.ratelimit.AsyncRateLimiter) — ограничение частоты вместо фиксированной паузы.
+    """
+    texts = part_texts(chunks)
+    for user_id in recipients:
+        message_ids = []
+        try:
+            for part_text in texts:
+                if limiter is not None:
+                    await limiter.acquire()
+                result = await _call_with_retry(
+                    lambda: bot.send_message(chat_id=user_id, text=part_text)
+                )
+                message_ids.append(result.message_id)
+                if on_sent is not None:
+                    on_sent(user_id, result.message_id, part_text)
+                if limiter is None:
+                    await asyncio.sleep(pause)
+        except Exception as e:
+            yield DeliveryOutcome(user_id, classify_delivery_error(e), message_ids, str(e))
+            continue
+        yield DeliveryOutcome(user_id, OUTCOME_OK, message_ids, None)
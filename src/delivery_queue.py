@@ -0,0 +1,235 @@
+"""
+Очередь доставки сводок (DELIVERY_MODE=queue) — delivery_queue.sqlite3 в DATA_DIR.
+
+Сводка собирается один раз и лежит в архиве (src.archive); в очередь ставится по строке
+на получателя со временем доставки due_at:
+  - подписчику с предпочтением (/time в боте: delivery_time "HH:MM" и tz в subscriber_state.json)
+    — ближайшее это время в его поясе; если сегодня оно уже прошло — завтра в это время;
+  - остальным — равномерно в течение DELIVERY_SPREAD_MINUTES (смещение по user_id).
+Воркер (scripts/service.py или scripts/deliver_queue.py из cron) отправляет наступившие
+строки с частотой DELIVERY_RATE_PER_SEC, так что нагрузка на Bot API размазана, а не
+приходится на одну минуту. Повторная постановка той же сводки тому же получателю
+игнорируется (UNIQUE), временные ошибки повторяются с растущей паузой.
+"""
+import asyncio
+import sqlite3
+import uuid
+from datetime import datetime, time, timedelta
+
+import config
+from src.archive import get_summary
+from src.delivery import OUTCOME_OK, OUTCOME_TRANSIENT
+from src.paths import DATA_DIR
+from src.ratelimit import AsyncRateLimiter
+from src.subscribers import (
+    apply_delivery_outcome, is_active, load_subscriber_state, parse_iso, save_delivery_outcomes, to_iso, utc_now,
+)
+from src.timezones import digest_timezone, parse_timezone
+
+
+DELIVERY_QUEUE_FILE = DATA_DIR / "delivery_queue.sqlite3"
+STALE_CLAIM_MINUTES = 10
+
+STATUS_PENDING = "pending"
+STATUS_SENDING = "sending"
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+STATUS_SKIPPED = "skipped"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS deliveries (
+    id INTEGER PRIMARY KEY,
+    digest TEXT NOT NULL,
+    period TEXT NOT NULL,
+    window TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    due_at TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    claim TEXT,
+    claimed_at TEXT,
+    error TEXT,
+    UNIQUE (digest, period, window, user_id)
+);
+CREATE INDEX IF NOT EXISTS deliveries_due ON deliveries (status, due_at);
+"""
+
+
+def connect(path=None):
+    conn = sqlite3.connect(str(path or DELIVERY_QUEUE_FILE), timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def delivery_due_at(user_id, entry, now, spread_minutes=None):
+    """Момент доставки для подписчика (UTC) по его предпочтениям из subscriber_state."""
+    spread_minutes = config.DELIVERY_SPREAD_MINUTES if spread_minutes is None else spread_minutes
+    preferred = (entry or {}).get("delivery_time")
+    if preferred:
+        try:
+            tz = parse_timezone(entry.get("tz")) if entry.get("tz") else digest_timezone()
+            hours, _, minutes = preferred.partition(":")
+            local_now = now.astimezone(tz)
+            candidate = datetime.combine(local_now.date(), time(int(hours), int(minutes or 0)), tzinfo=tz)
+            if candidate < local_now:
+                # Очередь постоянная: сводка дождётся выбранного часа, а не уйдёт сразу
+                candidate += timedelta(days=1)
+            return candidate.astimezone(now.tzinfo)
+        except ValueError as e:
+            print(f"[WARN] Неверное время доставки у user_id={user_id}: {e}")
+    spread_seconds = max(0, int(spread_minutes) * 60)
+    return now + timedelta(seconds=abs(int(user_id)) % spread_seconds if spread_seconds else 0)
+
+
+def enqueue_digest(digest, period, window, recipients, state=None, now=None):
+    """
+    Ставит сводку (digest, period, window — ключ архива) в очередь для recipients.
+    Возвращает количество новых строк (уже поставленные пропускаются).
+    """
+    state = load_subscriber_state() if state is None else state
+    now = now or utc_now()
+    window = window if isinstance(window, str) else window.isoformat()
+    rows = [
+        (digest, period, window, int(uid), to_iso(delivery_due_at(uid, state.get(str(uid)), now)))
+        for uid in recipients
+    ]
+    with connect() as conn:
+        before = conn.total_changes
+        conn.executemany(
+            "INSERT OR IGNORE INTO deliveries (digest, period, window, user_id, due_at) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+        return conn.total_changes - before
+
+
+def claim_due(conn, now, limit):
+    """Атомарно забирает до limit наступивших строк (и зависшие после сбоя)."""
+    claim = uuid.uuid4().hex
+    stale_before = to_iso(now - timedelta(minutes=STALE_CLAIM_MINUTES))
+    with conn:
+        conn.execute(
+            """
+            UPDATE deliveries SET status = ?, claim = ?, claimed_at = ?
+            WHERE id IN (
+                SELECT id FROM deliveries
+                WHERE (status = ? AND due_at <= ?) OR (status = ? AND claimed_at <= ?)
+                ORDER BY due_at LIMIT ?
+            )
+            """,
+            (STATUS_SENDING, claim, to_iso(now), STATUS_PENDING, to_iso(now), STATUS_SENDING, stale_before, limit),
+        )
+    return conn.execute("SELECT * FROM deliveries WHERE claim = ? ORDER BY due_at", (claim,)).fetchall()
+
+
+def _finish(conn, row, status, error=None):
+    conn.execute(
+        "UPDATE deliveries SET status = ?, error = ?, attempts = attempts + 1, claim = NULL WHERE id = ?",
+        (status, error, row["id"]),
+    )
+
+
+def _retry(conn, row, now, error):
+    attempts = row["attempts"] + 1
+    if attempts >= config.DELIVERY_MAX_ATTEMPTS:
+        _finish(conn, row, STATUS_FAILED, error)
+        return
+    due_at = now + timedelta(minutes=2 ** attempts)
+    conn.execute(
+        "UPDATE deliveries SET status = ?, due_at = ?, error = ?, attempts = ?, claim = NULL WHERE id = ?",
+        (STATUS_PENDING, to_iso(due_at), error, attempts, row["id"]),
+    )
+
+
+async def deliver_due(bot, limit=500, rate=None, limiter=None):
+    """
+    Отправляет наступившие доставки (не больше limit за вызов). Возвращает счётчики исходов.
+    Статусы подписчиков обновляются так же, как при обычной рассылке.
+    """
+    from src.news_bot_part import deliver_summary, split_message, stage_summary
+
+    limiter = limiter or AsyncRateLimiter(config.DELIVERY_RATE_PER_SEC if rate is None else rate)
+    now = utc_now()
+    conn = connect()
+    try:
+        rows = claim_due(conn, now, limit)
+        if not rows:
+            return {}
+        state = load_subscriber_state()
+        changed = []
+        counts = {}
+        groups = {}
+        for row in rows:
+            groups.setdefault((row["digest"], row["period"], row["window"]), []).append(row)
+
+        for (digest, period, window), group in groups.items():
+            record = get_summary(digest, period, window)
+            if not record or not record.get("text"):
+                print(f"[WARN] Сводки {digest}/{period}/{window} нет в архиве — доставка пропущена")
+                with conn:
+                    for row in group:
+                        _finish(conn, row, STATUS_FAILED, "summary not found")
+                counts[STATUS_FAILED] = counts.get(STATUS_FAILED, 0) + len(group)
+                continue
+            chunks = split_message(record["text"])
+            # Рассылка копиями: сводка публикуется в служебный чат один раз на все пачки очереди
+            staged = await stage_summary(bot, chunks, (digest, period, window))
+            by_user = {}
+            for row in group:
+                if is_active(state, row["user_id"]):
+                    by_user[row["user_id"]] = row
+                else:
+                    with conn:
+                        _finish(conn, row, STATUS_SKIPPED, "inactive")
+                    counts[STATUS_SKIPPED] = counts.get(STATUS_SKIPPED, 0) + 1
+
+            async for outcome in deliver_summary(bot, list(by_user), chunks, staged=staged, limiter=limiter):
+                row = by_user[outcome.user_id]
+                counts[outcome.outcome] = counts.get(outcome.outcome, 0) + 1
+                with conn:
+                    if outcome.outcome == OUTCOME_OK:
+                        _finish(conn, row, STATUS_SENT)
+                    elif outcome.outcome == OUTCOME_TRANSIENT:
+                        _retry(conn, row, utc_now(), outcome.error)
+                    else:
+                        _finish(conn, row, STATUS_FAILED, outcome.error)
+                if apply_delivery_outcome(state, outcome):
+                    changed.append(outcome)
+
+        save_delivery_outcomes(changed)
+        print(f"[LOG] Очередь доставки: {counts}")
+        return counts
+    finally:
+        conn.close()
+
+
+def next_due_at():
+    with connect() as conn:
+        row = conn.execute(
+            "SELECT MIN(due_at) AS due_at FROM deliveries WHERE status = ?", (STATUS_PENDING,)
+        ).fetchone()
+    return parse_iso(row["due_at"]) if row else None
+
+
+async def run_delivery_worker(bot, stop_event, poll_seconds=30):
+    """Отправляет доставки по мере наступления, пока не установлен stop_event."""
+    limiter = AsyncRateLimiter(config.DELIVERY_RATE_PER_SEC)
+    while not stop_event.is_set():
+        try:
+            counts = await deliver_due(bot, limiter=limiter)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[ERROR] Очередь доставки: {e}")
+            counts = {}
+        if counts:
+            # Пачка отправлена — сразу проверяем, не наступили ли следующие
+            continue
+        due = next_due_at()
+        delay = poll_seconds
+        if due is not None:
+            delay = min(poll_seconds, max(1.0, (due - utc_now()).total_seconds()))
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
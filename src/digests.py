@@ -0,0 +1,135 @@
+"""
+Реестр дайджестов: какие папки/каналы собирать, каким промптом, по какому расписанию и кому слать.
+
+Описание берётся из digests.json (DIGESTS_FILE, см. digests.example.json):
+
+    {"digests": [
+        {"name": "tech", "folder": "GPT", "channels_file": "channels.json", "prompt": "general",
+         "schedule": {"day": "09:00", "week": "sun 10:00"}, "audience": "all"},
+        {"name": "sport", "folder": "Sport", "channels_file": "channels_sport.json", "prompt": "sport",
+         "schedule": {"day": "09:30"}, "audience": {"file": "subscribers_sport.json"}}
+    ]}
+
+audience: "all" — все активные подписчики; список user_id; {"file": путь} — user_id из
+файла в формате subscribers.json. Если digests.json нет, реестр строится из config
+(FOLDER_NAME, SCHEDULE_*) — как раньше: general и sport.
+"""
+import json
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+
+import config
+from src.paths import ROOT_DIR, resolve_data_path
+
+
+DIGESTS_FILE = Path(getattr(config, "DIGESTS_FILE", "digests.json"))
+if not DIGESTS_FILE.is_absolute():
+    DIGESTS_FILE = ROOT_DIR / DIGESTS_FILE
+
+PERIODS = ("day", "week", "intraday")
+
+
+@dataclass(frozen=True)
+class Digest:
+    name: str
+    folder: str
+    channels_file: Path = None  # None — channels.json в DATA_DIR
+    prompt: str = "general"
+    schedule: dict = field(default_factory=dict)  # период ("day"/"week"/"intraday") → "HH:MM" / "sun HH:MM" / "every 2h"
+    audience: object = "all"
+
+
+def _schedule(spec):
+    return {period: value for period, value in spec.items() if value}
+
+
+def _default_digests():
+    return [
+        Digest(
+            name="general",
+            folder=config.FOLDER_NAME,
+            prompt="general",
+            schedule=_schedule({"day": config.SCHEDULE_DAILY, "week": config.SCHEDULE_WEEKLY}),
+        ),
+        Digest(
+            name="sport",
+            folder="Sport",
+            channels_file=resolve_data_path("channels_sport.json"),
+            prompt="sport",
+            schedule=_schedule({"day": config.SCHEDULE_SPORT}),
+        ),
+    ]
+
+
+def _digest_from_dict(raw):
+    name = raw.get("name")
+    if not name:
+        raise ValueError(f"У дайджеста нет name: {raw}")
+    schedule = _schedule(raw.get("schedule") or {})
+    unknown = set(schedule) - set(PERIODS)
+    if unknown:
+        raise ValueError(f"Дайджест {name}: неизвестные периоды в schedule: {sorted(unknown)}")
+    channels_file = raw.get("channels_file")
+    return Digest(
+        name=name,
+        folder=raw.get("folder") or config.FOLDER_NAME,
+        channels_file=resolve_data_path(channels_file) if channels_file else None,
+        prompt=raw.get("prompt", "general"),
+        schedule=schedule,
+        audience=raw.get("audience", "all"),
+    )
+
+
+def load_digests(path=None):
+    """Возвращает {name: Digest} в порядке объявления."""
+    path = Path(path) if path else DIGESTS_FILE
+    if not path.exists():
+        digests = _default_digests()
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        digests = [_digest_from_dict(raw) for raw in data.get("digests", [])]
+    registry = {}
+    for digest in digests:
+        if digest.name in registry:
+            raise ValueError(f"Дайджест {digest.name} объявлен дважды в {path}")
+        registry[digest.name] = digest
+    return registry
+
+
+def get_digest(name, registry=None):
+    registry = registry if registry is not None else load_digests()
+    if name not in registry:
+        raise ValueError(f"Неизвестный дайджест {name!r}. Доступные: {', '.join(registry) or '-'}")
+    return registry[name]
+
+
+def with_overrides(digest, folder=None, channels_file=None, prompt=None):
+    """Копия дайджеста с переопределёнными из командной строки полями."""
+    changes = {}
+    if folder:
+        changes["folder"] = folder
+    if channels_file:
+        changes["channels_file"] = resolve_data_path(channels_file)
+    if prompt:
+        changes["prompt"] = prompt
+    return replace(digest, **changes) if changes else digest
+
+
+def resolve_audience(digest):
+    """None — все активные подписчики, иначе список user_id."""
+    audience = digest.audience
+    if audience in (None, "all"):
+        return None
+    if isinstance(audience, (list, tuple)):
+        return [int(uid) for uid in audience]
+    if isinstance(audience, dict) and audience.get("file"):
+        path = resolve_data_path(audience["file"])
+        if not path.exists():
+            print(f"[WARN] Файл аудитории {path} для дайджеста {digest.name} не найден")
+            return []
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return [item["user_id"] for item in data.get("subscribers", []) if "user_id" in item]
+    raise ValueError(f"Дайджест {digest.name}: неподдерживаемый audience {audience!r}")
+
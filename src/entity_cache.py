@@ -0,0 +1,114 @@
+"""
+Кэш сущностей Telethon между запусками (anon_news.entities.json рядом с сессией).
+
+Хранит username → id/access_hash каналов и отметку о проверенном аккаунте сессии.
+Сбор новостей получает готовые InputPeer, поэтому обычный запуск не делает
+ResolveUsername и get_me() и меньше рискует упереться в FloodWait.
+"""
+import json
+import os
+
+from src.paths import DATA_DIR
+from src.subscribers import to_iso, utc_now
+
+
+ENTITY_CACHE_FILE = DATA_DIR / "anon_news.entities.json"
+
+
+def load_entity_cache():
+    if not ENTITY_CACHE_FILE.exists():
+        return {"me": None, "channels": {}}
+    try:
+        with open(ENTITY_CACHE_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return {"me": data.get("me"), "channels": data.get("channels", {}) or {}}
+    except Exception as e:
+        print(f"[WARN] Ошибка чтения {ENTITY_CACHE_FILE}: {e}")
+        return {"me": None, "channels": {}}
+
+
+def save_entity_cache(cache):
+    try:
+        tmp_path = ENTITY_CACHE_FILE.with_name(ENTITY_CACHE_FILE.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, ENTITY_CACHE_FILE)
+    except Exception as e:
+        print(f"[WARN] Не удалось сохранить кэш сущностей {ENTITY_CACHE_FILE}: {e}")
+
+
+def remember_me(cache, me):
+    cache["me"] = {"id": me.id, "checked_at": to_iso(utc_now())}
+
+
+def _entry_from_channel_info(info):
+    """Запись кэша из элемента channels.json (там уже есть id и access_hash канала)."""
+    if info.get("_") != "Channel" or not info.get("id") or info.get("access_hash") is None:
+        return None
+    return {"id": int(info["id"]), "access_hash": int(info["access_hash"]), "type": "channel"}
+
+
+def _entry_from_input_peer(peer):
+    channel_id = getattr(peer, "channel_id", None)
+    if channel_id is not None:
+        return {"id": channel_id, "access_hash": peer.access_hash, "type": "channel"}
+    chat_id = getattr(peer, "chat_id", None)
+    if chat_id is not None:
+        return {"id": chat_id, "type": "chat"}
+    return None
+
+
+def _input_peer_from_entry(entry):
+    from telethon.tl.types import InputPeerChannel, InputPeerChat
+
+    if entry.get("type") == "channel":
+        return InputPeerChannel(channel_id=entry["id"], access_hash=entry["access_hash"])
+    if entry.get("type") == "chat":
+        return InputPeerChat(chat_id=entry["id"])
+    return None
+
+
+async def resolve_channel_peers(client, channels):
+    """
+    Возвращает {username: InputPeer} для каналов. Сначала используется кэш и данные
+    из channels.json, по сети разрешаются только отсутствующие; кэш сохраняется,
+    если в нём что-то изменилось.
+    """
+    cache = load_entity_cache()
+    known = cache["channels"]
+    changed = False
+    peers = {}
+    for info in channels:
+        username = info.get("username")
+        if not username:
+            continue
+        key = username.lower()
+        entry = _entry_from_channel_info(info)
+        if entry and known.get(key) != entry:
+            known[key] = entry
+            changed = True
+        entry = known.get(key)
+        if entry is None:
+            try:
+                peer = await client.get_input_entity(username)
+            except Exception as e:
+                print(f"[WARN] Не удалось разрешить @{username}: {e}")
+                continue
+            entry = _entry_from_input_peer(peer)
+            if entry is None:
+                continue
+            known[key] = entry
+            changed = True
+        peer = _input_peer_from_entry(entry)
+        if peer is not None:
+            peers[username] = peer
+    if changed:
+        save_entity_cache(cache)
+    return peers
+
+
+def forget_channel(username):
+    """Удаляет запись из кэша (например, если access_hash перестал подходить)."""
+    cache = load_entity_cache()
+    if cache["channels"].pop(username.lower(), None) is not None:
+        save_entity_cache(cache)
@@ -1,7 +1,5 @@
 import json
 
-from telethon.tl.functions.messages import GetDialogFiltersRequest
-
 from src.paths import DATA_DIR
 
 
@@ -27,6 +25,8 @@ def serialize_for_json(obj):
 
 
 async def get_channels_fullinfo_from_folder(client, folder_name, output_path=None):
+    from telethon.tl.functions.messages import GetDialogFiltersRequest
+
     filters_resp = await client(GetDialogFiltersRequest())
     filters = None
     for attr in ['results', 'filters', 'dialog_filters']:
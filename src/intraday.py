@@ -0,0 +1,104 @@
+"""
+Состояние внутридневных обновлений (run_daily.py --intraday) — intraday_state.json.
+
+Для каждого дайджеста хранится на текущий день (в поясе DIGEST_TIMEZONE):
+  high_water — {username: id последнего учтённого сообщения}: следующее обновление читает
+               только сообщения новее (min_id), а не весь день заново;
+  covered    — пункты, уже разосланные сегодня: передаются в промпт, чтобы новое
+               обновление не повторяло истории из предыдущих;
+  updates    — сколько обновлений уже было.
+С наступлением нового дня состояние дайджеста начинается заново.
+"""
+import json
+import os
+import re
+
+from src.paths import DATA_DIR
+
+
+INTRADAY_STATE_FILE = DATA_DIR / "intraday_state.json"
+MAX_COVERED_ITEMS = 80
+COVERED_ITEM_LENGTH = 200
+
+SOURCE_LINK_RE = re.compile(r"https://t\.me/([A-Za-z0-9_]+)/(\d+)")
+_BULLET_PREFIXES = ("•", "-", "*", "–", "—")
+
+
+def load_intraday_state():
+    if not INTRADAY_STATE_FILE.exists():
+        return {}
+    try:
+        with open(INTRADAY_STATE_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except Exception as e:
+        print(f"[WARN] Ошибка чтения {INTRADAY_STATE_FILE}: {e}")
+        return {}
+
+
+def save_intraday_state(state):
+    try:
+        tmp_path = INTRADAY_STATE_FILE.with_name(INTRADAY_STATE_FILE.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, INTRADAY_STATE_FILE)
+    except Exception as e:
+        print(f"[WARN] Не удалось сохранить {INTRADAY_STATE_FILE}: {e}")
+
+
+def digest_day_state(state, digest_name, day):
+    """Состояние дайджеста за день day; вчерашнее сбрасывается."""
+    entry = state.get(digest_name)
+    if not entry or entry.get("date") != day.isoformat():
+        entry = {"date": day.isoformat(), "high_water": {}, "covered": [], "updates": 0}
+        state[digest_name] = entry
+    return entry
+
+
+def message_ref(item):
+    """(username в нижнем регистре, id) из строки-источника новости или None."""
+    match = SOURCE_LINK_RE.search(item.rsplit("Источник:", 1)[-1])
+    if not match:
+        return None
+    return match.group(1).lower(), int(match.group(2))
+
+
+def newer_than(items, high_water):
+    """Новости, которые новее high-water mark своего канала."""
+    fresh = []
+    for item in items:
+        ref = message_ref(item)
+        if ref is None or ref[1] > high_water.get(ref[0], 0):
+            fresh.append(item)
+    return fresh
+
+
+def advance_high_water(high_water, channels):
+    """
+    Продвигает отметки по счётчикам чтения каналов ({username: счётчики} из
+    collect_digest_news(report=...)): last_id учитывает и сообщения без текста, поэтому канал
+    только с медиа не перечитывается с начала дня. Каналы с ошибкой чтения не продвигаются —
+    сообщения читаются от новых к старым, и недочитанные старые иначе потерялись бы.
+    """
+    for username, counters in channels.items():
+        last_id = counters.get("last_id")
+        if last_id and not counters.get("error") and last_id > high_water.get(username, 0):
+            high_water[username] = last_id
+
+
+def covered_items(summary_text):
+    """Пункты сводки без ссылок — для списка «уже было сегодня»."""
+    items = []
+    for line in summary_text.splitlines():
+        line = line.strip()
+        if not line.startswith(_BULLET_PREFIXES):
+            continue
+        text = SOURCE_LINK_RE.sub("", line.lstrip("".join(_BULLET_PREFIXES)).strip())
+        text = re.sub(r"\(\s*\)", "", text).strip()
+        if text:
+            items.append(text[:COVERED_ITEM_LENGTH])
+    return items
+
+
+def remember_covered(entry, summary_text):
+    entry["covered"] = (entry["covered"] + covered_items(summary_text))[-MAX_COVERED_ITEMS:]
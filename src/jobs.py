@@ -0,0 +1,249 @@
+"""
+Задания конвейера (PIPELINE_JOBS) — jobs.sqlite3 в DATA_DIR.
+
+Запуск рассылки дайджеста за окно — одно задание с ключом идемпотентности
+"<дайджест>/<период>/<дата окна>" и этапами collect → summarize → render → deliver.
+После каждого этапа сохраняется контрольная точка:
+  collect   — собранные новости (jsonl в DATA_DIR/jobs), чтобы не читать каналы заново;
+              только полный сбор (все каналы прочитаны без ошибок), файл удаляется, когда
+              задание выполнено;
+  summarize — ключ сводки в архиве (src.archive);
+  render    — готовые части сообщения;
+  deliver   — исходы доставки по пользователям (job_deliveries): повтор не шлёт тем,
+              кому уже доставлено, и повторяет только временные ошибки.
+Ошибка этапа повторяется до JOB_MAX_ATTEMPTS раз с растущей паузой (JOB_RETRY_SECONDS·2^n).
+Если попытки кончились, задание помечается failed. Следующий запуск (cron, сервис или
+вручную) продолжит с этого этапа и возьмёт готовые результаты прошлых. Выполненное задание
+повторно не рассылается; начать заново — run_daily.py --rerun. Задания старше
+JOB_RETENTION_DAYS удаляются (prune_jobs).
+"""
+import asyncio
+import json
+import os
+import re
+import sqlite3
+from datetime import timedelta
+
+import config
+from src.paths import DATA_DIR
+from src.subscribers import to_iso, utc_now
+
+
+JOBS_DB_FILE = DATA_DIR / "jobs.sqlite3"
+JOBS_DIR = DATA_DIR / "jobs"
+
+STAGE_COLLECT = "collect"
+STAGE_SUMMARIZE = "summarize"
+STAGE_RENDER = "render"
+STAGE_DELIVER = "deliver"
+STAGES = (STAGE_COLLECT, STAGE_SUMMARIZE, STAGE_RENDER, STAGE_DELIVER)
+
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    key TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    period TEXT NOT NULL,
+    window TEXT NOT NULL,
+    status TEXT NOT NULL,
+    stage TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    job_key TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    output TEXT,
+    finished_at TEXT NOT NULL,
+    PRIMARY KEY (job_key, stage)
+);
+CREATE TABLE IF NOT EXISTS job_deliveries (
+    job_key TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    outcome TEXT NOT NULL,
+    PRIMARY KEY (job_key, user_id)
+);
+"""
+
+
+def connect(path=None):
+    conn = sqlite3.connect(str(path or JOBS_DB_FILE), timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def job_key(digest, period, window):
+    window = window if isinstance(window, str) else window.isoformat()
+    return f"{digest}/{period}/{window}"
+
+
+class StageFailed(Exception):
+    """Этап не удался после всех попыток; задание продолжится со следующего запуска."""
+
+
+class Job:
+    def __init__(self, digest, period, window, restart=False):
+        self.digest = digest
+        self.period = period
+        self.window = window if isinstance(window, str) else window.isoformat()
+        self.key = job_key(digest, period, self.window)
+        now = to_iso(utc_now())
+        with connect() as conn:
+            if restart:
+                self._reset(conn)
+            conn.execute(
+                "INSERT OR IGNORE INTO jobs (key, digest, period, window, status, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.key, digest, period, self.window, STATUS_RUNNING, now, now),
+            )
+            row = conn.execute("SELECT * FROM jobs WHERE key = ?", (self.key,)).fetchone()
+        self.status = row["status"]
+        self.stage = row["stage"]
+        self.attempts = row["attempts"]
+
+    def _reset(self, conn):
+        conn.execute("DELETE FROM jobs WHERE key = ?", (self.key,))
+        conn.execute("DELETE FROM checkpoints WHERE job_key = ?", (self.key,))
+        conn.execute("DELETE FROM job_deliveries WHERE job_key = ?", (self.key,))
+        self._drop_news()
+
+    @property
+    def done(self):
+        return self.status == STATUS_DONE
+
+    def _update(self, **fields):
+        fields["updated_at"] = to_iso(utc_now())
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with connect() as conn:
+            conn.execute(f"UPDATE jobs SET {columns} WHERE key = ?", (*fields.values(), self.key))
+        self.status = fields.get("status", self.status)
+        self.stage = fields.get("stage", self.stage)
+
+    # Контрольные точки
+
+    def checkpoint(self, stage):
+        """Результат завершённого этапа (JSON) или None, если этап ещё не выполнен."""
+        with connect() as conn:
+            row = conn.execute(
+                "SELECT output FROM checkpoints WHERE job_key = ? AND stage = ?", (self.key, stage)
+            ).fetchone()
+        return None if row is None else json.loads(row["output"])
+
+    def complete(self, stage, output=None):
+        with connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (job_key, stage, output, finished_at) VALUES (?, ?, ?, ?)",
+                (self.key, stage, json.dumps(output, ensure_ascii=False), to_iso(utc_now())),
+            )
+        if stage == STAGES[-1]:
+            self._update(status=STATUS_DONE, stage=stage, error=None)
+            # Выполненное задание не продолжается — собранные новости больше не нужны
+            self._drop_news()
+        else:
+            self._update(status=STATUS_RUNNING, stage=stage, error=None)
+
+    def fail(self, stage, error):
+        self.attempts += 1
+        self._update(status=STATUS_FAILED, error=f"{stage}: {error}", attempts=self.attempts)
+
+    def _news_path(self):
+        return _news_path(self.key)
+
+    def _drop_news(self):
+        _news_path(self.key).unlink(missing_ok=True)
+
+    def save_news(self, news):
+        """Контрольная точка collect: новости построчно в jsonl (пишутся потоком)."""
+        JOBS_DIR.mkdir(parents=True, exist_ok=True)
+        path = self._news_path()
+        tmp_path = path.with_name(path.name + ".tmp")
+        count = 0
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for item in news:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+                count += 1
+        os.replace(tmp_path, path)
+        self.complete(STAGE_COLLECT, {"path": path.name, "count": count})
+
+    def load_news(self, spool=None):
+        """Новости из контрольной точки collect (в spool, если он передан) или None."""
+        output = self.checkpoint(STAGE_COLLECT)
+        if output is None:
+            return None
+        path = JOBS_DIR / output["path"]
+        if not path.exists():
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            items = (json.loads(line) for line in f)
+            return spool.extend(items) if spool is not None else list(items)
+
+    # Доставка
+
+    def delivered_users(self):
+        with connect() as conn:
+            rows = conn.execute("SELECT user_id FROM job_deliveries WHERE job_key = ?", (self.key,)).fetchall()
+        return {row["user_id"] for row in rows}
+
+    def record_delivery(self, outcome):
+        """Окончательный исход доставки пользователю (временные ошибки не записываются)."""
+        with connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO job_deliveries (job_key, user_id, outcome) VALUES (?, ?, ?)",
+                (self.key, int(outcome.user_id), outcome.outcome),
+            )
+
+
+def _news_path(key):
+    return JOBS_DIR / (re.sub(r"[^A-Za-z0-9_.-]+", "_", key) + ".jsonl")
+
+
+def prune_jobs(days=None):
+    """Удаляет задания, не обновлявшиеся дольше days (JOB_RETENTION_DAYS) дней, с их контрольными точками."""
+    days = config.JOB_RETENTION_DAYS if days is None else days
+    cutoff = to_iso(utc_now() - timedelta(days=days))
+    with connect() as conn:
+        keys = [row["key"] for row in conn.execute("SELECT key FROM jobs WHERE updated_at < ?", (cutoff,))]
+        for key in keys:
+            conn.execute("DELETE FROM jobs WHERE key = ?", (key,))
+            conn.execute("DELETE FROM checkpoints WHERE job_key = ?", (key,))
+            conn.execute("DELETE FROM job_deliveries WHERE job_key = ?", (key,))
+    for key in keys:
+        _news_path(key).unlink(missing_ok=True)
+    if keys:
+        print(f"[LOG] Удалено старых заданий: {len(keys)}")
+    return len(keys)
+
+
+def retry_delay(attempt):
+    return config.JOB_RETRY_SECONDS * (2 ** (attempt - 1))
+
+
+async def run_stage(job, stage, factory, tag=""):
+    """
+    Выполняет этап: await factory(), при ошибке — повтор с паузой, до JOB_MAX_ATTEMPTS раз.
+    После последней неудачи задание помечается failed и бросается StageFailed.
+    job — Job, None (вне заданий) или список заданий, если этап у них общий (сбор каналов
+    нескольких дайджестов за один проход).
+    """
+    jobs = [j for j in (job if isinstance(job, (list, tuple)) else [job]) if j is not None]
+    attempts = max(1, config.JOB_MAX_ATTEMPTS)
+    for attempt in range(1, attempts + 1):
+        try:
+            return await factory()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if attempt == attempts:
+                for failed in jobs:
+                    failed.fail(stage, e)
+                raise StageFailed(f"этап {stage}: {e}") from e
+            delay = retry_delay(attempt)
+            print(f"[WARN] {tag}Этап {stage} не удался ({e}), повтор {attempt + 1}/{attempts} через {delay:.0f} с")
+            await asyncio.sleep(delay)
+
@@ -0,0 +1,261 @@
+"""
+Бэкенды суммаризации (LLM_BACKENDS) и выбор между ними.
+
+Раньше каждый запрос шёл в OpenAI (gpt-4.1-mini), и медленный или упёршийся в лимиты API
+задерживал всю рассылку. Теперь запрос уходит одному из бэкендов:
+  openai     — OpenAI Chat Completions (OPENAI_MODEL);
+  local      — любой OpenAI-совместимый сервер (llama.cpp, vLLM, Ollama) по LOCAL_LLM_URL;
+  extractive — без модели: первое предложение каждой новости со ссылкой на источник.
+               Детерминированный запасной вариант, когда модели недоступны.
+Порядок в LLM_BACKENDS — приоритет. Бэкенд, упавший с ошибкой, откладывается на
+LLM_COOLDOWN_SECONDS. Бэкенд, чьё среднее время ответа выше LLM_SLOW_SECONDS, уходит в конец
+очереди. У каждого бэкенда свой лимит одновременных запросов: если он занят, запрос берёт
+следующий свободный, а если заняты все — ждёт первый по приоритету. extractive используется
+только когда ответить не смог ни один другой бэкенд. Запросы отдельных разделов
+(src.sections — этап «map») можно направить на дешёвые или быстрые бэкенды через LLM_MAP_BACKENDS.
+Время ответа и откладывания хранятся в памяти процесса: в сервисе (scripts/service.py) они
+накапливаются между запусками, в cron — действуют внутри одного запуска.
+"""
+import re
+import threading
+from abc import ABC, abstractmethod
+import time
+from collections import namedtuple
+
+import config
+from src.sentences import split_sentences
+
+
+# Текст сводки и метаданные запроса для архива (src.archive)
+SummaryResult = namedtuple("SummaryResult", ["text", "model", "prompt_tokens", "completion_tokens"])
+
+ROLE_REDUCE = "reduce"
+ROLE_MAP = "map"
+LATENCY_SMOOTHING = 0.3
+EXTRACTIVE_CHARS_PER_TOKEN = 3
+EXTRACTIVE_MAX_SENTENCE = 300
+
+_LINK_RE = re.compile(r"https?://t\.me/[A-Za-z0-9_]+/\d+")
+
+
+class Backend(ABC):
+    """Бэкенд с лимитом одновременных запросов, средним временем ответа и откладыванием после ошибки."""
+
+    fallback = False
+
+    def __init__(self, name, model, concurrency=1):
+        self.name = name
+        self.model = model
+        self._slots = threading.BoundedSemaphore(max(1, concurrency))
+        self._lock = threading.Lock()
+        self.latency = None
+        self.failures = 0
+        self.cooldown_until = 0.0
+
+    def available(self, now):
+        return now >= self.cooldown_until
+
+    def slow(self):
+        return self.latency is not None and self.latency > config.LLM_SLOW_SECONDS
+
+    def acquire(self, blocking=True):
+        return self._slots.acquire(blocking=blocking)
+
+    def release(self):
+        self._slots.release()
+
+    def record(self, elapsed=None, error=None):
+        with self._lock:
+            if error is not None:
+                self.failures += 1
+                self.cooldown_until = time.monotonic() + config.LLM_COOLDOWN_SECONDS
+                return
+            self.failures = 0
+            self.cooldown_until = 0.0
+            if self.latency is None:
+                self.latency = elapsed
+            else:
+                self.latency += LATENCY_SMOOTHING * (elapsed - self.latency)
+
+    @abstractmethod
+    def complete(self, prompt_system, text, max_tokens):
+        """SummaryResult ответа на запрос; ошибка — исключение (роутер переходит к следующему бэкенду)."""
+
+
+class OpenAIBackend(Backend):
+    """OpenAI или OpenAI-совместимый сервер (base_url). Клиент один на бэкенд — пул соединений переиспользуется."""
+
+    def __init__(self, name, model, api_key, base_url=None, concurrency=1):
+        super().__init__(name, model, concurrency)
+        self.api_key = api_key
+        self.base_url = base_url
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            import openai
+
+            self._client = openai.OpenAI(
+                api_key=self.api_key, base_url=self.base_url or None, timeout=config.LLM_TIMEOUT_SECONDS
+            )
+        return self._client
+
+    def complete(self, prompt_system, text, max_tokens):
+        response = self._get_client().chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": prompt_system},
+                {"role": "user", "content": text}
+            ],
+            max_tokens=max_tokens,
+            temperature=0.35
+        )
+        usage = getattr(response, "usage", None)
+        return SummaryResult(
+            text=(response.choices[0].message.content or "").strip(),
+            model=getattr(response, "model", None) or self.model,
+            prompt_tokens=getattr(usage, "prompt_tokens", None),
+            completion_tokens=getattr(usage, "completion_tokens", None),
+        )
+
+
+def _extract_points(text):
+    """Пункты (текст, ссылки) из входа запроса: новостей «...Источник: ссылка» или готовых сводок с «•»."""
+    for block in re.split(r"\n\s*\n", text):
+        bullets = [line.strip() for line in block.splitlines() if line.strip().startswith("•")]
+        if bullets:
+            for line in bullets:
+                links = _LINK_RE.findall(line)
+                yield re.sub(r"\(\s*\)", "", _LINK_RE.sub("", line.lstrip("• "))).strip(), links
+            continue
+        body, _, source = block.rpartition("Источник:") if "Источник:" in block else (block, "", "")
+        links = _LINK_RE.findall(source)
+        sentences = split_sentences(body)
+        if sentences and links:
+            yield sentences[0], links
+
+
+class ExtractiveBackend(Backend):
+    """Без модели: первое предложение каждой новости со ссылкой, в порядке входа и до лимита ответа."""
+
+    fallback = True
+
+    def __init__(self, name="extractive"):
+        super().__init__(name, "extractive", concurrency=1)
+
+    def acquire(self, blocking=True):
+        return True
+
+    def release(self):
+        pass
+
+    def complete(self, prompt_system, text, max_tokens):
+        budget = max_tokens * EXTRACTIVE_CHARS_PER_TOKEN
+        lines, seen = [], set()
+        for sentence, links in _extract_points(text):
+            sentence = sentence[:EXTRACTIVE_MAX_SENTENCE].rstrip()
+            if not sentence or sentence.lower() in seen:
+                continue
+            seen.add(sentence.lower())
+            line = f"• {sentence} ({' '.join(links[:3])})"
+            budget -= len(line) + 1
+            if budget < 0:
+                break
+            lines.append(line)
+        return SummaryResult(text="\n".join(lines), model=self.model, prompt_tokens=0, completion_tokens=0)
+
+
+def build_backend(name):
+    if name == "openai":
+        return OpenAIBackend(name, config.OPENAI_MODEL, config.openai_api_key, concurrency=config.OPENAI_CONCURRENCY)
+    if name == "local":
+        if not config.LOCAL_LLM_URL:
+            print("[WARN] LLM_BACKENDS содержит local, но LOCAL_LLM_URL не задан — бэкенд пропущен")
+            return None
+        return OpenAIBackend(
+            name, config.LOCAL_LLM_MODEL, config.LOCAL_LLM_API_KEY or "local", base_url=config.LOCAL_LLM_URL,
+            concurrency=config.LOCAL_LLM_CONCURRENCY,
+        )
+    if name == "extractive":
+        return ExtractiveBackend(name)
+    print(f"[WARN] Неизвестный бэкенд суммаризации в LLM_BACKENDS: {name}")
+    return None
+
+
+class Router:
+    """Выбор бэкенда для запроса: приоритет, здоровье, время ответа и свободные слоты."""
+
+    def __init__(self, backends, map_names=()):
+        self.backends = list(backends)
+        self.map_names = list(map_names)
+
+    def candidates(self, role=ROLE_REDUCE):
+        now = time.monotonic()
+        models = [b for b in self.backends if not b.fallback]
+        if role == ROLE_MAP and self.map_names:
+            preferred = [b for name in self.map_names for b in models if b.name == name]
+            models = preferred + [b for b in models if b not in preferred]
+        ranked = sorted(models, key=lambda b: (not b.available(now), b.slow()))
+        return ranked + [b for b in self.backends if b.fallback]
+
+    def _acquire(self, candidates):
+        """
+        Первый свободный бэкенд с моделью среди здоровых (не отложенных после ошибки);
+        если заняты все — ждём первый здоровый (candidates уже упорядочены: медленные в конце).
+        Отложенные — только когда здоровых не осталось, запасной — последним.
+        """
+        now = time.monotonic()
+        models = [b for b in candidates if not b.fallback] or candidates
+        healthy = [b for b in models if b.available(now)] or models
+        for backend in healthy:
+            if backend.acquire(blocking=False):
+                return backend
+        healthy[0].acquire()
+        return healthy[0]
+
+    def complete(self, prompt_system, text, max_tokens=1600, role=ROLE_REDUCE):
+        candidates = self.candidates(role)
+        if not candidates:
+            raise RuntimeError("Нет ни одного бэкенда суммаризации (LLM_BACKENDS)")
+        last_error = None
+        while candidates:
+            backend = self._acquire(candidates)
+            candidates.remove(backend)
+            started = time.monotonic()
+            try:
+                result = backend.complete(prompt_system, text, max_tokens)
+            except Exception as e:
+                backend.record(error=e)
+                last_error = e
+                if candidates:
+                    print(f"[WARN] Бэкенд {backend.name} не ответил ({e}), пробуем {candidates[0].name}")
+                continue
+            finally:
+                backend.release()
+            backend.record(elapsed=time.monotonic() - started)
+            if backend.fallback:
+                print(f"[WARN] Сводка собрана без модели (бэкенд {backend.name})")
+            return result
+        raise last_error
+
+
+def _split_names(value):
+    return [name.strip().lower() for name in (value or "").split(",") if name.strip()]
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    """Один набор бэкендов на процесс: клиенты, лимиты и время ответа общие для всех запросов."""
+    global _router
+    with _router_lock:
+        if _router is None:
+            backends = [b for b in map(build_backend, _split_names(config.LLM_BACKENDS) or ["openai"]) if b]
+            _router = Router(backends, _split_names(config.LLM_MAP_BACKENDS))
+    return _router
+
+
+def complete(prompt_system, text, max_tokens=1600, role=ROLE_REDUCE):
+    return get_router().complete(prompt_system, text, max_tokens=max_tokens, role=role)
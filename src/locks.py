@@ -0,0 +1,33 @@
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from src.paths import DATA_DIR
+
+
+# Процесс, который держит бота (get_users.py или service.py): второй экземпляр
+# конфликтовал бы с первым за getUpdates/webhook
+BOT_LOCK_FILE = DATA_DIR / "bot.lock"
+
+
+class LockBusy(RuntimeError):
+    """Блокировка уже захвачена другим процессом."""
+
+
+@contextmanager
+def file_lock(path):
+    """Эксклюзивная неблокирующая файловая блокировка (flock). На Windows не действует."""
+    with open(path, "a") as lock_file:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError as e:
+                raise LockBusy(f"Блокировка {path} занята другим процессом") from e
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
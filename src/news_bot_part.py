@@ -1,211 +1,91 @@
+# openai (в src.llm), telethon и telegram импортируются лениво — внутри функций, которым они нужны,
+# чтобы лёгкие команды (например, run_daily.py --channels или --news) не платили за их загрузку.
 import asyncio
-import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from pathlib import Path
 
-import openai
-from telethon import TelegramClient
-from telegram import Bot
-from telegram.error import TelegramError, Forbidden, BadRequest
-
-import config
-from config import api_id, api_hash, telegram_bot_token, openai_api_key, FOLDER_NAME, DEBUG_MODE, DEBUG_USER_IDS
+from config import (
+    api_id, api_hash, telegram_bot_token, FOLDER_NAME, DEBUG_MODE, BROADCAST_MODE, TARGET_CHAT_ID,
+    SECTION_CONCURRENCY, SECTION_MIN_ITEMS, SECTION_ROUTING, EXTRACTIVE_COMPRESS,
+)
+from src.archive import get_summary, set_staging, store_summary
+from src.delivery import (
+    OUTCOME_BLOCKED, OUTCOME_CHAT_NOT_FOUND, OUTCOME_DEACTIVATED, OUTCOME_TRANSIENT, broadcast, broadcast_copies,
+    stage_chunks, staging_chat_id,
+)
+from src.entity_cache import forget_channel
 from src.get_channels import get_channels_fullinfo_from_folder, load_channels_from_json
-from src.paths import DATA_DIR, resolve_data_path
+from src.llm import ROLE_MAP, SummaryResult, complete as _complete
+from src.paths import DATA_DIR
+from src.prompts import period_note, stable_prompt
+from src.sections import assemble_sections, route_items
+from src.subscribers import (
+    apply_delivery_outcome, filter_debug_recipients, is_active, load_active_subscriber_ids,
+    load_subscriber_state, save_delivery_outcomes,
+)
+from src.timezones import digest_timezone
 
 
-DEFAULT_SUBSCRIBERS_FILE = DATA_DIR / "subscribers.json"
-SUBSCRIBERS_FILE = resolve_data_path(getattr(config, "SUBSCRIBERS_FILE", DEFAULT_SUBSCRIBERS_FILE))
 SENT_MESSAGES_LOG = DATA_DIR / "sent_messages.log"
-SUMMARIES_LOG_FILE = DATA_DIR / "sent_summaries.log"
 TELEGRAM_MAX_MESSAGE_LENGTH = 4096
 
 
-def load_subscribers():
-    if not SUBSCRIBERS_FILE.exists():
-        print("[WARN] Файл с подписчиками не найден, список пуст")
-        return []
-    try:
-        with open(SUBSCRIBERS_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            return [item['user_id'] for item in data.get('subscribers', []) if 'user_id' in item]
-    except Exception as e:
-        print(f"[ERROR] Ошибка чтения {SUBSCRIBERS_FILE}: {e}")
-        return []
-
-
-def get_day_range(target_date=None):
+def get_day_range(target_date=None, tz=None):
+    """Границы дня target_date (по умолчанию вчера) в поясе сводок DIGEST_TIMEZONE."""
+    tz = tz or digest_timezone()
     if target_date is None:
-        today = datetime.now(timezone.utc).date()
+        today = datetime.now(tz).date()
         target_date = today - timedelta(days=1)
-    start = datetime.combine(target_date, datetime.min.time(), tzinfo=timezone.utc)
-    end = start + timedelta(days=1)
+    start = datetime.combine(target_date, datetime.min.time(), tzinfo=tz)
+    end = datetime.combine(target_date + timedelta(days=1), datetime.min.time(), tzinfo=tz)
     return start, end
 
 
-def get_week_range(target_date=None):
+def get_week_range(target_date=None, tz=None):
     """Возвращает диапазон дат за последние 7 дней (до target_date включительно)"""
-    today = datetime.now(timezone.utc).date()
+    tz = tz or digest_timezone()
+    today = datetime.now(tz).date()
     end_date = target_date or today
-    start = datetime.combine(end_date - timedelta(days=7), datetime.min.time(), tzinfo=timezone.utc)
-    end = datetime.combine(end_date, datetime.min.time(), tzinfo=timezone.utc)
+    start = datetime.combine(end_date - timedelta(days=7), datetime.min.time(), tzinfo=tz)
+    end = datetime.combine(end_date, datetime.min.time(), tzinfo=tz)
     return start, end
 
 
-def _build_prompt(period, target_date, prompt_type):
-    # Определяем диапазон дат в зависимости от периода
+def _period_note(period, target_date):
+    """Период и дата сводки — переменная часть промпта, идёт в самом конце."""
     if period == 'week':
         start, end = get_week_range(target_date=target_date)
-        date_str = f"{start.strftime('%Y-%m-%d')} - {end.strftime('%Y-%m-%d')}"
-        period_text = "неделю"
-    else:
-        start, end = get_day_range(target_date=target_date)
-        date_str = start.strftime("%Y-%m-%d")
-        period_text = "день"
+        return period_note("неделю", f"{start.strftime('%Y-%m-%d')} - {end.strftime('%Y-%m-%d')}", start.tzname() or "UTC")
+    start, _ = get_day_range(target_date=target_date)
+    return period_note("день", start.strftime("%Y-%m-%d"), start.tzname() or "UTC")
 
-    if prompt_type == "sport":
-        return f"""
-Ты — спортивный редактор новостной рассылки. Составь лаконичную, структурированную сводку спортивных новостей за {period_text} ({date_str}, UTC) из предоставленных фрагментов.
 
-## ОСНОВНЫЕ ТРЕБОВАНИЯ
-
-1. ЯЗЫК И СТИЛЬ:
-   - Русский язык, нейтральный деловой стиль
-   - Без эмоций, оценочных суждений и фанатских комментариев
-   - Короткие предложения, активный залог
-   - Термины и сокращения расшифровывай при первом упоминании (если не общеизвестны)
-
-2. СТРУКТУРА СВОДКИ (выводи только разделы, без преамбул и заключений):
-
-   **Главное**
-   - 3–6 наиболее важных новостей дня
-   - Приоритет: результаты ключевых матчей, важные травмы, официальные заявления, значимые санкции
-   - Формат: 1–3 факта на пункт, без воды
-
-   **Матчи и результаты** (только если есть релевантные новости)
-   - Итоги матчей, турниров, этапов
-   - Указывай счёт/результат и турнир/лигe
-
-   **Трансферы и контракты** (только если есть релевантные новости)
-   - Официальные переходы, продления, аренды, отступные
-   - Не включай слухи без подтверждения
-
-   **Остальное кратко**
-   - Прочие спортивные новости (статистика, расписания, регламент, дисциплинарные решения)
-   - Формат: буллеты по 1–2 строки
-
-3. ОБРАБОТКА ИСТОЧНИКОВ:
-   - После каждого пункта укажи 1–3 телеграм-ссылки в формате: (https://t.me/username/123)
-   - Ссылки разделяй пробелом, сохраняй исходные t.me ссылки без изменений
-   - Если несколько источников про одно событие — объединяй в один пункт, укажи 2–3 ссылки
-   - Приоритет: ссылки на первоисточники, официальные каналы
-
-4. ОБЪЕДИНЕНИЕ ДУБЛИКАТОВ:
-   - Если несколько фрагментов про одно событие — создай один пункт
-   - Выбери наиболее полную информацию из всех источников
-   - Укажи ссылки на все релевантные источники (до 3)
-   - Избегай повторений одной и той же новости в разных разделах
-
-5. ФИЛЬТРАЦИЯ КОНТЕНТА:
-   - ИГНОРИРУЙ: рекламу, опросы, призывы подписаться, эмодзи, декоративное оформление
-   - ИГНОРИРУЙ: инсайды и слухи без подтверждения, мнения без фактов
-   - ВКЛЮЧАЙ: официальные заявления, результаты, статистику, санкции, подтверждённые трансферы
-
-6. ОБЪЁМ И ФОРМАТ:
-   - Без вводных фраз типа "За сегодня произошло...", без заключений
-   - Только разделы и пункты в указанном формате
-   - Если раздел пуст — не выводи его
-
-7. ПРИОРИТИЗАЦИЯ:
-   - Сначала анализируй все новости и определяй наиболее важные
-   - В "Главное" попадают события с наибольшим влиянием
-   - Внутри раздела сортируй по важности (самое важное — первым)
-
-## ФОРМАТ ВЫВОДА
-
-Главное
-• [Текст новости] (https://t.me/channel1/123)
-• [Текст новости] (https://t.me/channel2/456 https://t.me/channel3/789)
-
-Матчи и результаты
-• [Команда A — команда B 2:1, Лига/турнир] (https://t.me/channel4/101)
-
-Трансферы и контракты
-• [Игрок X перешёл в клуб Y, контракт до 2028] (https://t.me/channel5/202)
-
-Остальное кратко
-• [Краткая новость] (https://t.me/channel6/303)
-"""
-
-    return f"""
-Ты — профессиональный редактор новостной рассылки. Составь лаконичную, структурированную сводку новостей за {period_text} ({date_str}, UTC) из предоставленных фрагментов.
-
-## ОСНОВНЫЕ ТРЕБОВАНИЯ
-
-1. ЯЗЫК И СТИЛЬ:
-   - Русский язык, нейтральный деловой стиль
-   - Избегай эмоциональных оценок, субъективных комментариев
-   - Используй активный залог, короткие предложения
-   - Технические термины и аббревиатуры расшифровывай при первом упоминании (если не общеизвестны)
-
-2. СТРУКТУРА СВОДКИ (выводи только разделы, без преамбул и заключений):
-
-   **Главное**
-   - 3–6 наиболее важных новостей дня
-   - Приоритет: события с широким влиянием, прорывы, значимые объявления
-   - Формат: 1–3 ключевых факта на пункт, без воды
-   - Пример: "Компания X запустила сервис Y в 10 странах. Доступен с 1 марта, стоимость от $Z. (https://t.me/channel/123)"
-
-   **AI/ML** (только если есть релевантные новости)
-   - 2–6 новостей об искусственном интеллекте, машинном обучении, нейросетях
-   - Можно чуть подробнее, но без излишней детализации
-   - Включай: новые модели, исследования, продукты, инструменты, регуляцию
-
-   **Остальное кратко**
-   - Прочие новости, не вошедшие в "Главное" и "AI/ML"
-   - Формат: буллеты по 1–2 строки
-   - Приоритет: технологические, научные, бизнес-новости
+def _build_prompt(period, target_date, prompt_type, mode=None, section=None):
+    """
+    Системный промпт: неизменная часть из шаблонов (src.prompts, побайтно одинакова
+    между запусками — попадает в кэш префикса у провайдера) и период в конце.
+    """
+    return stable_prompt(prompt_type, mode, section) + _period_note(period, target_date)
+
+
+def _build_rollup_prompt(target_date, prompt_type):
+    """Промпт недельной сводки из готовых ежедневных: те же формат и разделы, что и у обычной."""
+    return _build_prompt(period='week', target_date=target_date, prompt_type=prompt_type, mode="rollup")
+
 
-3. ОБРАБОТКА ИСТОЧНИКОВ:
-   - После каждого пункта укажи 1–3 телеграм-ссылки в формате: (https://t.me/username/123)
-   - Ссылки разделяй пробелом, сохраняй исходные t.me ссылки без изменений
-   - Если несколько источников про одно событие — объединяй в один пункт, укажи 2–3 ссылки
-   - Приоритет: ссылки на первоисточники, официальные каналы
-
-4. ОБЪЕДИНЕНИЕ ДУБЛИКАТОВ:
-   - Если несколько фрагментов про одно событие — создай один пункт
-   - Выбери наиболее полную информацию из всех источников
-   - Укажи ссылки на все релевантные источники (до 3)
-   - Избегай повторений одной и той же новости в разных разделах
-
-5. ФИЛЬТРАЦИЯ КОНТЕНТА:
-   - ИГНОРИРУЙ: рекламу, опросы, призывы подписаться, эмодзи, декоративное оформление
-   - ИГНОРИРУЙ: личные мнения без фактов, сплетни, неподтверждённые слухи
-   - ВКЛЮЧАЙ: фактические новости, анонсы продуктов, исследования, статистику, официальные заявления
-
-6. ОБЪЁМ И ФОРМАТ:
-   - Без вводных фраз типа "За сегодня произошло...", без заключений
-   - Только разделы и пункты в указанном формате
-   - Если раздел "AI/ML" пуст — не выводи его
-
-7. ПРИОРИТИЗАЦИЯ:
-   - Сначала анализируй все новости и определяй наиболее важные
-   - В "Главное" попадают события с наибольшим влиянием
-   - Внутри раздела сортируй по важности (самое важное — первым)
-
-## ФОРМАТ ВЫВОДА
-
-Главное
-• [Текст новости] (https://t.me/channel1/123)
-• [Текст новости] (https://t.me/channel2/456 https://t.me/channel3/789)
+def _build_delta_prompt(target_date, prompt_type, covered):
+    """Промпт внутридневного обновления: только новые сообщения, без повторов уже разосланного."""
+    prompt = _build_prompt(period='day', target_date=target_date, prompt_type=prompt_type, mode="delta")
+    if covered:
+        prompt += "\nУже было сегодня:\n" + "\n".join(f"- {item}" for item in covered) + "\n"
+    return prompt
 
-AI/ML
-• [Текст новости] (https://t.me/channel4/101)
 
-Остальное кратко
-• [Краткая новость] (https://t.me/channel5/202)
-• [Краткая новость] (https://t.me/channel6/303)
-"""
+def _build_section_prompt(period, target_date, prompt_type, section):
+    """Промпт одного раздела: новости уже отобраны в раздел, «Главное» отмечается ★."""
+    return _build_prompt(period=period, target_date=target_date, prompt_type=prompt_type, mode="section",
+                         section=section.title)
 
 
 def summarize_news(news_list, period='day', target_date=None, prompt_type="general"):
@@ -215,34 +95,135 @@ def summarize_news(news_list, period='day', target_date=None, prompt_type="gener
     Args:
         news_list: список новостей для суммаризации
         period: 'day' для дня или 'week' для недели
+
+    Returns:
+        SummaryResult (текст сводки + модель и токены для архива)
     """
+    news_list = _compress(news_list)
+    if SECTION_ROUTING and len(news_list) >= SECTION_MIN_ITEMS:
+        return summarize_by_section(news_list, period=period, target_date=target_date, prompt_type=prompt_type)
+
     text = "\n\n".join(news_list)
 
     prompt_system = _build_prompt(period=period, target_date=target_date, prompt_type=prompt_type)
+    return _complete(prompt_system, text)
+
+
+def _compress(news_list):
+    """Длинные новости — до ключевых предложений (src.compress); numpy загружается, только если сжатие включено."""
+    if not EXTRACTIVE_COMPRESS:
+        return news_list
+    from src.compress import compress_items
 
-    client_ai = openai.OpenAI(api_key=openai_api_key)
-    response = client_ai.chat.completions.create(
-        model="gpt-4.1-mini",
-        messages=[
-            {"role": "system", "content": prompt_system},
-            {"role": "user", "content": text}
-        ],
-        max_tokens=1600,
-        temperature=0.35
+    return compress_items(news_list)
+
+
+def summarize_by_section(news_list, period='day', target_date=None, prompt_type="general"):
+    """
+    Новости раскладываются по разделам локально (src.sections.route_items), и каждый
+    раздел суммаризируется своим запросом параллельно — с меньшим контекстом и своим
+    лимитом ответа. Токены в SummaryResult — сумма по всем запросам.
+    """
+    routed = route_items(news_list, prompt_type)
+    print("[LOG] Разделы: " + ", ".join(f"{section.title}={len(items)}" for section, items in routed))
+    with ThreadPoolExecutor(max_workers=max(1, min(SECTION_CONCURRENCY, len(routed)))) as pool:
+        futures = [
+            pool.submit(
+                _complete,
+                _build_section_prompt(period, target_date, prompt_type, section),
+                "\n\n".join(items),
+                section.max_tokens,
+                ROLE_MAP,
+            )
+            for section, items in routed
+        ]
+        results = [future.result() for future in futures]
+
+    def _total(field):
+        values = [getattr(result, field) for result in results]
+        return None if any(value is None for value in values) else sum(values)
+
+    return SummaryResult(
+        text=assemble_sections([(section, result.text) for (section, _), result in zip(routed, results)]),
+        model="+".join(dict.fromkeys(result.model for result in results)) or None,
+        prompt_tokens=_total("prompt_tokens"),
+        completion_tokens=_total("completion_tokens"),
     )
-    return response.choices[0].message.content.strip()
 
 
-async def get_news(client, channels, period='day', target_date=None):
+def summarize_daily_summaries(daily, target_date=None, prompt_type="general"):
+    """
+    Недельная сводка из ежедневных: один небольшой запрос вместо повторной
+    суммаризации сырых сообщений за 7 дней.
+
+    Args:
+        daily: {дата: текст ежедневной сводки}
+    """
+    text = "\n\n".join(f"### {day.isoformat()}\n{summary}" for day, summary in sorted(daily.items()))
+    return _complete(_build_rollup_prompt(target_date=target_date, prompt_type=prompt_type), text)
+
+
+def summarize_delta(news_list, covered, target_date=None, prompt_type="general"):
+    """
+    Внутридневное обновление: суммаризирует только новые сообщения, пропуская истории
+    из covered (пункты предыдущих выпусков за день). Текст "NONE" — нового нет.
     """
-    Собирает новости из каналов за указанный период.
+    text = "\n\n".join(_compress(news_list))
+    return _complete(_build_delta_prompt(target_date=target_date, prompt_type=prompt_type, covered=covered), text)
+
+
+async def _collect_channel(client, entity, username, start, end, min_id=0, counters=None):
+    items = []
+    counters = counters if counters is not None else {}
+    async for message in client.iter_messages(entity, min_id=min_id):
+        msg_date = message.date
+        if msg_date.tzinfo is None:
+            msg_date = msg_date.replace(tzinfo=timezone.utc)
+        msg_date_norm = msg_date.replace(microsecond=0)
+        if msg_date_norm < start:
+            break
+        if not start <= msg_date_norm < end:
+            continue
+        counters["messages"] = counters.get("messages", 0) + 1
+        counters["last_id"] = max(counters.get("last_id", 0), message.id)
+        if getattr(message, "media", None) is not None:
+            counters["media"] = counters.get("media", 0) + 1
+        if message.text:
+            counters["text"] = counters.get("text", 0) + 1
+            items.append(f"{message.text}\nИсточник: https://t.me/{username}/{message.id}\n")
+            print(f"[DEBUG] {username} | id={message.id} | дата={msg_date_norm} - добавлено")
+    return items
+
+
+async def fetch_channel_news(client, channels, period='day', target_date=None, peers=None, min_ids=None, stats=None,
+                             spool=None, catch_up=None):
+    """
+    Собирает новости из каналов за указанный период, каждый канал — ровно один раз.
 
     Args:
         client: Telethon клиент
         channels: список каналов
         period: 'day' для дня или 'week' для недели
+        peers: {username: InputPeer} из src.entity_cache — без них каждый username
+            разрешается через ResolveUsername
+        min_ids: {username в нижнем регистре: id} — читать только сообщения новее
+            (high-water mark внутридневных обновлений, см. src.intraday)
+        stats: словарь, в который для каждого канала пишутся счётчики чтения
+            (messages, text, media, items, latency, error) — см. src.channel_stats
+        spool: src.spool.NewsSpool — новости канала сразу уходят в буфер на диске,
+            а вместо списка возвращается SpoolView
+        catch_up: {username в нижнем регистре: (дата, id)} — канал пропускался адаптивным
+            сбором (src.channel_stats): читать его с начала этой даты и только новее id,
+            чтобы сообщения пропущенных дней не потерялись
+
+    Returns:
+        {username в нижнем регистре: [новости канала]} — по нему новости
+        раскладываются по дайджестам, в которые канал входит.
     """
-    all_news = []
+    by_channel = {}
+    peers = peers or {}
+    min_ids = min_ids or {}
+    catch_up = catch_up or {}
     if period == 'week':
         start, end = get_week_range(target_date=target_date)
         period_name = "неделю"
@@ -253,19 +234,55 @@ async def get_news(client, channels, period='day', target_date=None):
     print(f"[DEBUG] Диапазон фильтра за {period_name}: {start} ... {end}")
     for channel_info in channels:
         username = channel_info.get("username")
-        if not username:
+        if not username or username.lower() in by_channel:
             continue
-        async for message in client.iter_messages(username):
-            msg_date = message.date
-            if msg_date.tzinfo is None:
-                msg_date = msg_date.replace(tzinfo=timezone.utc)
-            msg_date_norm = msg_date.replace(microsecond=0)
-            if msg_date_norm < start:
-                break
-            if start <= msg_date_norm < end and message.text:
-                all_news.append(f"{message.text}\nИсточник: https://t.me/{username}/{message.id}\n")
-                print(f"[DEBUG] {username} | id={message.id} | дата={msg_date_norm} - добавлено")
-    return all_news
+        peer = peers.get(username)
+        min_id = min_ids.get(username.lower(), 0)
+        channel_start = start
+        if username.lower() in catch_up:
+            since, last_id = catch_up[username.lower()]
+            channel_start = min(start, get_day_range(target_date=since)[0])
+            min_id = max(min_id, last_id or 0)
+            print(f"[LOG] @{username}: догоняем пропущенные дни с {since.isoformat()}")
+        items = []
+        counters = {}
+        started = time.monotonic()
+        try:
+            items = await _collect_channel(client, peer or username, username, channel_start, end, min_id=min_id,
+                                           counters=counters)
+        except Exception as e:
+            if peer is None:
+                print(f"[WARN] Не удалось прочитать @{username}: {e}")
+                counters["error"] = True
+            else:
+                # Закэшированный access_hash мог устареть — разрешаем заново по username
+                print(f"[WARN] Кэшированный peer @{username} не подошёл ({e}), разрешаем заново")
+                forget_channel(username)
+                counters = {}
+                try:
+                    items = await _collect_channel(client, username, username, channel_start, end, min_id=min_id,
+                                                   counters=counters)
+                except Exception as e:
+                    print(f"[WARN] Не удалось прочитать @{username}: {e}")
+                    counters["error"] = True
+        by_channel[username.lower()] = spool.extend(items) if spool is not None else items
+        if stats is not None:
+            stats[username.lower()] = {
+                "messages": counters.get("messages", 0),
+                "text": counters.get("text", 0),
+                "media": counters.get("media", 0),
+                "items": len(items),
+                "latency": round(time.monotonic() - started, 2),
+                "error": counters.get("error", False),
+                "last_id": counters.get("last_id"),
+            }
+    return by_channel
+
+
+async def get_news(client, channels, period='day', target_date=None, peers=None):
+    """Собирает новости из каналов за указанный период одним списком (см. fetch_channel_news)."""
+    by_channel = await fetch_channel_news(client, channels, period=period, target_date=target_date, peers=peers)
+    return [item for items in by_channel.values() for item in items]
 
 
 def split_message(text, max_length=TELEGRAM_MAX_MESSAGE_LENGTH):
@@ -298,104 +315,148 @@ def split_message(text, max_length=TELEGRAM_MAX_MESSAGE_LENGTH):
     return messages
 
 
-async def send_news(summary):
-    # Сохраняем саммари в лог перед рассылкой
-    try:
-        timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
-        log_entry = f"\n{'='*80}\nДата отправки: {timestamp}\n{'='*80}\n{summary}\n"
-        with open(SUMMARIES_LOG_FILE, 'a', encoding='utf-8') as f:
-            f.write(log_entry)
-        print(f"[LOG] Саммари сохранена в {SUMMARIES_LOG_FILE}")
-    except Exception as e:
-        print(f"[WARN] Не удалось сохранить саммари в файл: {e}")
-
-    subscribers = load_subscribers()
+def select_recipients(state, recipients=None):
+    """
+    Получатели рассылки: аудитория дайджеста (или все подписчики) без неактивных,
+    в режиме отладки — только тестовые пользователи.
+    """
+    if recipients is None:
+        subscribers = load_active_subscriber_ids(state)
+    else:
+        subscribers = [uid for uid in dict.fromkeys(recipients) if is_active(state, uid)]
     if not subscribers:
         print("[WARN] Нет подписчиков для рассылки.")
-        return
+        return []
 
     # Фильтрация подписчиков в режиме отладки
     if DEBUG_MODE:
-        # Убеждаемся, что DEBUG_USER_IDS - это список
-        debug_ids = DEBUG_USER_IDS if isinstance(DEBUG_USER_IDS, list) else [DEBUG_USER_IDS]
-        subscribers = [uid for uid in subscribers if uid in debug_ids]
+        subscribers = filter_debug_recipients(subscribers)
         print(f"[DEBUG] Режим отладки включен. Рассылка только для тестовых пользователей: {subscribers}")
         if not subscribers:
             print("[WARN] Нет тестовых подписчиков для рассылки в режиме отладки.")
-            return
     else:
         print(f"[LOG] Режим отладки выключен. Рассылка для всех подписчиков: {len(subscribers)} пользователей")
+    return subscribers
 
-    bot = Bot(token=telegram_bot_token)
-    blocked_subscribers = []  # Пользователи, которые заблокировали бота
 
-    # Разбиваем summary на части не длиннее 4096 символов
-    message_chunks = split_message(summary)
+def log_sent_message(user_id, message_id, text):
+    """Пишет каждую отправленную часть в sent_messages.log."""
+    print(f"[LOG] Сообщение успешно отправлено пользователю {user_id}, message_id={message_id}")
+    try:
+        ts = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        line = f"{ts}\tuser_id={user_id}\tmessage_id={message_id}\tlen={len(text)}\t{text}\n"
+        with open(SENT_MESSAGES_LOG, 'a', encoding='utf-8') as lf:
+            lf.write(line)
+    except Exception as e:
+        # Не прерываем рассылку из-за ошибок логирования
+        print(f"[ERROR] Не удалось записать лог отправленного сообщения: {e}")
 
-    # Вспомогательная функция для логирования каждого отправленного сообщения
-    def log_sent_message(user_id, message_id, text):
-        try:
-            ts = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
-            line = f"{ts}\tuser_id={user_id}\tmessage_id={message_id}\tlen={len(text)}\t{text}\n"
-            with open(SENT_MESSAGES_LOG, 'a', encoding='utf-8') as lf:
-                lf.write(line)
-        except Exception as e:
-            # Не прерываем рассылку из-за ошибок логирования
-            print(f"[ERROR] Не удалось записать лог отправленного сообщения: {e}")
 
-    for user_id in subscribers:
-        try:
-            for idx, chunk in enumerate(message_chunks):
-                # Можно добавить нумерацию частей если сообщений больше одного
-                if len(message_chunks) > 1:
-                    part_text = f"Часть {idx+1}/{len(message_chunks)}\n\n{chunk}"
-                else:
-                    part_text = chunk
-                result = await bot.send_message(chat_id=user_id, text=part_text)
-                print(f"[LOG] Сообщение успешно отправлено пользователю {user_id}, message_id={result.message_id}")
-                # Логируем полный отправленный текст с датой и временем
-                log_sent_message(user_id=user_id, message_id=result.message_id, text=part_text)
-                # Рекомендуется сделать небольшую паузу между отправками частей
-                await asyncio.sleep(0.1)
-        except Forbidden as e:
-            # Пользователь заблокировал бота - удаляем из списка
-            error_msg = str(e).lower()
-            if "blocked" in error_msg or "bot was blocked" in error_msg:
-                print(f"[WARN] Пользователь {user_id} заблокировал бота - будет удален из списка")
-                blocked_subscribers.append(user_id)
-            else:
-                print(f"[ERROR] Не удалось отправить сообщение пользователю {user_id}: {e}")
-        except BadRequest as e:
-            # Chat not found - может быть временная проблема, оставляем в списке
-            error_msg = str(e).lower()
-            if "chat not found" in error_msg:
-                print(f"[WARN] Чат с пользователем {user_id} не найден (возможно, временная проблема) - оставляем в списке")
-            else:
-                print(f"[ERROR] Не удалось отправить сообщение пользователю {user_id}: {e}")
-        except TelegramError as e:
-            # Другие ошибки Telegram API
-            print(f"[ERROR] Ошибка Telegram API для пользователя {user_id}: {e}")
-        except Exception as e:
-            # Неожиданные ошибки
-            print(f"[ERROR] Не удалось отправить сообщение пользователю {user_id}: {e}")
+def staging_target():
+    """Служебный чат для рассылки копиями или None (BROADCAST_MODE=send или не задан TARGET_CHAT_ID)."""
+    if BROADCAST_MODE not in ("copy", "forward"):
+        return None
+    chat_id = staging_chat_id(TARGET_CHAT_ID)
+    if chat_id is None:
+        print(f"[WARN] BROADCAST_MODE={BROADCAST_MODE}, но TARGET_CHAT_ID не задан — отправка текстом")
+    return chat_id
 
-    # Удаляем из файла только тех, кто заблокировал бота
-    # Остальных (включая тех, кому успешно отправили) оставляем
-    try:
-        with open(SUBSCRIBERS_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        # Удаляем только заблокированных пользователей
-        new_subs = [sub for sub in data.get('subscribers', [])
-                   if 'user_id' in sub and sub['user_id'] not in blocked_subscribers]
-        with open(SUBSCRIBERS_FILE, 'w', encoding='utf-8') as f:
-            json.dump({"subscribers": new_subs}, f, ensure_ascii=False, indent=2)
-        if blocked_subscribers:
-            print(f"[LOG] Удалено из списка подписчиков: {len(blocked_subscribers)} пользователей (заблокировали бота)")
-    except Exception as e:
-        print(f"[ERROR] Ошибка обновления активных подписчиков: {e}")
+
+async def stage_summary(bot, chunks, entry=None):
+    """
+    Публикует части сводки в служебный чат (BROADCAST_MODE=copy/forward) и возвращает их
+    message_id; None — рассылка текстом. entry — (дайджест, период, дата окна) записи архива:
+    опубликованные сообщения запоминаются в ней (src.archive.set_staging), поэтому повтор
+    задания и следующие пачки очереди берут их оттуда, а не публикуют сводку заново.
+    """
+    chat_id = staging_target()
+    if chat_id is None:
+        return None
+    if entry is not None:
+        staging = (get_summary(*entry) or {}).get("staging") or {}
+        if staging.get("chat_id") == chat_id and staging.get("message_ids"):
+            return staging["message_ids"]
+    staged = await stage_chunks(bot, chat_id, chunks)
+    if staged and entry is not None:
+        set_staging(*entry, chat_id, staged)
+    return staged
+
+
+async def deliver_summary(bot, subscribers, chunks, staged=None, limiter=None):
+    """
+    Доставляет части сводки подписчикам и отдаёт DeliveryOutcome на пользователя.
+    При BROADCAST_MODE=copy/forward сводка публикуется один раз в TARGET_CHAT_ID (или
+    берутся уже опубликованные staged message_id), и каждый получает все части одним
+    вызовом copyMessages/forwardMessages. Если опубликовать не удалось — отправка текстом.
+    """
+    chat_id = staging_target()
+    if chat_id is not None:
+        if staged is None:
+            staged = await stage_chunks(bot, chat_id, chunks)
+        if staged:
+            async for outcome in broadcast_copies(
+                bot, subscribers, chat_id, staged, chunks=chunks, on_sent=log_sent_message,
+                forward=BROADCAST_MODE == "forward", limiter=limiter,
+            ):
+                yield outcome
+            return
+    async for outcome in broadcast(bot, subscribers, chunks, on_sent=log_sent_message, limiter=limiter):
+        yield outcome
+
+
+async def send_news(summary, bot=None, recipients=None, chunks=None, exclude=None, on_outcome=None, entry=None):
+    """
+    Рассылает готовую сводку (текст сохраняется в архив src.archive до вызова).
+    recipients — аудитория дайджеста (список user_id); None — все подписчики.
+    chunks — уже разбитый текст (этап render задания, src.jobs); exclude — кому уже
+    доставлено; on_outcome(DeliveryOutcome) вызывается на каждого получателя.
+    entry — ключ сводки в архиве: при рассылке копиями публикация в служебный чат
+    переиспользуется между повторами (см. stage_summary).
+    """
+    state = load_subscriber_state()
+    subscribers = select_recipients(state, recipients)
+    if exclude:
+        subscribers = [uid for uid in subscribers if uid not in exclude]
+    if not subscribers:
+        return
+
+    if bot is None:
+        from telegram import Bot
+
+        bot = Bot(token=telegram_bot_token)
+
+    # Разбиваем summary на части не длиннее 4096 символов
+    message_chunks = chunks or split_message(summary)
+
+    # Статусы подписчиков обновляются по потоку исходов доставки;
+    # subscribers.json при этом не переписывается
+    counts = {}
+    changed = []
+    staged = await stage_summary(bot, message_chunks, entry) if entry is not None else None
+    async for outcome in deliver_summary(bot, subscribers, message_chunks, staged=staged):
+        counts[outcome.outcome] = counts.get(outcome.outcome, 0) + 1
+        if outcome.outcome == OUTCOME_BLOCKED:
+            print(f"[WARN] Пользователь {outcome.user_id} заблокировал бота - исключён из рассылки")
+        elif outcome.outcome == OUTCOME_DEACTIVATED:
+            print(f"[WARN] Аккаунт пользователя {outcome.user_id} удалён - исключён из рассылки")
+        elif outcome.outcome == OUTCOME_CHAT_NOT_FOUND:
+            print(f"[WARN] Чат с пользователем {outcome.user_id} не найден")
+        elif outcome.outcome == OUTCOME_TRANSIENT:
+            print(f"[ERROR] Не удалось отправить сообщение пользователю {outcome.user_id}: {outcome.error}")
+        if apply_delivery_outcome(state, outcome):
+            changed.append(outcome)
+        if on_outcome is not None:
+            on_outcome(outcome)
+
+    # В файл — только изменившиеся записи, поверх свежего состояния (бот мог писать в него во время рассылки)
+    save_delivery_outcomes(changed)
+    print(f"[LOG] Итоги рассылки: {counts}")
+    return counts
 
 
 async def main():
+    from telethon import TelegramClient
+
     session_path = DATA_DIR / "anon_news.session"
     async with TelegramClient(str(session_path), api_id, api_hash) as client:
         # Шаг 1: Получить и сохранить полную инфу о каналах из папки
@@ -411,9 +472,10 @@ async def main():
             print("[LOG] Нет новостей за вчера. Прерываю рассылку.")
             return
 
-        # Шаг 4: Суммаризация и рассылка
+        # Шаг 4: Суммаризация, архив и рассылка
         summary = summarize_news(news)
-        await send_news(summary)
+        store_summary("general", "day", get_day_range()[0].date(), summary)
+        await send_news(summary.text)
 
 
 if __name__ == "__main__":
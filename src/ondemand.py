@@ -0,0 +1,163 @@
+"""
+Сводки по запросу из бота: /today, /yesterday, /week.
+
+Ответ берётся из архива (src.archive) сразу. Если нужной сводки нет, в фоне запускается
+одна сборка на окно (single-flight): сколько бы пользователей ни запросили её одновременно,
+сбор каналов и запрос к OpenAI выполняются один раз, а готовый текст получают все
+ожидающие. Пустая сборка повторно в том же окне не запускается, после ошибки запрос можно повторить.
+Сборка уступает плановой рассылке (src.pipeline.pipeline_turn(wait=False)): если конвейер
+занят, она не запускается, а рассылка, заставшая идущую сборку, дожидается её окончания.
+
+Сводка /today хранится в архиве с периодом "today" (а не "day"), чтобы неполный день
+не подменил утреннюю рассылку; она пересобирается не чаще раза в ONDEMAND_TODAY_TTL_MINUTES.
+"""
+import asyncio
+from datetime import timedelta
+
+import config
+from src.archive import get_summary, latest_summary, store_summary
+from src.citations import verify_summary
+from src.locks import LockBusy
+from src.news_bot_part import get_day_range, get_week_range, split_message, summarize_news
+from src.subscribers import parse_iso, utc_now
+from src.timezones import digest_timezone
+
+
+KIND_TODAY = "today"
+KIND_YESTERDAY = "yesterday"
+KIND_WEEK = "week"
+
+
+def _today_ttl():
+    return timedelta(minutes=config.ONDEMAND_TODAY_TTL_MINUTES)
+
+
+def window_of(kind, now=None):
+    """(период в архиве, дата окна, ключ окна для single-flight)."""
+    now = now or utc_now()
+    if kind == KIND_TODAY:
+        day = now.astimezone(digest_timezone()).date()
+        ttl_seconds = max(60, int(_today_ttl().total_seconds()))
+        bucket = int(now.timestamp()) // ttl_seconds
+        return "today", day, f"{day.isoformat()}#{bucket}"
+    if kind == KIND_WEEK:
+        day = get_week_range()[0].date()
+        return "week", day, day.isoformat()
+    day = get_day_range()[0].date()
+    return "day", day, day.isoformat()
+
+
+def find_summary(kind, digest_name):
+    """
+    Возвращает (запись архива или None, свежая ли она). Для /yesterday и /week при
+    отсутствии сводки за текущее окно отдаётся последняя имеющаяся (не свежая).
+    """
+    period, day, _ = window_of(kind)
+    record = get_summary(digest_name, period, day)
+    if record and record.get("text"):
+        if kind != KIND_TODAY:
+            return record, True
+        created_at = parse_iso(record.get("created_at"))
+        return record, bool(created_at and utc_now() - created_at < _today_ttl())
+    if kind == KIND_TODAY:
+        return None, False
+    return latest_summary(digest_name, period), False
+
+
+async def _build(client, digest, kind):
+    """Собирает и архивирует сводку; возвращает запись архива или None, если новостей нет."""
+    from src.pipeline import build_weekly_rollups, collect_digest_news
+
+    period, day, _ = window_of(kind)
+    if kind == KIND_WEEK:
+        rollups = await build_weekly_rollups(client, [digest], None)
+        return get_summary(digest.name, period, day) if digest.name in rollups else None
+
+    target_date = day if kind == KIND_TODAY else None
+    news = (await collect_digest_news(client, [digest], 'day', target_date))[digest.name]
+    if not news:
+        return None
+    result = await asyncio.to_thread(
+        summarize_news, news, period='day', target_date=target_date, prompt_type=digest.prompt
+    )
+    result, citations = verify_summary(result, news)
+    return store_summary(digest.name, period, day, result, citations)
+
+
+class OnDemandBuilder:
+    """
+    Single-flight сборка сводок по запросу. get_client — async-функция, возвращающая
+    подключённый Telethon-клиент (сервис передаёт своё подключение); без неё клиент
+    открывается на время сборки.
+    """
+
+    def __init__(self, get_client=None):
+        self._get_client = get_client
+        self._tasks = {}
+        self._waiters = {}
+        self._attempted = set()
+
+    def is_building(self, kind, digest_name):
+        return (kind, digest_name, window_of(kind)[2]) in self._tasks
+
+    def request(self, bot, kind, digest, chat_id):
+        """
+        Ставит chat_id в ожидание сводки и запускает сборку, если она ещё не идёт.
+        Возвращает False, если сборка в этом окне уже была и ничего не дала.
+        """
+        key = (kind, digest.name, window_of(kind)[2])
+        self._prune_attempted()
+        if key in self._attempted and key not in self._tasks:
+            return False
+        self._waiters.setdefault(key, set()).add(chat_id)
+        if key not in self._tasks:
+            self._attempted.add(key)
+            self._tasks[key] = asyncio.create_task(self._run(bot, key, kind, digest))
+        return True
+
+    def _prune_attempted(self):
+        """Забывает окна, которые уже не текущие: сервис работает долго, и множество не должно расти."""
+        current = {kind: window_of(kind)[2] for kind in (KIND_TODAY, KIND_YESTERDAY, KIND_WEEK)}
+        self._attempted = {key for key in self._attempted if current.get(key[0]) == key[2]}
+
+    async def _run(self, bot, key, kind, digest):
+        from src.pipeline import open_telethon_client, pipeline_turn
+
+        record = None
+        message = None
+        try:
+            # Та же блокировка, что у рассылки: одна Telethon-сессия не используется двумя запусками сразу.
+            # Сборка по запросу уступает: если конвейер занят или рассылка ждёт очереди — LockBusy
+            async with pipeline_turn(wait=False):
+                if self._get_client is not None:
+                    record = await _build(await self._get_client(), digest, kind)
+                else:
+                    client = await open_telethon_client()
+                    try:
+                        record = await _build(client, digest, kind)
+                    finally:
+                        await client.disconnect()
+            if record is None:
+                message = "Новостей за этот период пока нет."
+        except LockBusy:
+            # Рассылка сейчас идёт — окно не считаем использованным, сводка скоро появится в архиве
+            self._attempted.discard(key)
+            message = "Сейчас идёт рассылка, попробуй через несколько минут."
+        except Exception as e:
+            print(f"[ERROR] Сборка сводки {kind} ({digest.name}) по запросу: {e}")
+            # Ошибка (сеть, API) — не «новостей нет»: следующий запрос в этом окне снова запускает сборку
+            self._attempted.discard(key)
+            message = "Не удалось собрать сводку, попробуй позже."
+        finally:
+            self._tasks.pop(key, None)
+            waiters = self._waiters.pop(key, set())
+
+        for chat_id in waiters:
+            try:
+                if record is not None:
+                    for chunk in split_message(record["text"]):
+                        await bot.send_message(chat_id=chat_id, text=chunk)
+                else:
+                    await bot.send_message(chat_id=chat_id, text=message)
+            except Exception as e:
+                print(f"[WARN] Не удалось отправить сводку по запросу user_id={chat_id}: {e}")
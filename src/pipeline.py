@@ -0,0 +1,791 @@
+"""
+Конвейер рассылки: каналы → новости → суммаризация → рассылка.
+
+Используется scripts/run_daily.py (разовый запуск) и scripts/service.py (долгоживущий
+сервис с планировщиком). run_pipeline принимает уже открытые Telethon-клиент и бота,
+чтобы сервис переиспользовал соединения между запусками.
+"""
+import asyncio
+import base64
+import contextlib
+import os
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import config
+from src.archive import archive_key, get_summary, mark_no_news, mark_sent, store_summary
+from src.channel_stats import (
+    catch_up_plan, load_channel_stats, plan_fetch, record_citations, record_fetch, save_channel_stats,
+)
+from src.citations import verify_summary
+from src.delivery import (
+    OUTCOME_OK, OUTCOME_TRANSIENT, DeliveryOutcome, classify_delivery_error, retry_after_seconds,
+)
+from src.delivery_queue import enqueue_digest
+from src.digests import get_digest, load_digests, resolve_audience, with_overrides
+from src.entity_cache import load_entity_cache, remember_me, resolve_channel_peers, save_entity_cache
+from src.get_channels import get_channels_fullinfo_from_folder, load_channels_from_json
+from src.jobs import (
+    STAGE_COLLECT, STAGE_DELIVER, STAGE_RENDER, STAGE_SUMMARIZE, STATUS_FAILED, Job, StageFailed, prune_jobs, retry_delay,
+    run_stage,
+)
+from src.intraday import (
+    advance_high_water, digest_day_state, load_intraday_state, newer_than, remember_covered, save_intraday_state,
+)
+from src.locks import LockBusy, file_lock
+from src.news_bot_part import (
+    fetch_channel_news, get_day_range, get_week_range, select_recipients, send_news, split_message,
+    summarize_daily_summaries, summarize_delta, summarize_news,
+)
+from src.paths import DATA_DIR
+from src.ratelimit import AsyncRateLimiter
+from src.spool import NewsSpool, take
+from src.subscribers import (
+    apply_delivery_outcome, filter_debug_recipients, is_active, load_active_subscriber_ids,
+    load_subscriber_state, parse_iso, save_subscriber_state, to_iso, utc_now,
+)
+from src.timezones import digest_timezone
+
+
+PIPELINE_LOCK_FILE = DATA_DIR / "pipeline.lock"
+PIPELINE_LOCK_POLL_SECONDS = 5
+SESSION_FILE = DATA_DIR / "anon_news.session"
+
+
+def pipeline_lock():
+    """
+    Блокировка на время запуска конвейера: не даёт cron, ручному запуску
+    и сервису выполнять рассылку одновременно. Бросает LockBusy.
+    """
+    return file_lock(PIPELINE_LOCK_FILE)
+
+
+# Очередь к конвейеру внутри процесса: в service.py плановые запуски и сборки по запросу
+# делят одно подключение и одну блокировку
+_pipeline_turn = asyncio.Lock()
+
+
+@contextlib.asynccontextmanager
+async def pipeline_turn(wait=True):
+    """
+    Очередь внутри процесса и pipeline.lock между процессами.
+    wait=True — плановые запуски: ждут, пока сборка по запросу или другой процесс освободят
+    конвейер (не дольше PIPELINE_LOCK_WAIT_MINUTES), и только потом бросают LockBusy.
+    wait=False — сборки по запросу: уступают сразу (LockBusy), если конвейер занят или
+    плановый запуск уже ждёт своей очереди.
+    """
+    if not wait and _pipeline_turn.locked():
+        raise LockBusy("Конвейер уже выполняется в этом процессе")
+    async with _pipeline_turn:
+        with contextlib.ExitStack() as stack:
+            deadline = time.monotonic() + (config.PIPELINE_LOCK_WAIT_MINUTES * 60 if wait else 0)
+            waiting = False
+            while True:
+                try:
+                    stack.enter_context(pipeline_lock())
+                    break
+                except LockBusy:
+                    if time.monotonic() >= deadline:
+                        raise
+                    if not waiting:
+                        print("[LOG] pipeline.lock занят другим процессом — ждём освобождения")
+                        waiting = True
+                    await asyncio.sleep(PIPELINE_LOCK_POLL_SECONDS)
+            yield
+
+
+def ensure_telethon_session_file():
+    session_path = SESSION_FILE
+    if session_path.exists():
+        return session_path
+
+    session_b64 = os.getenv("TELEGRAM_SESSION_B64") or os.getenv("TELEGRAM_SESSION")
+    if not session_b64:
+        return session_path
+
+    try:
+        session_data = base64.b64decode(session_b64)
+        session_path.write_bytes(session_data)
+        print(f"[LOG] Файл Telethon-сессии восстановлен: {session_path}")
+    except Exception as e:
+        print(f"[WARN] Не удалось восстановить Telethon-сессию из env: {e}")
+    return session_path
+
+
+async def open_telethon_client():
+    """Подключает Telethon-клиент по user-сессии и проверяет, что это не бот."""
+    restored = not SESSION_FILE.exists()
+    session_path = ensure_telethon_session_file()
+    if not session_path.exists():
+        raise FileNotFoundError(
+            f"Не найдена user-сессия Telethon: {session_path}. "
+            "Положи файл anon_news.session в корень проекта"
+        )
+    if not config.api_id or not str(config.api_hash).strip():
+        raise RuntimeError(
+            "Не заданы API_ID/API_HASH. Укажи их в .env или переменных окружения."
+        )
+
+    from telethon import TelegramClient
+
+    client = TelegramClient(str(session_path), config.api_id, config.api_hash)
+    await client.connect()
+
+    # Сессию, уже проверенную раньше (отметка в кэше сущностей), повторно не проверяем
+    cache = load_entity_cache()
+    if cache.get("me") and not restored:
+        return client
+    try:
+        me = await client.get_me()
+        if not me:
+            raise RuntimeError("Telethon сессия не авторизована как пользователь.")
+        if getattr(me, "bot", False):
+            raise RuntimeError(
+                "Telethon сессия принадлежит боту. Нужна user session "
+                "(вход по телефону) в файле anon_news.session."
+            )
+    except Exception:
+        await client.disconnect()
+        raise
+    remember_me(cache, me)
+    save_entity_cache(cache)
+    return client
+
+
+def create_bot():
+    from telegram import Bot
+
+    bot_token = (config.telegram_bot_token or "").strip()
+    if not bot_token:
+        raise RuntimeError(
+            "Не задан TELEGRAM_BOT_TOKEN. Укажи токен бота в .env или переменной окружения."
+        )
+    return Bot(token=bot_token)
+
+
+async def _check_subscriber(bot, uid, limiter: AsyncRateLimiter):
+    """Отправляет chat action (typing) одному подписчику и возвращает DeliveryOutcome."""
+    from telegram.error import RetryAfter
+
+    for _ in range(2):
+        async with limiter:
+            try:
+                await bot.send_chat_action(chat_id=uid, action="typing")
+                return DeliveryOutcome(uid, OUTCOME_OK, [], None)
+            except RetryAfter as e:
+                limiter.penalize(retry_after_seconds(e))
+                continue
+            except Exception as e:
+                return DeliveryOutcome(uid, classify_delivery_error(e), [], str(e))
+    return DeliveryOutcome(uid, OUTCOME_TRANSIENT, [], "RetryAfter")
+
+
+async def verify_subscribers_delivery(bot, ttl_hours=None, concurrency=None, rate=None):
+    """
+    Лёгкая проверка доступности: отправляет chat action (typing) каждому подписчику.
+    Запросы идут конкурентно с ограничением частоты; результат с отметкой времени
+    пишется в subscriber_state.json, и пользователи, проверенные не раньше чем
+    ttl_hours назад, повторно не проверяются. Исходы проверки обновляют статусы
+    подписчиков так же, как исходы рассылки, поэтому недоступные сразу исключаются из неё.
+    Возвращает (ok, unreachable): списки доступных и исключённых user_id.
+    В режиме отладки проверяет только тестовых пользователей.
+    """
+    ttl_hours = config.VERIFY_TTL_HOURS if ttl_hours is None else ttl_hours
+    concurrency = concurrency or config.VERIFY_CONCURRENCY
+    rate = config.VERIFY_RATE_PER_SEC if rate is None else rate
+
+    state = load_subscriber_state()
+    subs = load_active_subscriber_ids(state)
+    if getattr(config, 'DEBUG_MODE', False):
+        subs = filter_debug_recipients(subs)
+        print(f"[DEBUG] Режим отладки включен. Проверка доступности только для тестовых пользователей: {subs}")
+
+    now = utc_now()
+    fresh_after = now - timedelta(hours=ttl_hours) if ttl_hours and ttl_hours > 0 else None
+
+    ok = []
+    to_check = []
+    for uid in subs:
+        entry = state.get(str(uid)) or {}
+        verified_at = parse_iso(entry.get("verified_at"))
+        if fresh_after and verified_at and verified_at >= fresh_after and entry.get("reachable"):
+            ok.append(uid)
+        else:
+            to_check.append(uid)
+    if ok:
+        print(f"[LOG] Пропущено недавно проверенных: {len(ok)}")
+
+    limiter = AsyncRateLimiter(rate)
+    semaphore = asyncio.Semaphore(max(1, int(concurrency)))
+
+    async def check(uid):
+        async with semaphore:
+            return await _check_subscriber(bot, uid, limiter)
+
+    unreachable = []
+    outcomes = await asyncio.gather(*(check(uid) for uid in to_check))
+    checked_at = to_iso(utc_now())
+    for outcome in outcomes:
+        if outcome.outcome == OUTCOME_TRANSIENT:
+            print(f"[WARN] Не удалось проверить user_id={outcome.user_id}: {outcome.error}")
+            continue
+        entry = state.setdefault(str(outcome.user_id), {})
+        entry["verified_at"] = checked_at
+        entry["reachable"] = outcome.outcome == OUTCOME_OK
+        apply_delivery_outcome(state, outcome)
+        if outcome.outcome == OUTCOME_OK:
+            ok.append(outcome.user_id)
+        else:
+            print(f"[WARN] Недоступен для рассылки user_id={outcome.user_id}: {outcome.error}")
+            if not is_active(state, outcome.user_id):
+                unreachable.append(outcome.user_id)
+    if outcomes:
+        save_subscriber_state(state)
+
+    print(f"[LOG] Проверка доступности: {len(ok)}/{len(subs)} пользователей ок, исключены из рассылки: {len(unreachable)}")
+    return ok, unreachable
+
+
+def parse_target_date(date_str: str):
+    try:
+        return datetime.strptime(date_str, "%Y-%m-%d").date()
+    except ValueError as e:
+        raise ValueError("Неверный формат даты. Используй YYYY-MM-DD.") from e
+
+
+def resolve_digests(args, registry=None):
+    """
+    Дайджесты для запуска: --digest NAME (можно несколько, "all" — все из реестра),
+    --sport как шорткат для --digest sport; по умолчанию — первый дайджест реестра.
+    --folder/--channels-file/--prompt переопределяют поля выбранных дайджестов.
+    """
+    registry = registry if registry is not None else load_digests()
+    names = list(getattr(args, "digest", None) or [])
+    if args.sport:
+        names.append("sport")
+    if "all" in names:
+        names = list(registry)
+    if not names:
+        if not registry:
+            raise ValueError("Реестр дайджестов пуст")
+        names = [next(iter(registry))]
+    digests = [get_digest(name, registry) for name in dict.fromkeys(names)]
+    return [
+        with_overrides(d, folder=args.folder, channels_file=args.channels_file, prompt=args.prompt)
+        for d in digests
+    ]
+
+
+def _period_window(period, target_date):
+    if period == 'week':
+        return get_week_range(target_date=target_date)
+    return get_day_range(target_date=target_date)
+
+
+async def run_pipeline(args, client=None, bot=None):
+    """
+    Выполняет запуск по аргументам run_daily.py. client (Telethon) и bot можно передать
+    уже открытыми — тогда они не закрываются по завершении. Иначе они создаются
+    только если нужны этому запуску (например, --news обходится без бота).
+    """
+    # Только проверка доступности (без сбора новостей)
+    if args.verify and not (args.channels or args.news or args.send):
+        await verify_subscribers_delivery(bot or create_bot())
+        return
+
+    if not (args.channels or args.news or args.send):
+        return
+
+    digests = resolve_digests(args)
+    if client is not None:
+        await _run_with_client(args, digests, client, bot)
+        return
+    client = await open_telethon_client()
+    try:
+        await _run_with_client(args, digests, client, bot)
+    finally:
+        await client.disconnect()
+
+
+async def _run_with_client(args, digests, client, bot):
+    sending = args.send and not args.summary_only
+    if bot is None and sending and (args.verify or not args.dry_run):
+        bot = create_bot()
+    # Предварительная проверка доступности (опционально) — одна на все дайджесты
+    if sending and args.verify:
+        await verify_subscribers_delivery(bot)
+
+    multiple = len(digests) > 1
+    if args.channels:
+        refreshed = set()
+        for digest in digests:
+            key = (digest.folder, digest.channels_file)
+            if key not in refreshed:
+                refreshed.add(key)
+                await get_channels_fullinfo_from_folder(client, digest.folder, output_path=digest.channels_file)
+    if not (args.news or args.send):
+        return
+    if getattr(args, "intraday", False):
+        await run_intraday_updates(args, digests, client, bot, multiple)
+        return
+
+    # Определяем период: неделя или день
+    target_date = parse_target_date(args.date) if args.date else None
+    period = 'week' if args.weekly else 'day'
+    if target_date:
+        if args.weekly:
+            period_name = f"неделю до {target_date.isoformat()}"
+        else:
+            period_name = target_date.isoformat()
+    else:
+        period_name = "неделю" if args.weekly else "вчера"
+
+    window_day = _period_window(period, target_date)[0].date()
+
+    # Задания (src.jobs): выполненные за это окно не повторяются, упавшие продолжаются с упавшего этапа
+    jobs = {}
+    if config.PIPELINE_JOBS and args.send and not (args.dry_run or args.summary_only):
+        prune_jobs()
+        for digest in digests:
+            job = Job(digest.name, period, window_day, restart=getattr(args, "rerun", False))
+            if job.done:
+                print(f"[LOG] {_tag(digest, multiple)}Задание {job.key} уже выполнено — пропуск (--rerun, чтобы повторить)")
+                continue
+            if job.status == STATUS_FAILED:
+                print(f"[LOG] {_tag(digest, multiple)}Продолжаем задание {job.key} после этапа {job.stage or '-'}")
+            jobs[digest.name] = job
+        digests = [d for d in digests if d.name in jobs]
+        if not digests:
+            return
+
+    summaries = {}
+    if args.send and not getattr(args, "no_cache", False):
+        for digest in digests:
+            record = get_summary(digest.name, period, window_day)
+            if record and record.get("text"):
+                summaries[digest.name] = record["text"]
+                print(f"[LOG] {_tag(digest, multiple)}Сводка за {period_name} взята из архива")
+
+    # Недельная сводка собирается из ежедневных; сырые сообщения читаются только за недостающие дни
+    rolled_up = set()
+    if period == 'week' and args.send and not getattr(args, "weekly_raw", False):
+        pending = [d for d in digests if d.name not in summaries]
+        if pending:
+            summaries.update(await build_weekly_rollups(client, pending, target_date, multiple, jobs=jobs))
+            rolled_up = {d.name for d in pending}
+
+    # Тексты новостей держим на диске (NEWS_SPOOL), в памяти — только смещения
+    with news_spool() as spool:
+        # Каналы всех дайджестов без готовой сводки читаются один раз
+        pending = [d for d in digests if d.name not in summaries and d.name not in rolled_up]
+        news_by_digest = {}
+        for digest in pending:
+            restored = jobs[digest.name].load_news(spool) if digest.name in jobs else None
+            if restored is not None:
+                news_by_digest[digest.name] = restored
+                print(f"[LOG] {_tag(digest, multiple)}Новости взяты из контрольной точки задания")
+        to_collect = [d for d in pending if d.name not in news_by_digest]
+        if to_collect:
+            # Статистику выхода каналов пишут только запуски со сводкой: у --news цитирований нет (cited=0)
+            collect_only = args.news and not args.send
+            report = {}
+            news_by_digest.update(await run_stage(
+                [jobs.get(d.name) for d in to_collect], STAGE_COLLECT,
+                lambda: collect_digest_news(client, to_collect, period, target_date, track=not collect_only,
+                                            spool=spool, report=report),
+            ))
+            for digest in to_collect:
+                # Неполный сбор (часть каналов с ошибкой) не сохраняем: повтор прочитает каналы заново
+                failed = failed_channels(report, digest.name)
+                if failed:
+                    print(f"[WARN] {_tag(digest, multiple)}Не прочитаны каналы {', '.join(failed)} — контрольная точка сбора не сохранена")
+                elif digest.name in jobs and news_by_digest[digest.name]:
+                    jobs[digest.name].save_news(news_by_digest[digest.name])
+        for digest in pending:
+            print(f"[LOG] {_tag(digest, multiple)}Найдено новостей за {period_name}: {len(news_by_digest[digest.name])}")
+        if args.news and not args.send:
+            # Только сбор новостей
+            return
+
+        # Суммаризация и рассылка — параллельно, но не больше DIGEST_CONCURRENCY дайджестов сразу
+        semaphore = asyncio.Semaphore(max(1, config.DIGEST_CONCURRENCY))
+
+        async def run_one(digest):
+            async with semaphore:
+                await run_digest(
+                    args, digest, bot, period, target_date, period_name,
+                    news=news_by_digest.get(digest.name), summary=summaries.get(digest.name), multiple=multiple,
+                    job=jobs.get(digest.name),
+                )
+
+        results = await asyncio.gather(*(run_one(d) for d in digests), return_exceptions=True)
+        errors = [(d, r) for d, r in zip(digests, results) if isinstance(r, BaseException)]
+        for digest, error in errors:
+            print(f"[ERROR] Дайджест {digest.name}: {error}")
+        if errors and len(digests) == 1:
+            raise errors[0][1]
+
+
+def _tag(digest, multiple):
+    return f"[{digest.name}] " if multiple else ""
+
+
+def news_spool():
+    """Буфер новостей на диске (NEWS_SPOOL) или пустой контекст — новости остаются списками."""
+    return NewsSpool() if config.NEWS_SPOOL else contextlib.nullcontext()
+
+
+async def collect_digest_news(client, digests, period, target_date, high_water=None, track=False, spool=None,
+                              report=None):
+    """
+    Собирает новости для нескольких дайджестов: каналы объединяются, каждый читается
+    один раз за окно, а новости раскладываются по дайджестам, в которые канал входит.
+    high_water — {имя дайджеста: {username: id}}: канал читается начиная с наименьшей
+    отметки среди его дайджестов, и каждый дайджест получает только то, что новее его отметки.
+    track — записать статистику каналов (src.channel_stats) и применить адаптивный сбор;
+    цитирования затем записывает run_digest.
+    spool — src.spool.NewsSpool: тексты хранятся на диске, а дайджесты получают SpoolView.
+    report — словарь, в который пишется {имя дайджеста: {username: счётчики чтения канала}}
+    (error, last_id и др., см. fetch_channel_news); пропущенных адаптивным сбором каналов в нём нет.
+    Возвращает {имя дайджеста: [новости]}.
+    """
+    channels_by_digest = {d.name: load_channels_from_json(path=d.channels_file) for d in digests}
+    unique = {}
+    total = 0
+    for channels in channels_by_digest.values():
+        for info in channels:
+            username = info.get("username")
+            if username:
+                total += 1
+                unique.setdefault(username.lower(), info)
+    if len(digests) > 1:
+        print(f"[LOG] Каналы для агрегации: {len(unique)} уникальных на {total} в {len(digests)} дайджестах")
+    else:
+        print(f"[LOG] Каналы для агрегации: {[info.get('username') for info in unique.values()]}")
+
+    min_ids = None
+    if high_water is not None:
+        min_ids = {}
+        for name, channels in channels_by_digest.items():
+            marks = high_water.get(name, {})
+            for info in channels:
+                if info.get("username"):
+                    key = info["username"].lower()
+                    min_ids[key] = min(min_ids.get(key, marks.get(key, 0)), marks.get(key, 0))
+
+    union = list(unique.values())
+    channel_stats = load_channel_stats() if track else None
+    skipped = []
+    catch_up = None
+    if channel_stats is not None and config.CHANNEL_ADAPTIVE:
+        union, skipped = plan_fetch(union, channel_stats)
+        if skipped:
+            print(f"[LOG] Каналы с низким выходом пропущены в этот раз: {[info.get('username') for info in skipped]}")
+        catch_up = catch_up_plan(union, channel_stats)
+    fetched = {}
+    peers = await resolve_channel_peers(client, union)
+    by_channel = await fetch_channel_news(
+        client, union, period=period, target_date=target_date, peers=peers, min_ids=min_ids, stats=fetched,
+        spool=spool, catch_up=catch_up,
+    )
+    if channel_stats is not None:
+        record_fetch(channel_stats, fetched, _period_window(period, target_date)[0].date().isoformat(), skipped)
+        save_channel_stats(channel_stats)
+
+    news_by_digest = {}
+    for name, channels in channels_by_digest.items():
+        usernames = dict.fromkeys(info["username"].lower() for info in channels if info.get("username"))
+        if report is not None:
+            report[name] = {key: fetched[key] for key in usernames if key in fetched}
+        parts = [by_channel[key] for key in usernames if key in by_channel]
+        news_by_digest[name] = spool.concat(parts) if spool is not None else [item for part in parts for item in part]
+        if high_water is not None:
+            news_by_digest[name] = newer_than(news_by_digest[name], high_water.get(name, {}))
+    return news_by_digest
+
+
+async def run_intraday_updates(args, digests, client, bot, multiple=False):
+    """
+    Внутридневное обновление за сегодня (в поясе DIGEST_TIMEZONE): читаются только сообщения новее
+    high-water mark прошлого выпуска, а истории, уже разосланные сегодня, в промпт
+    передаются как «уже было». Состояние (src.intraday) продвигается только после
+    реальной рассылки — --dry-run и --summary-only его не меняют.
+    """
+    now = datetime.now(digest_timezone())
+    today = now.date()
+    state = load_intraday_state()
+    entries = {d.name: digest_day_state(state, d.name, today) for d in digests}
+    high_water = {name: entry["high_water"] for name, entry in entries.items()}
+    report = {}
+    news_by_digest = await collect_digest_news(client, digests, 'day', today, high_water=high_water, report=report)
+    for digest in digests:
+        print(f"[LOG] {_tag(digest, multiple)}Новых сообщений с прошлого обновления: {len(news_by_digest[digest.name])}")
+    if args.news and not args.send:
+        return
+
+    stamp = now.strftime("%H:%M")
+    advance = not (args.dry_run or args.summary_only)
+    semaphore = asyncio.Semaphore(max(1, config.DIGEST_CONCURRENCY))
+
+    async def update_one(digest):
+        tag = _tag(digest, multiple)
+        entry = entries[digest.name]
+        news = news_by_digest[digest.name]
+        if not news:
+            print(f"[LOG] {tag}Новых сообщений нет — обновление пропущено")
+            if advance:
+                # Сообщения без текста тоже сдвигают отметку — следующее обновление их не перечитывает
+                advance_high_water(entry["high_water"], report.get(digest.name, {}))
+            return
+        async with semaphore:
+            result = await asyncio.to_thread(
+                summarize_delta, news, entry["covered"], target_date=today, prompt_type=digest.prompt
+            )
+        result, citations = verify_summary(result, news, tag=tag)
+        text = result.text
+        if text.strip().upper().strip(".") == "NONE":
+            print(f"[LOG] {tag}Новых историй нет — обновление не рассылается")
+        else:
+            text = f"Обновление на {stamp} {now.tzname() or 'UTC'}\n\n{text}"
+            store_summary(
+                digest.name, 'intraday', f"{today.isoformat()}T{now:%H%M}", result._replace(text=text), citations
+            )
+            if args.summary_only:
+                out = args.summary_only if isinstance(args.summary_only, str) else 'summary.txt'
+                with open(out, 'w', encoding='utf-8') as f:
+                    f.write(text)
+                print(f"[LOG] {tag}Обновление сохранено в {out}")
+            elif args.dry_run:
+                print(f"[DRY-RUN] {tag}Рассылка не выполнялась. Предпросмотр (начало):\n")
+                print(text[:800])
+            else:
+                await send_news(text, bot=bot, recipients=resolve_audience(digest))
+                remember_covered(entry, text)
+        if advance:
+            advance_high_water(entry["high_water"], report.get(digest.name, {}))
+            entry["updates"] += 1
+
+    results = await asyncio.gather(*(update_one(d) for d in digests), return_exceptions=True)
+    for digest, result in zip(digests, results):
+        if isinstance(result, BaseException):
+            print(f"[ERROR] Обновление {digest.name}: {result}")
+    if advance:
+        save_intraday_state(state)
+    if len(digests) == 1 and isinstance(results[0], BaseException):
+        raise results[0]
+
+
+def week_days(target_date=None):
+    """Даты дней, входящих в недельное окно get_week_range."""
+    start, end = get_week_range(target_date=target_date)
+    return [(start + timedelta(days=i)).date() for i in range((end - start).days)]
+
+
+async def build_weekly_rollups(client, digests, target_date, multiple=False, jobs=None):
+    """
+    Недельные сводки из ежедневных, сохранённых в архиве. Для дней без сводки
+    новости собираются и суммаризируются как обычный ежедневный запуск — такая
+    сводка тоже сохраняется и пригодится следующим запускам. День без новостей отмечается
+    в архиве (mark_no_news) и следующими запусками не собирается — но только если все каналы
+    прочитаны без ошибок; иначе сбор повторяется. Возвращает {имя: сводка}.
+    Сбор и суммаризация идут через run_stage (повторы с паузой); jobs — {имя: Job}
+    недельных заданий: при исчерпании попыток задание помечается failed, а следующий
+    запуск продолжит с недостающих дней (готовые уже лежат в архиве).
+    """
+    jobs = jobs or {}
+    days = week_days(target_date)
+    daily = {d.name: {} for d in digests}
+    missing = {}
+    for digest in digests:
+        for day in days:
+            record = get_summary(digest.name, 'day', day)
+            if record and record.get("text"):
+                daily[digest.name][day] = record["text"]
+            elif not (record and record.get("no_news")):
+                missing.setdefault(day, []).append(digest)
+
+    for day, day_digests in sorted(missing.items()):
+        print(f"[LOG] Нет ежедневных сводок за {day.isoformat()} ({', '.join(d.name for d in day_digests)}) — собираем")
+        with news_spool() as spool:
+
+            async def collect_day():
+                report = {}
+                collected = await collect_digest_news(client, day_digests, 'day', day, track=True, spool=spool,
+                                                      report=report)
+                for digest in day_digests:
+                    failed = failed_channels(report, digest.name)
+                    # Пустой день с ошибками чтения — не «новостей нет»: повторяем, а не ставим отметку
+                    if failed and not collected[digest.name]:
+                        raise RuntimeError(f"{digest.name}: не прочитаны каналы {', '.join(failed)}")
+                return collected
+
+            news_by_digest = await run_stage([jobs.get(d.name) for d in day_digests], STAGE_COLLECT, collect_day)
+            for digest in day_digests:
+                news = news_by_digest[digest.name]
+                if not news:
+                    mark_no_news(digest.name, 'day', day)
+                    continue
+                tag = _tag(digest, multiple)
+                summary = await run_stage(jobs.get(digest.name), STAGE_SUMMARIZE, lambda: asyncio.to_thread(
+                    summarize_news, news, period='day', target_date=day, prompt_type=digest.prompt
+                ), tag)
+                summary, citations = verify_summary(summary, news, tag=tag)
+                store_summary(digest.name, 'day', day, summary, citations)
+                remember_citations(summary.text, day)
+                daily[digest.name][day] = summary.text
+
+    rollups = {}
+    window_day = _period_window('week', target_date)[0].date()
+    for digest in digests:
+        if not daily[digest.name]:
+            continue
+        tag = _tag(digest, multiple)
+        print(f"[LOG] {tag}Недельная сводка из {len(daily[digest.name])} ежедневных")
+        summary = await run_stage(jobs.get(digest.name), STAGE_SUMMARIZE, lambda: asyncio.to_thread(
+            summarize_daily_summaries, daily[digest.name], target_date=target_date, prompt_type=digest.prompt
+        ), tag)
+        # Ссылки недельной сводки проверяются по ссылкам ежедневных
+        summary, citations = verify_summary(
+            summary, links_text="\n".join(daily[digest.name].values()), tag=_tag(digest, multiple)
+        )
+        store_summary(digest.name, 'week', window_day, summary, citations)
+        rollups[digest.name] = summary.text
+    return rollups
+
+
+def failed_channels(report, name):
+    """Каналы дайджеста name, которые не удалось прочитать (report — из collect_digest_news)."""
+    return [username for username, counters in report.get(name, {}).items() if counters.get("error")]
+
+
+def remember_citations(summary_text, day):
+    """Цитирования каналов в сводке — в статистику каналов (к запуску за окно day)."""
+    channel_stats = load_channel_stats()
+    if record_citations(channel_stats, summary_text, day.isoformat()):
+        save_channel_stats(channel_stats)
+
+
+def filter_stories(digest, news, period, day, tag=""):
+    """
+    Убирает почти дословные повторы через индекс историй (src.story_index, STORY_INDEX):
+    за день — и уже виденные в прошлые дни, за неделю (--weekly-raw) — только внутри недели.
+    """
+    try:
+        from src import story_index
+    except ImportError as e:
+        print(f"[WARN] STORY_INDEX включён, но индекс недоступен ({e}) — фильтр повторов пропущен")
+        return news
+    if period == 'day':
+        kept, dropped = story_index.filter_reported(
+            digest.name, news, day, config.STORY_SIMILARITY, config.STORY_INDEX_DAYS
+        )
+    else:
+        duplicates = story_index.near_duplicates(story_index.embed(news), config.STORY_SIMILARITY)
+        kept, dropped = take(news, [i for i in range(len(news)) if i not in duplicates]), len(duplicates)
+    if dropped:
+        print(f"[LOG] {tag}Убрано повторов: {dropped} из {len(news)}")
+    return kept
+
+
+def remember_stories(digest, period, day, summary_text):
+    """Пункты ежедневной сводки — в индекс историй (если он включён и доступен)."""
+    if period != 'day':
+        return
+    try:
+        from src import story_index
+    except ImportError:
+        return
+    story_index.remember_summary(digest.name, day, summary_text)
+
+
+async def deliver_job(job, summary, bot, recipients, tag=""):
+    """
+    Этапы render и deliver задания: части сообщения сохраняются один раз, доставка идёт
+    только тем, кому ещё не доставлено, а временные ошибки повторяются с паузой.
+    """
+    chunks = job.checkpoint(STAGE_RENDER)
+    if chunks is None:
+        chunks = split_message(summary)
+        job.complete(STAGE_RENDER, chunks)
+
+    attempts = max(1, config.JOB_MAX_ATTEMPTS)
+    transient = []
+    for attempt in range(1, attempts + 1):
+        transient = []
+
+        def on_outcome(outcome):
+            if outcome.outcome == OUTCOME_TRANSIENT:
+                transient.append(outcome.user_id)
+            else:
+                job.record_delivery(outcome)
+
+        await run_stage(job, STAGE_DELIVER, lambda: send_news(
+            summary, bot=bot, recipients=recipients, chunks=chunks, exclude=job.delivered_users(),
+            on_outcome=on_outcome, entry=(job.digest, job.period, job.window),
+        ), tag)
+        if not transient or attempt == attempts:
+            break
+        delay = retry_delay(attempt)
+        print(f"[WARN] {tag}Не доставлено {len(transient)} пользователям, повтор через {delay:.0f} с")
+        await asyncio.sleep(delay)
+    if transient:
+        job.fail(STAGE_DELIVER, f"не доставлено {len(transient)} пользователям")
+        raise StageFailed(f"этап {STAGE_DELIVER}: не доставлено {len(transient)} пользователям")
+    job.complete(STAGE_DELIVER, {"delivered": len(job.delivered_users())})
+
+
+async def run_digest(args, digest, bot, period, target_date, period_name, news=None, summary=None, multiple=False,
+                     job=None):
+    """Суммаризация (если сводки ещё нет) и доставка одного дайджеста; job — задание src.jobs."""
+    tag = _tag(digest, multiple)
+    window_day = _period_window(period, target_date)[0].date()
+    if summary is None:
+        if news and config.STORY_INDEX:
+            news = filter_stories(digest, news, period, window_day, tag)
+        if not news:
+            print(f"[LOG] {tag}Нет новостей за {period_name} — рассылка пропущена")
+            return
+        # Синхронный вызов OpenAI выносим в поток, чтобы не блокировать бота в сервисе
+        result = await run_stage(job, STAGE_SUMMARIZE, lambda: asyncio.to_thread(
+            summarize_news, news, period=period, target_date=target_date, prompt_type=digest.prompt
+        ), tag)
+        result, citations = verify_summary(result, news, tag=tag)
+        store_summary(digest.name, period, window_day, result, citations)
+        summary = result.text
+        remember_citations(summary, window_day)
+        if config.STORY_INDEX:
+            remember_stories(digest, period, window_day, summary)
+    if job is not None and job.checkpoint(STAGE_SUMMARIZE) is None:
+        job.complete(STAGE_SUMMARIZE, {"archive": archive_key(digest.name, period, window_day)})
+
+    if args.summary_only:
+        out = args.summary_only if isinstance(args.summary_only, str) else 'summary.txt'
+        if multiple:
+            out_path = Path(out)
+            out = str(out_path.with_name(f"{out_path.stem}-{digest.name}{out_path.suffix}"))
+        with open(out, 'w', encoding='utf-8') as f:
+            f.write(summary)
+        print(f"[LOG] {tag}Итоговая сводка сохранена в {out}")
+        return
+
+    if args.dry_run:
+        print(f"[DRY-RUN] {tag}Рассылка не выполнялась. Предпросмотр (начало):\n")
+        print(summary[:800])
+        return
+
+    if config.DELIVERY_MODE == "queue":
+        # Доставка через очередь: каждому в его время, с ограничением частоты (src.delivery_queue)
+        recipients = select_recipients(load_subscriber_state(), resolve_audience(digest))
+        queued = enqueue_digest(digest.name, period, window_day, recipients)
+        print(f"[LOG] {tag}В очередь доставки поставлено: {queued} из {len(recipients)}")
+        if job is not None:
+            job.complete(STAGE_DELIVER, {"queued": queued})
+        return
+
+    # Рассылка (send_news пропускает неактивных и обновляет их статусы)
+    if job is not None:
+        await deliver_job(job, summary, bot, resolve_audience(digest), tag)
+    else:
+        await send_news(summary, bot=bot, recipients=resolve_audience(digest), entry=(digest.name, period, window_day))
+    mark_sent(digest.name, period, window_day)
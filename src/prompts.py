@@ -0,0 +1,89 @@
+"""
+Шаблоны промптов (src/prompt_templates, версия PROMPT_VERSION) — компилируются один раз на процесс.
+
+Раньше системный промпт собирался f-строкой на каждый запрос, а дата стояла в первой строке.
+Поэтому промпт каждый день был другим и не попадал в кэш префикса у провайдера: OpenAI
+кэширует совпадающее начало запроса длиной от 1024 токенов. Теперь промпт собирается из файлов:
+  general.<версия>.txt, sport.<версия>.txt — неизменная инструкция типа дайджеста;
+  rollup, delta, section                   — добавки режима, тоже без дат ({section} — раздел);
+  period.<версия>.txt                      — период и дата, всегда в самом конце.
+Неизменная часть (инструкция + добавка) собирается один раз и побайтно совпадает между
+запусками. После неё идут только период и, у внутридневных обновлений, список уже
+разосланного. Число токенов считается при компиляции: через tiktoken, если он установлен,
+иначе оценкой по длине. Отчёт — scripts/prompt_report.py.
+Правка текста промпта — это новая версия файла, а не изменение старой: переключение и откат
+делаются через PROMPT_VERSION.
+"""
+import functools
+from collections import namedtuple
+from pathlib import Path
+
+import config
+from src.sections import MAIN_MARK, MAIN_TITLE
+
+
+PROMPT_TEMPLATES_DIR = Path(__file__).resolve().parent / "prompt_templates"
+PROMPT_TYPES = ("general", "sport")
+MODES = ("rollup", "delta", "section")
+CACHE_MIN_TOKENS = 1024
+CHARS_PER_TOKEN = 3
+TOKENIZER = "o200k_base"
+
+Template = namedtuple("Template", ["name", "version", "text", "tokens"])
+
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    import tiktoken
+
+    return tiktoken.get_encoding(TOKENIZER)
+
+
+def count_tokens(text):
+    """Токены текста: tiktoken (необязательная зависимость) или оценка CHARS_PER_TOKEN символа на токен."""
+    try:
+        return len(_encoding().encode(text))
+    except ImportError:
+        return -(-len(text) // CHARS_PER_TOKEN)
+
+
+@functools.lru_cache(maxsize=None)
+def load_template(name, version=None):
+    """Шаблон name версии version (по умолчанию PROMPT_VERSION); файл читается один раз."""
+    version = version or config.PROMPT_VERSION
+    path = PROMPT_TEMPLATES_DIR / f"{name}.{version}.txt"
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    return Template(name=name, version=version, text=text, tokens=count_tokens(text))
+
+
+@functools.lru_cache(maxsize=None)
+def stable_prompt(prompt_type, mode=None, section=None):
+    """
+    Неизменная часть системного промпта: инструкция типа дайджеста и добавка режима
+    (rollup / delta / section). Одна и та же строка на всё время работы процесса.
+    """
+    base = load_template(prompt_type if prompt_type in PROMPT_TYPES else "general")
+    text = base.text
+    if mode:
+        text += load_template(mode).text.format(section=section or "", main_title=MAIN_TITLE, main_mark=MAIN_MARK)
+    tokens = count_tokens(text)
+    label = "/".join(filter(None, (base.name, mode, section)))
+    print(f"[DEBUG] Промпт {label} ({base.version}): {tokens} токенов"
+          + ("" if tokens >= CACHE_MIN_TOKENS else f" — меньше {CACHE_MIN_TOKENS}, кэш префикса не сработает"))
+    return text
+
+
+def period_note(period_text, date_str, tz_label):
+    """Переменный хвост системного промпта: период сводки."""
+    return load_template("period").text.format(period_text=period_text, date_str=date_str, tz_label=tz_label)
+
+
+def template_report(version=None):
+    """Строки отчёта по шаблонам версии: имя, символы, токены."""
+    version = version or config.PROMPT_VERSION
+    rows = []
+    for name in PROMPT_TYPES + MODES + ("period",):
+        template = load_template(name, version)
+        rows.append({"name": name, "version": version, "chars": len(template.text), "tokens": template.tokens})
+    return rows
@@ -0,0 +1,37 @@
+import asyncio
+
+
+class AsyncRateLimiter:
+    """
+    Равномерно ограничивает частоту вызовов: не более rate вызовов в секунду.
+    Используется как `async with limiter:` перед каждым запросом к API.
+    rate <= 0 отключает ограничение.
+    """
+
+    def __init__(self, rate):
+        self._interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._next_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self._interval:
+            return
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            if self._next_at > now:
+                await asyncio.sleep(self._next_at - now)
+                now = self._next_at
+            self._next_at = now + self._interval
+
+    def penalize(self, seconds):
+        """Сдвигает следующий слот (например, после RetryAfter/FloodWait)."""
+        loop = asyncio.get_running_loop()
+        self._next_at = max(self._next_at, loop.time() + float(seconds))
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
@@ -0,0 +1,100 @@
+"""
+Простой планировщик для долгоживущего сервиса (scripts/service.py).
+
+Расписание задаётся строкой в UTC: "09:00" — каждый день, "sun 10:00" — раз в неделю,
+"every 2h" / "every 30m" — с интервалом, отсчитываемым от полуночи UTC.
+"""
+import asyncio
+from collections import namedtuple
+from datetime import datetime, time, timedelta, timezone
+
+
+WEEKDAYS = {"mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6}
+
+ScheduledJob = namedtuple("ScheduledJob", ["name", "schedule", "argv"])
+
+
+def parse_schedule(spec):
+    """Возвращает (weekday или None, time). Бросает ValueError на неверной строке."""
+    parts = spec.strip().lower().split()
+    weekday = None
+    if len(parts) == 2:
+        if parts[0] not in WEEKDAYS:
+            raise ValueError(f"Неизвестный день недели в расписании: {spec!r}")
+        weekday = WEEKDAYS[parts[0]]
+        parts = parts[1:]
+    if len(parts) != 1:
+        raise ValueError(f"Неверный формат расписания: {spec!r} (ожидается 'HH:MM' или 'mon HH:MM')")
+    hours, _, minutes = parts[0].partition(":")
+    return weekday, time(int(hours), int(minutes or 0), tzinfo=timezone.utc)
+
+
+def parse_interval(spec):
+    """timedelta для "every Nh" / "every Nm" или None, если это не интервал."""
+    parts = spec.strip().lower().split()
+    if len(parts) != 2 or parts[0] != "every":
+        return None
+    value, unit = parts[1][:-1], parts[1][-1:]
+    if unit not in ("h", "m") or not value.isdigit() or int(value) <= 0:
+        raise ValueError(f"Неверный интервал в расписании: {spec!r} (ожидается 'every 2h' или 'every 30m')")
+    return timedelta(hours=int(value)) if unit == "h" else timedelta(minutes=int(value))
+
+
+def next_run_at(spec, now=None):
+    """Ближайший момент строго после now, подходящий под расписание."""
+    now = now or datetime.now(timezone.utc)
+    interval = parse_interval(spec)
+    if interval is not None:
+        midnight = datetime.combine(now.date(), time(0, 0, tzinfo=timezone.utc))
+        steps = (now - midnight) // interval + 1
+        return min(midnight + steps * interval, midnight + timedelta(days=1))
+    weekday, at = parse_schedule(spec)
+    candidate = datetime.combine(now.date(), at)
+    if weekday is not None:
+        candidate += timedelta(days=(weekday - candidate.weekday()) % 7)
+    step = timedelta(days=7 if weekday is not None else 1)
+    while candidate <= now:
+        candidate += step
+    return candidate
+
+
+async def run_scheduler(jobs, run_jobs, stop_event):
+    """
+    Выполняет run_jobs(due_jobs) по расписанию, пока не установлен stop_event.
+    Задачи, наступившие одновременно, передаются одним списком — их можно обработать
+    вместе (общий сбор каналов). Ошибка запуска не останавливает планировщик.
+    """
+    if not jobs:
+        print("[LOG] Планировщик: задач нет")
+        await stop_event.wait()
+        return
+
+    next_runs = {job.name: next_run_at(job.schedule) for job in jobs}
+    for job in jobs:
+        print(f"[LOG] Планировщик: {job.name} ({job.schedule} UTC), ближайший запуск {next_runs[job.name]}")
+
+    while not stop_event.is_set():
+        nearest = min(next_runs.values())
+        delay = (nearest - datetime.now(timezone.utc)).total_seconds()
+        if delay > 0:
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=delay)
+                break
+            except asyncio.TimeoutError:
+                pass
+
+        now = datetime.now(timezone.utc)
+        due = [job for job in jobs if next_runs[job.name] <= now]
+        if not due:
+            continue
+        names = ", ".join(job.name for job in due)
+        print(f"[LOG] Планировщик: запуск {names}")
+        try:
+            await run_jobs(due)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[ERROR] Задачи {names} завершились с ошибкой: {e}")
+        for job in due:
+            next_runs[job.name] = next_run_at(job.schedule)
+            print(f"[LOG] Планировщик: следующий запуск {job.name} — {next_runs[job.name]}")
@@ -0,0 +1,171 @@
+"""
+Разделы сводки и локальная маршрутизация новостей по ним (SECTION_ROUTING).
+
+Вместо одного запроса, в котором модель сама раскладывает весь корпус по разделам,
+каждая новость заранее получает раздел на CPU: ключевые слова раздела взвешиваются
+по TF-IDF внутри корпуса дня (слова, встречающиеся почти в каждой новости, почти ничего
+не весят), плюс регулярные выражения (например, счёт матча). Новость без уверенного
+совпадения попадает в последний раздел («Остальное кратко»).
+
+Дальше каждый раздел суммаризируется отдельным, меньшим запросом со своим лимитом
+ответа (max_tokens); «Главное» собирается из пунктов, которые модель отметила ★ в своих
+разделах (см. assemble_sections).
+"""
+import math
+import re
+from collections import Counter, namedtuple
+
+from src.spool import take
+
+
+# keywords: "стем*" — совпадение по началу слова, иначе слово целиком
+Section = namedtuple("Section", ["title", "keywords", "patterns", "max_tokens"])
+
+MAIN_TITLE = "Главное"
+MAIN_MARK = "★"
+MAIN_MAX_ITEMS = 6
+ROUTE_MIN_SCORE = 1.5
+
+SECTIONS = {
+    "general": (
+        Section(
+            title="AI/ML",
+            keywords=(
+                "ai", "ии", "ml", "llm", "gpt*", "chatgpt", "openai", "anthropic", "claude", "gemini", "deepmind",
+                "mistral", "llama", "нейросет*", "нейрон*", "датасет*", "трансформер*", "генератив*", "промпт*",
+                "инференс*", "дообуч*", "модел*", "copilot", "midjourney",
+            ),
+            patterns=(r"искусственн\w* интеллект", r"machine learning", r"\bgpu\b"),
+            max_tokens=700,
+        ),
+        Section(title="Остальное кратко", keywords=(), patterns=(), max_tokens=900),
+    ),
+    "sport": (
+        Section(
+            title="Матчи и результаты",
+            keywords=(
+                "матч*", "счёт*", "счет*", "обыграл*", "победил*", "проиграл*", "ничь*", "гол", "гола", "голы",
+                "голов", "тур*", "финал*", "полуфинал*", "плей-офф", "плейофф", "этап*", "забег*", "раунд*",
+            ),
+            patterns=(r"\b\d{1,3}\s?[:–-]\s?\d{1,3}\b",),
+            max_tokens=700,
+        ),
+        Section(
+            title="Трансферы и контракты",
+            keywords=(
+                "трансфер*", "контракт*", "перешёл", "перешел", "переход*", "аренд*", "подписал*", "продлил*",
+                "отступн*", "свободн*", "агент*",
+            ),
+            patterns=(r"до \d{4} года",),
+            max_tokens=500,
+        ),
+        Section(title="Остальное кратко", keywords=(), patterns=(), max_tokens=700),
+    ),
+}
+
+_WORD_RE = re.compile(r"[a-zа-яё0-9]+(?:-[a-zа-яё0-9]+)*")
+
+
+def sections_for(prompt_type):
+    return SECTIONS.get(prompt_type) or SECTIONS["general"]
+
+
+def _item_text(item):
+    """Текст новости без строки «Источник: ...»."""
+    return item.rsplit("Источник:", 1)[0].lower()
+
+
+def _keyword_matcher(sections):
+    exact, prefixes = {}, []
+    for idx, section in enumerate(sections):
+        for keyword in section.keywords:
+            if keyword.endswith("*"):
+                prefixes.append((keyword[:-1], idx))
+            else:
+                exact.setdefault(keyword, set()).add(idx)
+
+    cache = {}
+
+    def match(token):
+        # Токены дня сильно повторяются — совпадения считаются один раз на слово
+        if token not in cache:
+            found = set(exact.get(token, ()))
+            found.update(idx for stem, idx in prefixes if token.startswith(stem))
+            cache[token] = found
+        return cache[token]
+
+    return match
+
+
+def route_items(news_list, prompt_type="general"):
+    """
+    Раскладывает новости по разделам prompt_type. Возвращает [(Section, [новости])]
+    в порядке разделов, только непустые.
+    """
+    sections = sections_for(prompt_type)
+    fallback = len(sections) - 1
+
+    # Два прохода по новостям вместо хранения токенов всех текстов (news_list может быть SpoolView)
+    document_frequency = Counter()
+    for item in news_list:
+        document_frequency.update(set(_WORD_RE.findall(_item_text(item))))
+    total = len(news_list)
+    idf = {token: math.log((1 + total) / (1 + count)) + 1.0 for token, count in document_frequency.items()}
+
+    match = _keyword_matcher(sections)
+    patterns = [[re.compile(p) for p in section.patterns] for section in sections]
+    routed = [[] for _ in sections]
+    for position, item in enumerate(news_list):
+        text = _item_text(item)
+        scores = [0.0] * len(sections)
+        for token, count in Counter(_WORD_RE.findall(text)).items():
+            for idx in match(token):
+                scores[idx] += (1.0 + math.log(count)) * idf[token]
+        for idx, compiled in enumerate(patterns):
+            scores[idx] += sum(1.0 for pattern in compiled if pattern.search(text))
+        best = max(range(fallback), key=lambda i: scores[i], default=fallback)
+        routed[best if scores[best] >= ROUTE_MIN_SCORE else fallback].append(position)
+    return [(section, take(news_list, positions)) for section, positions in zip(sections, routed) if positions]
+
+
+def _bullet(line):
+    return line.lstrip("•-*–— ").strip()
+
+
+def assemble_sections(parts):
+    """
+    Собирает сводку из ответов по разделам [(Section, текст)]: пункты с ★ уходят в
+    «Главное» (по очереди из каждого раздела, не больше MAIN_MAX_ITEMS), остальные —
+    в свой раздел; пустые разделы не выводятся.
+    """
+    marked, sections = [], []
+    for section, text in parts:
+        section_marked, lines = [], []
+        for line in (text or "").splitlines():
+            line = line.strip()
+            if not line or line == "NONE" or line.strip("*") in (section.title, MAIN_TITLE):
+                continue
+            item = _bullet(line)
+            if item.startswith(MAIN_MARK):
+                section_marked.append(item.lstrip(MAIN_MARK).strip())
+            elif item:
+                lines.append(item)
+        marked.append(section_marked)
+        sections.append((section, lines))
+
+    # Главное набирается по кругу, чтобы один раздел не занял его целиком; не поместившиеся
+    # отмеченные пункты остаются в начале своего раздела
+    main = []
+    for rank in range(max((len(items) for items in marked), default=0)):
+        for items in marked:
+            if rank < len(items) and len(main) < MAIN_MAX_ITEMS:
+                main.append(items[rank])
+                items[rank] = None
+    bodies = []
+    if main:
+        bodies.append(MAIN_TITLE + "\n" + "\n".join(f"• {item}" for item in main))
+    for (section, lines), items in zip(sections, marked):
+        lines = [item for item in items if item is not None] + lines
+        if lines:
+            bodies.append(section.title + "\n" + "\n".join(f"• {item}" for item in lines))
+    return "\n\n".join(bodies)
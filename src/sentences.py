@@ -0,0 +1,36 @@
+"""
+Деление текста на предложения (русский и английский) — без зависимостей.
+
+Границы — переводы строк и .!?… перед заглавной буквой или цифрой; точка после
+сокращения («т.е.», «млн.», «Mr.», «U.S.») и после инициала («А. С. Пушкин») границей
+не считается, дробные числа (3.5) не разрываются. Используется сжатием новостей
+(src.compress) и запасным бэкендом суммаризации без модели (src.llm).
+"""
+import re
+
+
+_ABBREVIATIONS = {
+    "т.е", "т.д", "т.п", "т.к", "т.н", "т.ч", "г", "гг", "им", "ул", "д", "млн", "млрд", "трлн", "тыс", "руб",
+    "долл", "коп", "др", "пр", "проф", "акад", "см", "стр", "рис", "ср", "напр", "ок", "св", "mr", "mrs",
+    "ms", "dr", "prof", "inc", "ltd", "co", "corp", "vs", "etc", "e.g", "i.e", "u.s", "u.k", "jr", "sr", "st",
+    "no", "approx",
+}
+_BOUNDARY_RE = re.compile(r"[.!?…]+[\"»”’)\]]*\s+(?=[\"«“(\[]?[A-ZА-ЯЁ0-9])")
+
+
+def split_sentences(text):
+    """Предложения текста: границы — переводы строк и .!?… перед заглавной буквой или цифрой."""
+    sentences = []
+    for line in text.splitlines():
+        line = line.strip()
+        start = 0
+        for match in _BOUNDARY_RE.finditer(line):
+            words = line[start:match.start()].split()
+            word = words[-1].lstrip("([«\"“").lower() if words else ""
+            if word in _ABBREVIATIONS or (len(word) == 1 and word.isalpha()):
+                continue
+            sentences.append(line[start:match.end()].strip())
+            start = match.end()
+        if line[start:].strip():
+            sentences.append(line[start:].strip())
+    return sentences
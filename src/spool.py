@@ -0,0 +1,107 @@
+"""
+Буфер собранных новостей на диске (NEWS_SPOOL) — чтобы память не росла с окном сбора.
+
+При --weekly по большой папке все тексты за 7 дней держались в списке, а суммаризация
+склеивала их в ещё одну такую же строку. NewsSpool дописывает каждую новость в
+append-only файл (безымянный временный файл в DATA_DIR/spool — удаляется при закрытии и
+даже при падении процесса), а в памяти держит только смещения и длины (array, 12 байт на
+новость). SpoolView — последовательность новостей поверх буфера: len(), индексация и
+итерация читают тексты с диска по одному, поэтому дальнейшие шаги (фильтр повторов,
+проверка ссылок, склейка для запроса) работают с ней так же, как со списком.
+С окном по-прежнему растёт текст запроса к модели: одна строка на всё окно (или на
+раздел при SECTION_ROUTING) — она нужна целиком, чтобы отправить запрос.
+"""
+import tempfile
+import threading
+from array import array
+from collections.abc import Sequence
+
+from src.paths import DATA_DIR
+
+
+SPOOL_DIR = DATA_DIR / "spool"
+
+
+class NewsSpool:
+    def __init__(self, directory=None):
+        directory = directory or SPOOL_DIR
+        directory.mkdir(parents=True, exist_ok=True)
+        self._file = tempfile.TemporaryFile(dir=directory)
+        self._offsets = array("Q")
+        self._lengths = array("I")
+        self._end = 0
+        # Суммаризация читает буфер из потоков (asyncio.to_thread) — seek + read под блокировкой
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def __len__(self):
+        return len(self._offsets)
+
+    @property
+    def size(self):
+        """Байт на диске."""
+        return self._end
+
+    def extend(self, items):
+        """Дописывает новости; возвращает SpoolView на добавленные."""
+        first = len(self._offsets)
+        with self._lock:
+            self._file.seek(self._end)
+            for item in items:
+                encoded = item.encode("utf-8")
+                self._offsets.append(self._end)
+                self._lengths.append(len(encoded))
+                self._file.write(encoded)
+                self._end += len(encoded)
+        return SpoolView(self, array("Q", range(first, len(self._offsets))))
+
+    def read(self, position):
+        with self._lock:
+            self._file.seek(self._offsets[position])
+            data = self._file.read(self._lengths[position])
+        return data.decode("utf-8")
+
+    def concat(self, views):
+        """Один SpoolView из нескольких (новости нескольких каналов для дайджеста)."""
+        positions = array("Q")
+        for view in views:
+            positions.extend(view.positions)
+        return SpoolView(self, positions)
+
+
+class SpoolView(Sequence):
+    """Последовательность новостей NewsSpool по номерам positions."""
+
+    def __init__(self, spool, positions):
+        self.spool = spool
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return SpoolView(self.spool, self.positions[index])
+        return self.spool.read(self.positions[index])
+
+    def __iter__(self):
+        for position in self.positions:
+            yield self.spool.read(position)
+
+    def take(self, indexes):
+        return SpoolView(self.spool, array("Q", (self.positions[i] for i in indexes)))
+
+
+def take(items, indexes):
+    """items[i] для i из indexes: для SpoolView — без чтения текстов с диска."""
+    if isinstance(items, SpoolView):
+        return items.take(indexes)
+    return [items[i] for i in indexes]
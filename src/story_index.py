@@ -0,0 +1,254 @@
+"""
+Векторный индекс собранных новостей и пунктов сводок (STORY_INDEX) — DATA_DIR/story_index.
+
+Между запусками у бота не было памяти: история, которая тянется несколько дней, каждый
+раз пересказывалась заново, а перепосты одного сообщения в разных каналах попадали в
+промпт по нескольку раз. Индекс хранит эмбеддинги:
+  vectors.f32 — матрица float32 (строка на новость/пункт), открывается через np.memmap,
+                поэтому поиск не загружает весь файл в память и не парсит его;
+  rows.json   — метаданные строк (день, тип, дайджест, ссылка) и их количество.
+
+Эмбеддинги локальные и детерминированные (hashing trick по основам слов и биграммам,
+без моделей и сетевых запросов): они ловят перепосты и почти дословные повторы, а не
+перефразирования. Добавление инкрементальное (файл растёт удвоением), старые строки
+удаляются по возрасту (STORY_INDEX_DAYS).
+
+numpy нужен только здесь; модуль импортируется лениво, когда STORY_INDEX включён.
+"""
+import json
+import os
+import re
+import zlib
+from datetime import date, timedelta
+
+import numpy as np
+
+from src.intraday import covered_items, message_ref
+from src.paths import DATA_DIR
+from src.spool import take
+
+
+STORY_INDEX_DIR = DATA_DIR / "story_index"
+EMBEDDING_DIM = 512
+SIMILARITY_BLOCK = 1024
+EMBED_FLUSH_FEATURES = 1 << 16
+STEM_LENGTH = 6
+KIND_ITEM = "item"
+KIND_BULLET = "bullet"
+
+_WORD_RE = re.compile(r"[a-zа-яё0-9]+")
+
+
+def _features(text):
+    """Основы слов (первые STEM_LENGTH букв) и их биграммы — без строки «Источник: ...»."""
+    words = [w[:STEM_LENGTH] for w in _WORD_RE.findall(text.rsplit("Источник:", 1)[0].lower()) if len(w) > 2]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def embed(texts, dim=EMBEDDING_DIM):
+    """
+    Матрица (len(texts), dim) float32 с L2-нормированными строками. Тексты читаются по
+    одному (SpoolView не загружается целиком), признаки сбрасываются в матрицу порциями.
+    """
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    rows, cols, signs = [], [], []
+
+    def flush():
+        np.add.at(vectors, (np.asarray(rows), np.asarray(cols)), np.asarray(signs, dtype=np.float32))
+        rows.clear()
+        cols.clear()
+        signs.clear()
+
+    for row, text in enumerate(texts):
+        for feature in _features(text):
+            # crc32, а не hash(): значения должны совпадать между запусками
+            h = zlib.crc32(feature.encode("utf-8"))
+            rows.append(row)
+            cols.append(h % dim)
+            signs.append(1.0 if h & 0x80000000 else -1.0)
+        if len(rows) >= EMBED_FLUSH_FEATURES:
+            flush()
+    if rows:
+        flush()
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class StoryIndex:
+    def __init__(self, directory=None, dim=EMBEDDING_DIM):
+        self.directory = directory or STORY_INDEX_DIR
+        self.dim = dim
+        self.vectors_path = self.directory / "vectors.f32"
+        self.rows_path = self.directory / "rows.json"
+        self.rows = self._load_rows()
+
+    def _load_rows(self):
+        try:
+            with open(self.rows_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return []
+        except Exception as e:
+            print(f"[WARN] Ошибка чтения {self.rows_path}: {e} — индекс начинается заново")
+            return []
+        if data.get("dim") != self.dim:
+            print(f"[WARN] Размерность индекса историй изменилась ({data.get('dim')} → {self.dim}) — индекс начинается заново")
+            return []
+        rows = data.get("rows", [])
+        # Векторы дописываются раньше метаданных: лишние строки в файле после сбоя игнорируются
+        capacity = self._capacity()
+        return rows[:capacity]
+
+    def _save_rows(self):
+        tmp_path = self.rows_path.with_name(self.rows_path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "rows": self.rows}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.rows_path)
+
+    def _capacity(self):
+        try:
+            return self.vectors_path.stat().st_size // (self.dim * 4)
+        except FileNotFoundError:
+            return 0
+
+    def _memmap(self, mode="r"):
+        return np.memmap(self.vectors_path, dtype=np.float32, mode=mode, shape=(self._capacity(), self.dim))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def vectors(self):
+        """Векторы всех строк (memmap, только чтение)."""
+        if not self.rows:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return self._memmap()[: len(self.rows)]
+
+    def add(self, vectors, rows):
+        """Дописывает векторы и их метаданные ({"day", "kind", "digest", "ref"})."""
+        if not len(rows):
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        count, needed = len(self.rows), len(self.rows) + len(rows)
+        capacity = self._capacity()
+        if needed > capacity:
+            capacity = max(needed, capacity * 2, 1024)
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(capacity * self.dim * 4)
+        matrix = self._memmap("r+")
+        matrix[count:needed] = vectors
+        matrix.flush()
+        del matrix
+        self.rows.extend(rows)
+        self._save_rows()
+
+    def mask(self, digest=None, before=None, kinds=None):
+        """Булева маска строк: дайджест, день раньше before (date), типы строк."""
+        before = before.isoformat() if isinstance(before, date) else before
+        return np.fromiter(
+            (
+                (digest is None or row["digest"] == digest)
+                and (before is None or row["day"] < before)
+                and (kinds is None or row["kind"] in kinds)
+                for row in self.rows
+            ),
+            dtype=bool,
+            count=len(self.rows),
+        )
+
+    def best_matches(self, queries, mask=None):
+        """Для каждого запроса — (наибольшее косинусное сходство, номер строки); -1, если строк нет."""
+        vectors = self.vectors()
+        ids = np.arange(len(self.rows))
+        if mask is not None:
+            vectors, ids = vectors[mask], ids[mask]
+        if not len(ids) or not len(queries):
+            return np.zeros(len(queries), dtype=np.float32), np.full(len(queries), -1)
+        scores = np.asarray(queries) @ np.asarray(vectors).T
+        best = scores.argmax(axis=1)
+        return scores[np.arange(len(queries)), best], ids[best]
+
+    def similar(self, text, top_k=5, digest=None):
+        """[(сходство, метаданные строки)] — ближайшие к тексту строки индекса."""
+        vectors = self.vectors()
+        if not len(vectors):
+            return []
+        ids = np.arange(len(self.rows))
+        if digest is not None:
+            mask = self.mask(digest=digest)
+            vectors, ids = vectors[mask], ids[mask]
+        scores = np.asarray(vectors) @ embed([text], self.dim)[0]
+        order = np.argsort(-scores)[:top_k]
+        return [(float(scores[i]), self.rows[ids[i]]) for i in order]
+
+    def prune(self, max_age_days, today=None):
+        """Удаляет строки старше max_age_days (файл векторов переписывается компактно)."""
+        cutoff = ((today or date.today()) - timedelta(days=max_age_days)).isoformat()
+        keep = np.fromiter((row["day"] >= cutoff for row in self.rows), dtype=bool, count=len(self.rows))
+        if keep.all():
+            return 0
+        kept_vectors = np.array(self.vectors()[keep])
+        tmp_path = self.vectors_path.with_name(self.vectors_path.name + ".tmp")
+        kept_vectors.tofile(tmp_path)
+        os.replace(tmp_path, self.vectors_path)
+        removed = len(self.rows) - len(kept_vectors)
+        self.rows = [row for row, flag in zip(self.rows, keep) if flag]
+        self._save_rows()
+        return removed
+
+
+def near_duplicates(vectors, threshold, block=SIMILARITY_BLOCK):
+    """
+    Номера строк, почти совпадающих с одной из предыдущих (первое вхождение остаётся).
+    Сходства считаются блоками по block строк — без матрицы n×n на всю неделю.
+    """
+    duplicates = set()
+    for start in range(0, len(vectors), block):
+        stop = min(start + block, len(vectors))
+        similarity = vectors[start:stop] @ vectors[:stop].T
+        rows = np.arange(start, stop)
+        similarity[np.arange(stop)[None, :] >= rows[:, None]] = -1.0
+        duplicates.update(rows[(similarity >= threshold).any(axis=1)].tolist())
+    return duplicates
+
+
+def filter_reported(digest_name, items, day, threshold, max_age_days, index=None):
+    """
+    Убирает из новостей дня почти дословные повторы — внутри дня и уже виденные в
+    прошлые дни (новости и пункты сводок дайджеста) — и добавляет оставшиеся в индекс.
+    Возвращает (оставшиеся новости, сколько убрано).
+    """
+    if not items:
+        return items, 0
+    index = StoryIndex() if index is None else index
+    vectors = embed(items, index.dim)
+    dropped = near_duplicates(vectors, threshold)
+    scores, _ = index.best_matches(vectors, index.mask(digest=digest_name, before=day))
+    dropped.update(np.nonzero(scores >= threshold)[0].tolist())
+    kept = [i for i in range(len(items)) if i not in dropped]
+
+    # Повторный запуск за тот же день не дублирует строки индекса
+    day_str = day.isoformat()
+    known = {row["ref"] for row in index.rows if row["digest"] == digest_name and row["day"] == day_str}
+    new_rows, new_ids = [], []
+    for i in kept:
+        ref = message_ref(items[i])
+        ref = f"{ref[0]}/{ref[1]}" if ref else None
+        if ref is None or ref not in known:
+            new_rows.append({"day": day_str, "kind": KIND_ITEM, "digest": digest_name, "ref": ref})
+            new_ids.append(i)
+    index.prune(max_age_days, today=day)
+    index.add(vectors[new_ids], new_rows)
+    return take(items, kept), len(dropped)
+
+
+def remember_summary(digest_name, day, summary_text, index=None):
+    """Добавляет пункты готовой сводки в индекс (для поиска и подавления повторов в следующие дни)."""
+    bullets = covered_items(summary_text)
+    if not bullets:
+        return
+    index = StoryIndex() if index is None else index
+    day_str = day.isoformat()
+    if any(row["kind"] == KIND_BULLET and row["digest"] == digest_name and row["day"] == day_str for row in index.rows):
+        return
+    rows = [{"day": day_str, "kind": KIND_BULLET, "digest": digest_name, "ref": None} for _ in bullets]
+    index.add(embed(bullets, index.dim), rows)
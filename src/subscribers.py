@@ -0,0 +1,249 @@
+"""
+Хранилище подписчиков.
+
+subscribers.json — список подписчиков (поддерживается ботом scripts/get_users.py).
+subscriber_state.json — служебное состояние по user_id (статус доставки, результаты проверок
+доступности и т.п.), чтобы не переписывать основной файл ради технических отметок.
+
+Статусы: active (по умолчанию), blocked, deactivated — бот заблокирован или аккаунт удалён;
+quarantined — несколько рассылок подряд закончились "chat not found". Неактивные пользователи
+остаются в subscribers.json, но не получают рассылку, пока снова не напишут боту.
+"""
+import json
+import os
+from datetime import datetime, timezone
+
+import config
+from src.delivery import OUTCOME_BLOCKED, OUTCOME_CHAT_NOT_FOUND, OUTCOME_DEACTIVATED, OUTCOME_OK
+from src.paths import DATA_DIR, resolve_data_path
+
+
+DEFAULT_SUBSCRIBERS_FILE = DATA_DIR / "subscribers.json"
+SUBSCRIBERS_FILE = resolve_data_path(getattr(config, "SUBSCRIBERS_FILE", DEFAULT_SUBSCRIBERS_FILE))
+SUBSCRIBER_STATE_FILE = DATA_DIR / "subscriber_state.json"
+
+STATUS_ACTIVE = "active"
+STATUS_BLOCKED = "blocked"
+STATUS_DEACTIVATED = "deactivated"
+STATUS_QUARANTINED = "quarantined"
+INACTIVE_STATUSES = {STATUS_BLOCKED, STATUS_DEACTIVATED, STATUS_QUARANTINED}
+
+
+def utc_now():
+    return datetime.now(timezone.utc)
+
+
+def to_iso(dt):
+    return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def parse_iso(value):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+    except (TypeError, ValueError):
+        return None
+
+
+def _write_json_atomic(path, data):
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def load_subscriber_records():
+    if not SUBSCRIBERS_FILE.exists():
+        return []
+    try:
+        with open(SUBSCRIBERS_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+            return data.get("subscribers", []) or []
+    except Exception as e:
+        print(f"[ERROR] Ошибка чтения {SUBSCRIBERS_FILE}: {e}")
+        return []
+
+
+def save_subscriber_records(records):
+    _write_json_atomic(SUBSCRIBERS_FILE, {"subscribers": records})
+
+
+def add_subscriber_records(new_records):
+    """
+    Добавляет в subscribers.json записи, user_id которых там ещё нет.
+    Файл перечитывается перед слиянием и пишется только если что-то добавлено.
+    Возвращает количество добавленных записей.
+    """
+    if not new_records:
+        return 0
+    records = load_subscriber_records()
+    known_ids = {sub["user_id"] for sub in records if "user_id" in sub}
+    added = 0
+    for record in new_records:
+        if record["user_id"] in known_ids:
+            continue
+        records.append(record)
+        known_ids.add(record["user_id"])
+        added += 1
+    if added:
+        save_subscriber_records(records)
+    return added
+
+
+def update_subscriber_records(patches):
+    """
+    Применяет patches {user_id: {поле: значение}} к свежепрочитанному subscribers.json
+    (чтобы не потерять подписчиков, добавленных ботом за время работы скрипта).
+    Файл пишется один раз и только если какая-то запись действительно изменилась.
+    Возвращает количество изменённых записей.
+    """
+    if not patches:
+        return 0
+    patches = {int(uid): fields for uid, fields in patches.items()}
+    records = load_subscriber_records()
+    changed = 0
+    for sub in records:
+        fields = patches.get(sub.get("user_id"))
+        if not fields:
+            continue
+        if any(sub.get(key) != value for key, value in fields.items()):
+            sub.update(fields)
+            changed += 1
+    if changed:
+        save_subscriber_records(records)
+    return changed
+
+
+def load_subscriber_ids():
+    return [item["user_id"] for item in load_subscriber_records() if "user_id" in item]
+
+
+def filter_debug_recipients(user_ids):
+    """В режиме отладки оставляет только DEBUG_USER_IDS."""
+    if not getattr(config, "DEBUG_MODE", False):
+        return list(user_ids)
+    debug_ids = getattr(config, "DEBUG_USER_IDS", [])
+    if isinstance(debug_ids, int):
+        debug_ids = [debug_ids]
+    debug_ids = set(debug_ids)
+    return [uid for uid in user_ids if uid in debug_ids]
+
+
+def load_subscriber_state():
+    if not SUBSCRIBER_STATE_FILE.exists():
+        return {}
+    try:
+        with open(SUBSCRIBER_STATE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f) or {}
+    except Exception as e:
+        print(f"[WARN] Ошибка чтения {SUBSCRIBER_STATE_FILE}: {e}")
+        return {}
+
+
+def save_subscriber_state(state):
+    try:
+        _write_json_atomic(SUBSCRIBER_STATE_FILE, state)
+    except Exception as e:
+        print(f"[ERROR] Ошибка записи {SUBSCRIBER_STATE_FILE}: {e}")
+
+
+def is_active(state, user_id):
+    entry = state.get(str(user_id)) or {}
+    return entry.get("status", STATUS_ACTIVE) not in INACTIVE_STATUSES
+
+
+def load_active_subscriber_ids(state=None):
+    """Подписчики из subscribers.json без заблокировавших/удалённых/карантинных."""
+    if state is None:
+        state = load_subscriber_state()
+    return [uid for uid in load_subscriber_ids() if is_active(state, uid)]
+
+
+def apply_delivery_outcome(state, outcome, quarantine_after=None):
+    """
+    Обновляет статус пользователя в state по результату доставки (src.delivery.DeliveryOutcome).
+    Возвращает True, если state изменился. Временные ошибки статус не меняют.
+    """
+    if quarantine_after is None:
+        quarantine_after = getattr(config, "CHAT_NOT_FOUND_QUARANTINE", 3)
+    key = str(outcome.user_id)
+    entry = state.get(key)
+
+    if outcome.outcome == OUTCOME_OK:
+        # Для успешных ничего не пишем, если сбрасывать нечего
+        if not entry or (entry.get("status", STATUS_ACTIVE) == STATUS_ACTIVE and not entry.get("not_found_count")):
+            return False
+        entry["status"] = STATUS_ACTIVE
+        entry.pop("not_found_count", None)
+        entry.pop("error", None)
+        entry["status_at"] = to_iso(utc_now())
+        return True
+
+    if outcome.outcome in (OUTCOME_BLOCKED, OUTCOME_DEACTIVATED):
+        status = STATUS_BLOCKED if outcome.outcome == OUTCOME_BLOCKED else STATUS_DEACTIVATED
+        entry = state.setdefault(key, {})
+        if entry.get("status") == status:
+            return False
+        entry["status"] = status
+        entry["error"] = outcome.error
+        entry["status_at"] = to_iso(utc_now())
+        return True
+
+    if outcome.outcome == OUTCOME_CHAT_NOT_FOUND:
+        entry = state.setdefault(key, {})
+        entry["not_found_count"] = int(entry.get("not_found_count", 0)) + 1
+        entry["error"] = outcome.error
+        if entry["not_found_count"] >= quarantine_after and entry.get("status") != STATUS_QUARANTINED:
+            entry["status"] = STATUS_QUARANTINED
+            entry["status_at"] = to_iso(utc_now())
+        return True
+
+    return False
+
+
+def save_delivery_outcomes(outcomes, quarantine_after=None):
+    """
+    Применяет исходы доставки к заново прочитанному subscriber_state.json и сохраняет его.
+    Рассылка идёт долго, а бот тем временем пишет в тот же файл (реактивация, /time), поэтому
+    файл перечитывается перед записью, а не перезаписывается снимком начала рассылки.
+    """
+    if not outcomes:
+        return
+    state = load_subscriber_state()
+    for outcome in outcomes:
+        apply_delivery_outcome(state, outcome, quarantine_after)
+    save_subscriber_state(state)
+
+
+def reactivate_subscriber(user_id):
+    """Снимает неактивный статус (пользователь снова написал боту). Возвращает True, если снят."""
+    state = load_subscriber_state()
+    entry = state.get(str(user_id))
+    if not entry or (entry.get("status", STATUS_ACTIVE) == STATUS_ACTIVE and not entry.get("not_found_count")):
+        return False
+    entry["status"] = STATUS_ACTIVE
+    entry.pop("not_found_count", None)
+    entry.pop("error", None)
+    entry["status_at"] = to_iso(utc_now())
+    save_subscriber_state(state)
+    return True
+
+
+def set_delivery_preference(user_id, delivery_time=None, tz=None):
+    """
+    Сохраняет предпочтительное время доставки ("HH:MM") и пояс подписчика
+    (для DELIVERY_MODE=queue). delivery_time=None — сбросить предпочтение.
+    """
+    state = load_subscriber_state()
+    entry = state.setdefault(str(user_id), {})
+    if delivery_time is None:
+        entry.pop("delivery_time", None)
+        entry.pop("tz", None)
+    else:
+        entry["delivery_time"] = delivery_time
+        if tz:
+            entry["tz"] = tz
+        else:
+            entry.pop("tz", None)
+    save_subscriber_state(state)
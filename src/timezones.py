@@ -0,0 +1,45 @@
+"""
+Часовые пояса: граница «дня» сводки (DIGEST_TIMEZONE) и предпочтения подписчиков.
+
+Принимаются имена IANA ("Europe/Moscow") и смещения ("+3", "UTC+03:00", "-5:30").
+"""
+import re
+from datetime import datetime, timedelta, timezone
+
+import config
+
+
+_OFFSET_RE = re.compile(r"^(?:UTC|GMT)?\s*([+-])(\d{1,2})(?::?(\d{2}))?$", re.IGNORECASE)
+
+
+def parse_timezone(value):
+    """tzinfo по строке; бросает ValueError на неизвестном поясе."""
+    value = (value or "").strip()
+    if not value or value.upper() in ("UTC", "GMT", "Z"):
+        return timezone.utc
+    match = _OFFSET_RE.match(value)
+    if match:
+        sign, hours, minutes = match.groups()
+        delta = timedelta(hours=int(hours), minutes=int(minutes or 0))
+        if delta > timedelta(hours=14):
+            raise ValueError(f"Слишком большое смещение: {value!r}")
+        return timezone(-delta if sign == "-" else delta)
+    try:
+        from zoneinfo import ZoneInfo
+
+        return ZoneInfo(value)
+    except Exception as e:
+        raise ValueError(f"Неизвестный часовой пояс: {value!r}") from e
+
+
+def digest_timezone():
+    try:
+        return parse_timezone(config.DIGEST_TIMEZONE)
+    except ValueError as e:
+        print(f"[WARN] DIGEST_TIMEZONE: {e} — используется UTC")
+        return timezone.utc
+
+
+def local_today():
+    """Сегодняшняя дата в поясе сводок."""
+    return datetime.now(digest_timezone()).date()
@@ -0,0 +1,145 @@
+"""
+Webhook-режим бота подписчиков: асинхронный HTTP-сервер (aiohttp) перед Application.
+
+- POST {path} — апдейт Telegram в JSON; при заданном secret_token проверяется заголовок
+  X-Telegram-Bot-Api-Secret-Token. Апдейт кладётся в application.update_queue и сразу
+  подтверждается, обработка идёт конкурентно (ApplicationBuilder.concurrent_updates).
+- GET /healthz — проверка живости и размер очереди.
+
+При остановке (SIGINT/SIGTERM) сервер ещё до DRAIN_GRACE_SECONDS остаётся поднятым:
+новые апдейты получают 503 (Telegram повторит доставку), а запросы, которые уже
+обрабатываются, успевают положить апдейт в очередь и ответить. Затем сервер закрывается,
+а Application.stop() дорабатывает принятые апдейты.
+
+Без webhook_url setWebhook не вызывается: так сервер можно проверить локально,
+отправляя записанные апдейты (см. scripts/replay_updates.py).
+"""
+import asyncio
+import hmac
+import logging
+import signal
+
+from aiohttp import web
+from telegram import Update
+
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+DRAIN_GRACE_SECONDS = 5.0
+DRAIN_POLL_SECONDS = 0.05
+
+
+def build_webhook_app(application, path, secret_token=None):
+    web_app = web.Application()
+    web_app["draining"] = False
+    web_app["inflight"] = 0
+
+    async def handle_update(request):
+        if web_app["draining"]:
+            return web.Response(status=503, text="shutting down")
+        web_app["inflight"] += 1
+        try:
+            return await _accept_update(request)
+        finally:
+            web_app["inflight"] -= 1
+
+    async def _accept_update(request):
+        if secret_token:
+            received = request.headers.get(SECRET_HEADER, "")
+            if not hmac.compare_digest(received, secret_token):
+                logger.warning(f"[WEBHOOK] Неверный secret token от {request.remote}")
+                return web.Response(status=403, text="forbidden")
+        try:
+            data = await request.json()
+        except Exception:
+            return web.Response(status=400, text="invalid json")
+        try:
+            update = Update.de_json(data, application.bot)
+        except Exception as e:
+            logger.warning(f"[WEBHOOK] Некорректный апдейт: {e}")
+            return web.Response(status=400, text="invalid update")
+        await application.update_queue.put(update)
+        return web.Response(text="ok")
+
+    async def health(request):
+        return web.json_response({
+            "status": "draining" if web_app["draining"] else "ok",
+            "queue": application.update_queue.qsize(),
+        })
+
+    web_app.router.add_post(path, handle_update)
+    web_app.router.add_get("/healthz", health)
+    return web_app
+
+
+def install_stop_signals(stop_event):
+    """SIGINT/SIGTERM устанавливают stop_event (для корректной остановки)."""
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            # Windows: остановка только по KeyboardInterrupt
+            pass
+
+
+async def start_webhook_server(application, listen, port, path, secret_token=None, webhook_url=None):
+    """
+    Регистрирует webhook (если задан webhook_url) и поднимает HTTP-сервер.
+    Application должен быть уже запущен. Возвращает runner для stop_webhook_server.
+    """
+    web_app = build_webhook_app(application, path, secret_token=secret_token)
+    runner = web.AppRunner(web_app)
+    await runner.setup()
+    site = web.TCPSite(runner, listen, port)
+
+    if webhook_url:
+        full_url = webhook_url.rstrip("/") + path
+        await application.bot.set_webhook(
+            url=full_url,
+            secret_token=secret_token or None,
+            allowed_updates=Update.ALL_TYPES,
+        )
+        logger.info(f"Webhook зарегистрирован: {full_url}")
+    else:
+        logger.info("WEBHOOK_URL не задан — setWebhook пропущен (локальный режим)")
+    await site.start()
+    logger.info(f"Бот запущен в режиме webhook на {listen}:{port}{path}")
+    return runner
+
+
+async def stop_webhook_server(runner, application, grace=DRAIN_GRACE_SECONDS):
+    """
+    Перестаёт принимать апдейты (новые получают 503) и ждёт до grace секунд, пока
+    завершатся уже начатые запросы; затем закрывает сервер. Принятые апдейты
+    дорабатывает Application.stop().
+    """
+    logger.info(
+        f"Остановка: перестаём принимать апдейты, дорабатываем очередь ({application.update_queue.qsize()})"
+    )
+    runner.app["draining"] = True
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + grace
+    while runner.app["inflight"] and loop.time() < deadline:
+        await asyncio.sleep(DRAIN_POLL_SECONDS)
+    if runner.app["inflight"]:
+        logger.warning(f"[WEBHOOK] Не дождались {runner.app['inflight']} запросов за {grace} с")
+    await runner.cleanup()
+
+
+async def run_webhook(application, listen, port, path, secret_token=None, webhook_url=None):
+    """Запускает Application и HTTP-сервер, работает до SIGINT/SIGTERM."""
+    stop_event = asyncio.Event()
+    install_stop_signals(stop_event)
+
+    async with application:
+        await application.start()
+        runner = await start_webhook_server(
+            application, listen, port, path, secret_token=secret_token, webhook_url=webhook_url
+        )
+        try:
+            await stop_event.wait()
+        finally:
+            await stop_webhook_server(runner, application)
+            await application.stop()